@@ -10,6 +10,31 @@
 base_dir = '/data/.dim'
 # base_dir = '/tmp/.dim'  # test
 
+# storage backend for records (meta, profiles, contacts, ...):
+#     'file'   - one file for each record in 'base_dir'
+#     'sqlite' - all records in 'base_dir/dim.db' (tests/migrate_storage.py)
+db_backend = 'file'
+
+# durability window: files written in it are committed (synced) together,
+# 0 for writing (and syncing) every file at once
+db_write_window = 0.5
+
+#
+#  Memory caches for database tables
+#
+#      name -> (max entries, max bytes, seconds to keep the empty records)
+#
+db_cache_limits = {
+    'default': (65536, 64 * 1024 * 1024, 300),
+    'meta': (262144, 256 * 1024 * 1024, 300),
+    'profile': (262144, 256 * 1024 * 1024, 60),
+    'private_key': (1024, 4 * 1024 * 1024, 300),
+    'device': (65536, 32 * 1024 * 1024, 300),
+}
+
+# seconds between checking the records changed by other processes
+db_changes_interval = 1.0
+
 #
 #  ANS reserved records
 #
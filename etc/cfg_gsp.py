@@ -22,6 +22,15 @@ station_name = 'Genesis Station (GZ)'
 station_host = '0.0.0.0'
 station_port = 9394
 
+# receive buffer size of each connection, adapted between min and max
+station_recv_buffer = (1024, 1024 * 1024)
+# max bytes waiting to be sent to each connection,
+# messages for the slow client will be stored as offline messages
+station_outbox_limit = 1024 * 1024
+# threads for pushing offline messages to guests who have just come in,
+# and max messages pushed to one guest before serving the next one
+station_receptionist = (4, 64)
+
 #
 #  All Station List
 #
@@ -41,6 +41,7 @@ from dimsdk import Station, CompletionHandler, MessengerDelegate
 from dimsdk.delegate import ConnectionDelegate
 
 from ..common import Log
+from ..common import FrameDecoder, ReceiveBuffer
 
 
 class Connection(threading.Thread, MessengerDelegate):
@@ -57,6 +58,7 @@ class Connection(threading.Thread, MessengerDelegate):
         self.__connected = False
         # socket
         self.__sock = None
+        self.__reader = ReceiveBuffer()
         self.__thread_heartbeat = None
         self.__last_time: int = 0
 
@@ -79,28 +81,25 @@ class Connection(threading.Thread, MessengerDelegate):
             self.__running.clear()
 
     def run(self):
-        data = b''
+        decoder = FrameDecoder(mars=False)
         while self.__running.isSet():
             if not self.__connected:
                 time.sleep(0.5)
                 continue
             # read all data
             try:
-                data += self.receive()
+                decoder.feed(self.receive())
             except IOError:
                 continue
             response = b''
             # split package(s)
-            pos = data.find(self.BOUNDARY)
-            while pos != -1:
-                pack = data[:pos]
-                res = self.receive_package(data=pack)
+            for protocol, pack in decoder:
+                if protocol != FrameDecoder.RAW:
+                    # heartbeats
+                    continue
+                res = self.receive_package(data=pack[:-len(self.BOUNDARY)])
                 if res is not None:
                     response += res + b'\n'
-                # next package
-                pos += len(self.BOUNDARY)
-                data = data[pos:]
-                pos = data.find(self.BOUNDARY)
             if len(response) > 0:
                 self.send(data=response)
 
@@ -164,10 +163,15 @@ class Connection(threading.Thread, MessengerDelegate):
         # send OK, record the current time
         self.__last_time = int(time.time())
 
-    def receive(self, buffer_size=1024) -> bytes:
+    @property
+    def reader(self) -> ReceiveBuffer:
+        """ receive buffer with counters """
+        return self.__reader
+
+    def receive(self) -> memoryview:
         data = None
         try:
-            data = self.__sock.recv(buffer_size)
+            data = self.__reader.receive(self.__sock)
         except IOError as error:
             self.error('failed to receive data: %s' % error)
             if not self.__connected:
@@ -176,7 +180,7 @@ class Connection(threading.Thread, MessengerDelegate):
             self.reconnect()
             # try again
             try:
-                data = self.__sock.recv(buffer_size)
+                data = self.__reader.receive(self.__sock)
             except IOError as error:
                 # failed
                 self.error('failed to receive data again: %s' % error)
@@ -36,11 +36,12 @@ from .utils import sha1
 from .utils import Log
 
 from .cpu import *
-from .network import Server
+from .network import Server, FrameDecoder, ReceiveBuffer, Outbox
 from .database import Storage, Database
 
 from .ans import AddressNameServer
 from .facebook import Facebook
+from .signature_cache import SignatureCache
 from .messenger import CommonMessenger
 
 
@@ -56,7 +57,7 @@ __all__ = [
     #
     #   Metwork
     #
-    'Server',
+    'Server', 'FrameDecoder', 'ReceiveBuffer', 'Outbox',
 
     #
     #   Database module
@@ -68,5 +69,5 @@ __all__ = [
     #   Common libs
     #
     'AddressNameServer',
-    'Facebook', 'CommonMessenger',
+    'Facebook', 'SignatureCache', 'CommonMessenger',
 ]
@@ -29,12 +29,18 @@
 
 """
 
+import os
+import threading
+
 from dimp import PrivateKey
-from dimp import ID, Meta, Profile
+from dimp import NetworkID, ID, Meta, Profile
 from dimp import Command
 from dimp import ReliableMessage
 
 from .storage import Storage
+from .cache import MemoryCache
+from .journal import ChangeJournal
+from .backend import create_backend
 from .private_table import PrivateKeyTable
 from .meta_table import MetaTable
 from .profile_table import ProfileTable, DeviceTable
@@ -42,6 +48,8 @@ from .user_table import UserTable
 from .group_table import GroupTable
 from .message_table import MessageTable
 from .ans_table import AddressNameTable
+from .search_index import SearchIndex
+from .account_catalog import AccountEntry, AccountCatalog
 
 
 __all__ = [
@@ -68,6 +76,9 @@ class Database:
         self.__message_table = MessageTable()
         # ANS
         self.__ans_table = AddressNameTable()
+        # search engine
+        self.__search_index = SearchIndex()
+        self.__account_catalog = AccountCatalog()
 
     @property
     def base_dir(self) -> str:
@@ -77,6 +88,51 @@ class Database:
     def base_dir(self, root: str):
         Storage.root = root
 
+    @property
+    def backend(self) -> str:
+        return str(Storage.backend)
+
+    @backend.setter
+    def backend(self, name: str):
+        """ Storage backend for records: 'file' or 'sqlite' """
+        Storage.set_backend(backend=create_backend(name=name, root=Storage.root))
+
+    @property
+    def write_window(self) -> float:
+        writer = Storage.writer
+        return 0 if writer is None else writer.window
+
+    @write_window.setter
+    def write_window(self, window: float):
+        """ Seconds to collect the writings for committing together, 0 for writing at once """
+        if window > 0:
+            Storage.start_writer(window=window)
+
+    @property
+    def cache_limits(self) -> dict:
+        return MemoryCache.limits
+
+    @cache_limits.setter
+    def cache_limits(self, limits: dict):
+        """ Limits for memory caches: name -> (max entries, max bytes, empty TTL) """
+        MemoryCache.configure(limits=limits)
+
+    @staticmethod
+    def watch_changes(interval: float=1.0) -> ChangeJournal:
+        """ Share changes of records with other processes on the same 'base_dir' """
+        journal = MemoryCache.journal
+        if journal is None:
+            journal = ChangeJournal(path=os.path.join(Storage.root, 'changes.log'),
+                                    callback=MemoryCache.invalidate, interval=interval)
+            MemoryCache.journal = journal
+            journal.start()
+        return journal
+
+    @staticmethod
+    def cache_stats() -> list:
+        """ Statistics of all memory caches """
+        return [str(item) for item in MemoryCache.caches()]
+
     """
         Private Key file for Users
         ~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -96,7 +152,13 @@ class Database:
         file path: '.dim/public/{ADDRESS}/meta.js'
     """
     def save_meta(self, meta: Meta, identifier: ID) -> bool:
-        return self.__meta_table.save_meta(meta=meta, identifier=identifier)
+        if not self.__meta_table.save_meta(meta=meta, identifier=identifier):
+            return False
+        if self.__account_catalog.entry(address=identifier.address) is None:
+            entry = self.__account_entry(identifier=identifier)
+            self.__account_catalog.update(entry=entry)
+            self.__index_account(entry=entry)
+        return True
 
     def meta(self, identifier: ID) -> Meta:
         return self.__meta_table.meta(identifier=identifier)
@@ -108,7 +170,17 @@ class Database:
         file path: '.dim/public/{ADDRESS}/profile.js'
     """
     def save_profile(self, profile: Profile) -> bool:
-        return self.__profile_table.save_profile(profile=profile)
+        if not self.__profile_table.save_profile(profile=profile):
+            return False
+        identifier = Storage.identifier(profile.identifier)
+        entry = self.__account_catalog.entry(address=identifier.address)
+        nickname = profile.name
+        if entry is not None and nickname is not None and nickname != entry.nickname:
+            entry = AccountEntry(identifier=entry.identifier, network=entry.network, number=entry.number,
+                                 path=entry.path, mtime=entry.mtime, nickname=nickname)
+            self.__account_catalog.update(entry=entry)
+            self.__index_account(entry=entry)
+        return True
 
     def profile(self, identifier: ID) -> Profile:
         return self.__profile_table.profile(identifier=identifier)
@@ -150,18 +222,7 @@ class Database:
         return self.__user_table.block_command(identifier=identifier)
 
     def is_blocked(self, receiver: ID, sender: ID, group: ID=None) -> bool:
-        cmd = self.block_command(identifier=receiver)
-        if cmd is None:
-            return False
-        array = cmd.get('list')
-        if array is None:
-            return False
-        if group is None:
-            # check for personal message
-            return sender in array
-        else:
-            # check for group message
-            return group in array
+        return self.__user_table.is_blocked(receiver=receiver, sender=sender, group=group)
 
     """
         Mute-list of User
@@ -176,18 +237,7 @@ class Database:
         return self.__user_table.mute_command(identifier=identifier)
 
     def is_muted(self, receiver: ID, sender: ID, group: ID=None) -> bool:
-        cmd = self.mute_command(identifier=receiver)
-        if cmd is None:
-            return False
-        array = cmd.get('list')
-        if array is None:
-            return False
-        if group is None:
-            # check for personal message
-            return sender in array
-        else:
-            # check for group message
-            return group in array
+        return self.__user_table.is_muted(receiver=receiver, sender=sender, group=group)
 
     """
         Device Tokens for APNS
@@ -227,28 +277,120 @@ class Database:
         Reliable message for Receivers
         ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-        file path: '.dim/public/{ADDRESS}/messages/*.msg'
+        file path: '.dim/public/{ADDRESS}/messages/*.log'
     """
     def store_message(self, msg: ReliableMessage) -> bool:
         return self.__message_table.store_message(msg=msg)
 
-    def load_message_batch(self, receiver: ID) -> dict:
-        return self.__message_table.load_message_batch(receiver=receiver)
+    def store_message_data(self, receiver: ID, data: bytes) -> bool:
+        return self.__message_table.store_message_data(receiver=receiver, data=data)
+
+    def iter_messages(self, receiver: ID, after: tuple=None, limit: int=0):
+        return self.__message_table.iter_messages(receiver=receiver, after=after, limit=limit)
+
+    def ack(self, receiver: ID, cursor: tuple) -> bool:
+        return self.__message_table.ack(receiver=receiver, cursor=cursor)
+
+    def load_message_batch(self, receiver: ID, limit: int=0) -> dict:
+        return self.__message_table.load_message_batch(receiver=receiver, limit=limit)
 
     def remove_message_batch(self, batch: dict, removed_count: int) -> bool:
         return self.__message_table.remove_message_batch(batch=batch, removed_count=removed_count)
 
+    def migrate_messages(self, receiver: ID) -> int:
+        return self.__message_table.migrate_messages(receiver=receiver)
+
+    def message_index_memory(self) -> int:
+        return self.__message_table.index_memory()
+
     """
         Search Engine
         ~~~~~~~~~~~~~
 
-        Search accounts by the 'Search Number'
+        Search accounts by the 'Search Number', ID name or nickname
     """
-    def search(self, keywords: list) -> dict:
-        return self.__meta_table.search(keywords=keywords)
-
-    def scan_ids(self):
-        return self.__meta_table.scan_ids()
+    def search(self, keywords: list, max_count: int=20) -> dict:
+        results = {}
+        for identifier in self.__search_index.search(keywords=keywords, max_count=max_count):
+            identifier = Storage.identifier(identifier)
+            meta = self.meta(identifier=identifier)
+            if meta is not None:
+                results[identifier] = meta
+        Storage.info('Got %d account(s) matched %s' % (len(results), keywords))
+        return results
+
+    def scan_ids(self) -> int:
+        """ Load accounts from the catalog to build the search index,
+            and reconcile them with the 'public' directory in background """
+        catalog = self.__account_catalog
+        count = catalog.load()
+        for entry in catalog.entries():
+            self.__index_account(entry=entry)
+        Storage.info('Search index built: %s' % self.__search_index)
+        threading.Thread(target=self.__reconcile_accounts, daemon=True).start()
+        return count
+
+    def __reconcile_accounts(self):
+        catalog = self.__account_catalog
+        mtimes = catalog.scan()
+        updated = 0
+        for address, mtime in mtimes.items():
+            entry = catalog.entry(address=address)
+            if entry is not None and abs(entry.mtime - mtime) < 0.001:
+                # not changed
+                continue
+            try:
+                entry = self.__load_account(address=address)
+            except Exception as error:
+                Storage.error('failed to load account: %s, %s' % (address, error))
+                continue
+            if entry is not None:
+                catalog.update(entry=entry, persist=False)
+                self.__index_account(entry=entry)
+                updated += 1
+        removed = 0
+        for entry in catalog.entries():
+            if entry.address not in mtimes:
+                # meta file removed
+                catalog.remove(address=entry.address)
+                self.__search_index.remove(identifier=entry.identifier)
+                removed += 1
+        if updated > 0 or removed > 0:
+            catalog.save()
+        Storage.info('Reconciled %d account(s) in %s, updated: %d, removed: %d'
+                     % (len(mtimes), os.path.join(Storage.root, 'public'), updated, removed))
+
+    def __load_account(self, address: str) -> AccountEntry:
+        filename = address
+        address = Storage.identifier(filename)
+        if address is None:
+            Storage.error('ID/address error: %s' % filename)
+            return None
+        meta = self.meta(identifier=address)
+        if meta is None:
+            Storage.error('meta error: %s' % address)
+            return None
+        # the ID contains 'username' now
+        identifier = meta.generate_identifier(network=address.type)
+        return self.__account_entry(identifier=identifier)
+
+    def __account_entry(self, identifier: ID) -> AccountEntry:
+        path = AccountCatalog.meta_path(address=identifier.address)
+        mtime = Storage.mtime(path=os.path.join(Storage.root, path))
+        if mtime is None:
+            mtime = 0
+        profile = self.profile(identifier=identifier)
+        nickname = None if profile is None else profile.name
+        return AccountEntry(identifier=identifier, network=identifier.type, number=identifier.number,
+                            path=path, mtime=mtime, nickname='' if nickname is None else nickname)
+
+    def __index_account(self, entry: AccountEntry):
+        network = NetworkID(entry.network)
+        if not network.is_person() and not network.is_robot():
+            # ignore
+            return
+        self.__search_index.update(identifier=entry.identifier, name=entry.name,
+                                   number='%010d' % entry.number, nickname=entry.nickname)
 
     """
         Address Name Service
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+import os
+import threading
+from typing import Optional
+
+from .storage import Storage
+
+
+class AccountEntry:
+
+    __slots__ = ('identifier', 'network', 'number', 'path', 'mtime', 'nickname')
+
+    def __init__(self, identifier: str, network: int, number: int, path: str, mtime: float, nickname: str=''):
+        super().__init__()
+        self.identifier = identifier
+        self.network = network
+        self.number = number
+        self.path = path
+        self.mtime = mtime
+        self.nickname = nickname
+
+    @property
+    def address(self) -> str:
+        return os.path.basename(os.path.dirname(self.path))
+
+    @property
+    def name(self) -> str:
+        pos = self.identifier.find('@')
+        return self.identifier[:pos] if pos > 0 else ''
+
+    @classmethod
+    def parse(cls, line: str):
+        fields = line.split('\t')
+        if len(fields) == 6:
+            return cls(identifier=fields[0], network=int(fields[1]), number=int(fields[2]),
+                       path=fields[3], mtime=float(fields[4]), nickname=fields[5])
+
+    def serialize(self) -> str:
+        nickname = self.nickname.replace('\t', ' ').replace('\n', ' ').replace('\r', ' ')
+        return '%s\t%d\t%d\t%s\t%.6f\t%s\n' % (self.identifier, self.network, self.number,
+                                              self.path, self.mtime, nickname)
+
+
+class AccountCatalog(Storage):
+    """
+        Account Catalog
+        ~~~~~~~~~~~~~~~
+
+        file path: '.dim/accounts.txt'
+
+        One line for each account, fields separated by TAB:
+
+            ID, network type, search number, meta path, meta mtime, nickname
+
+        The meta path is relative to the root ('public/{ADDRESS}/meta.js').
+        Updated accounts are appended to the end (the last line wins), and the
+        whole file will be rewritten after reconciled with the directory.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.__entries = {}  # address -> AccountEntry
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(self.root, 'accounts.txt')
+
+    @classmethod
+    def meta_path(cls, address: str) -> str:
+        return os.path.join('public', address, 'meta.js')
+
+    def entries(self) -> list:
+        with self.__lock:
+            return list(self.__entries.values())
+
+    def entry(self, address: str) -> Optional[AccountEntry]:
+        return self.__entries.get(address)
+
+    def load(self) -> int:
+        """ Load all entries in one read """
+        text = self.read_text(path=self.path)
+        if text is None:
+            return 0
+        entries = {}
+        for line in text.splitlines():
+            item = AccountEntry.parse(line)
+            if item is None:
+                # partially written
+                continue
+            entries[item.address] = item
+        with self.__lock:
+            self.__entries = entries
+        self.info('Loaded %d account(s) from %s' % (len(entries), self.path))
+        return len(entries)
+
+    def update(self, entry: AccountEntry, persist: bool=True) -> bool:
+        """ Update entry in memory, and append it to the catalog file if persist """
+        with self.__lock:
+            self.__entries[entry.address] = entry
+            if persist:
+                return self.append_text(text=entry.serialize(), path=self.path)
+            return True
+
+    def remove(self, address: str) -> Optional[AccountEntry]:
+        with self.__lock:
+            return self.__entries.pop(address, None)
+
+    def save(self) -> bool:
+        """ Rewrite the whole catalog """
+        path = self.path
+        with self.__lock:
+            text = ''.join([item.serialize() for item in self.__entries.values()])
+            if not self.write_text(text=text, path=path):
+                return False
+        self.info('Saved %d account(s) into %s' % (len(self.__entries), path))
+        return True
+
+    def scan(self) -> dict:
+        """ Get mtimes of all meta files in 'public' directory: address -> mtime """
+        # pending meta files
+        self.flush()
+        return self.mtimes(directory=os.path.join(self.root, 'public'), filename='meta.js')
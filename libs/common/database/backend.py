@@ -0,0 +1,399 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Storage Backends
+    ~~~~~~~~~~~~~~~~
+
+    Where the data files of Storage are kept:
+
+        FileBackend   - one file for each path (default)
+        SQLiteBackend - records (meta, profile, contacts, ...) in one database
+                        file, other paths (messages, logs) in files
+"""
+
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Optional
+
+
+def sync_directory(directory: str):
+    """ Make the renaming in directory durable """
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        # not supported (Windows)
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def write_temp(data: bytes, path: str, sync: bool) -> str:
+    """ Write data into a temporary file in the same directory of path """
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    fd, temp = tempfile.mkstemp(dir=directory, prefix='.%s.' % os.path.basename(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            file.write(data)
+            if sync:
+                file.flush()
+                os.fsync(file.fileno())
+    except Exception:
+        os.remove(temp)
+        raise
+    return temp
+
+
+def atomic_write(data: bytes, path: str, sync: bool=True) -> bool:
+    """ Write into a temporary file, then rename it to path,
+        so the file is either the old one or the new one after crashed """
+    temp = write_temp(data=data, path=path, sync=sync)
+    os.replace(temp, path)
+    if sync:
+        sync_directory(os.path.dirname(path))
+    return True
+
+
+def append_data(data: bytes, path: str) -> bool:
+    try:
+        file = open(path, 'ab')
+    except FileNotFoundError:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file = open(path, 'ab')
+    with file:
+        wrote = file.write(data)
+    return wrote == len(data)
+
+
+class FileBackend:
+    """ One file for each path """
+
+    def __str__(self) -> str:
+        return '<%s />' % self.__class__.__name__
+
+    def read(self, path: str) -> Optional[bytes]:
+        try:
+            with open(path, 'rb') as file:
+                return file.read()
+        except FileNotFoundError:
+            return None
+
+    def write(self, data: bytes, path: str) -> bool:
+        return atomic_write(data=data, path=path)
+
+    def write_batch(self, batch: dict):
+        """ Write files (path -> data) together: sync all temporary files, then rename them """
+        temps = []
+        for path, data in batch.items():
+            temps.append((write_temp(data=data, path=path, sync=True), path))
+        directories = set()
+        for temp, path in temps:
+            os.replace(temp, path)
+            directories.add(os.path.dirname(path))
+        for directory in directories:
+            sync_directory(directory)
+
+    def append(self, data: bytes, path: str) -> bool:
+        return append_data(data=data, path=path)
+
+    def sync(self, paths: set):
+        """ Sync appended files """
+        for path in paths:
+            try:
+                with open(path, 'ab') as file:
+                    os.fsync(file.fileno())
+            except OSError:
+                # removed
+                continue
+
+    def exists(self, path: str) -> bool:
+        return os.path.exists(path)
+
+    def remove(self, path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def mtime(self, path: str) -> Optional[float]:
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return None
+
+    def mtimes(self, directory: str, filename: str) -> dict:
+        """ Get mtimes of '{directory}/{name}/{filename}': name -> mtime """
+        results = {}
+        if not os.path.exists(directory):
+            return results
+        with os.scandir(directory) as it:
+            for item in it:
+                try:
+                    results[item.name] = os.stat(os.path.join(item.path, filename)).st_mtime
+                except OSError:
+                    # file not exists
+                    continue
+        return results
+
+    def paths(self, root: str) -> list:
+        """ All record paths under root """
+        results = []
+        for directory, _, files in os.walk(root):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                if SQLiteBackend.record_key(root=root, path=path) is not None:
+                    results.append(path)
+        return results
+
+    def close(self):
+        pass
+
+
+class SQLiteBackend:
+    """
+        file path: '.dim/dim.db'
+
+        Records are stored in one table, keyed by the path relative to root:
+
+            'public/{ADDRESS}/meta.js'
+            'public/{ADDRESS}/profile.js'
+            'private/{ADDRESS}/secret.js'
+            'protected/{ADDRESS}/device.js'
+            'protected/{ADDRESS}/contacts.txt'
+            'protected/{ADDRESS}/contacts_stored.js'
+            'protected/{ADDRESS}/block_stored.js'
+            'protected/{ADDRESS}/mute_stored.js'
+            'protected/{ADDRESS}/members.txt'
+            'ans.txt'
+
+        and indexed by (name, address). Other paths (offline messages, logs,
+        catalog) are kept in files. Every thread has its own connection, the
+        database runs in WAL mode, so the station, webserver and robots can
+        share it.
+    """
+
+    RECORDS = {
+        'public': ['meta.js', 'profile.js'],
+        'private': ['secret.js'],
+        'protected': ['device.js', 'contacts.txt', 'contacts_stored.js',
+                      'block_stored.js', 'mute_stored.js', 'members.txt'],
+    }
+
+    SCHEMA = [
+        'CREATE TABLE IF NOT EXISTS records ('
+        ' path TEXT PRIMARY KEY,'
+        ' name TEXT NOT NULL,'
+        ' address TEXT NOT NULL,'
+        ' data BLOB NOT NULL,'
+        ' mtime REAL NOT NULL)',
+        'CREATE INDEX IF NOT EXISTS records_name ON records (name, address)',
+    ]
+
+    def __init__(self, root: str, filename: str='dim.db'):
+        super().__init__()
+        self.root = root
+        self.path = os.path.join(root, filename)
+        self.files = FileBackend()
+        self.__local = threading.local()
+        self.__connections = []
+        self.__lock = threading.Lock()
+        if not os.path.exists(root):
+            os.makedirs(root, exist_ok=True)
+        db = self.__db()
+        with db:
+            for sql in self.SCHEMA:
+                db.execute(sql)
+
+    def __str__(self) -> str:
+        return '<%s: path=%s />' % (self.__class__.__name__, self.path)
+
+    @classmethod
+    def record_key(cls, root: str, path: str) -> Optional[tuple]:
+        """ Get (key, name, address) for record path, None for other paths """
+        if not path.startswith(os.path.join(root, '')):
+            return None
+        key = os.path.relpath(path, root).replace(os.sep, '/')
+        if key == 'ans.txt':
+            return key, key, ''
+        parts = key.split('/')
+        if len(parts) != 3:
+            return None
+        names = cls.RECORDS.get(parts[0])
+        if names is None or parts[2] not in names:
+            return None
+        return key, parts[2], parts[1]
+
+    def __key(self, path: str) -> Optional[tuple]:
+        return self.record_key(root=self.root, path=path)
+
+    def __db(self) -> sqlite3.Connection:
+        db = getattr(self.__local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.__local.db = db
+            with self.__lock:
+                self.__connections.append(db)
+        return db
+
+    def read(self, path: str) -> Optional[bytes]:
+        key = self.__key(path)
+        if key is None:
+            return self.files.read(path=path)
+        row = self.__db().execute('SELECT data FROM records WHERE path=?', (key[0],)).fetchone()
+        if row is not None:
+            return bytes(row[0])
+
+    def write(self, data: bytes, path: str) -> bool:
+        key = self.__key(path)
+        if key is None:
+            return self.files.write(data=data, path=path)
+        db = self.__db()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            db.execute('INSERT OR REPLACE INTO records (path, name, address, data, mtime) VALUES (?, ?, ?, ?, ?)',
+                       (key[0], key[1], key[2], data, time.time()))
+        return True
+
+    def write_batch(self, batch: dict):
+        """ Write records in one transaction """
+        files = {}
+        rows = []
+        now = time.time()
+        for path, data in batch.items():
+            key = self.__key(path)
+            if key is None:
+                files[path] = data
+            else:
+                rows.append((key[0], key[1], key[2], data, now))
+        if len(rows) > 0:
+            db = self.__db()
+            with db:
+                db.execute('BEGIN IMMEDIATE')
+                db.executemany('INSERT OR REPLACE INTO records (path, name, address, data, mtime)'
+                               ' VALUES (?, ?, ?, ?, ?)', rows)
+        if len(files) > 0:
+            self.files.write_batch(batch=files)
+
+    def append(self, data: bytes, path: str) -> bool:
+        key = self.__key(path)
+        if key is None:
+            return self.files.append(data=data, path=path)
+        db = self.__db()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            # concatenated BLOBs become TEXT
+            db.execute('INSERT INTO records (path, name, address, data, mtime) VALUES (?, ?, ?, ?, ?)'
+                       ' ON CONFLICT(path) DO UPDATE SET'
+                       ' data=CAST(data || excluded.data AS BLOB), mtime=excluded.mtime',
+                       (key[0], key[1], key[2], data, time.time()))
+        return True
+
+    def sync(self, paths: set):
+        self.files.sync(paths=set([item for item in paths if self.__key(item) is None]))
+
+    def exists(self, path: str) -> bool:
+        key = self.__key(path)
+        if key is None:
+            return self.files.exists(path=path)
+        row = self.__db().execute('SELECT 1 FROM records WHERE path=?', (key[0],)).fetchone()
+        return row is not None
+
+    def remove(self, path: str) -> bool:
+        key = self.__key(path)
+        if key is None:
+            return self.files.remove(path=path)
+        db = self.__db()
+        with db:
+            db.execute('BEGIN IMMEDIATE')
+            cursor = db.execute('DELETE FROM records WHERE path=?', (key[0],))
+        return cursor.rowcount > 0
+
+    def mtime(self, path: str) -> Optional[float]:
+        key = self.__key(path)
+        if key is None:
+            return self.files.mtime(path=path)
+        row = self.__db().execute('SELECT mtime FROM records WHERE path=?', (key[0],)).fetchone()
+        if row is not None:
+            return row[0]
+
+    def mtimes(self, directory: str, filename: str) -> dict:
+        key = self.__key(os.path.join(directory, '*', filename))
+        if key is None:
+            return self.files.mtimes(directory=directory, filename=filename)
+        cursor = self.__db().execute('SELECT address, mtime FROM records WHERE name=? AND path LIKE ?',
+                                     (filename, key[0].split('/')[0] + '/%'))
+        return dict(cursor.fetchall())
+
+    def paths(self, root: str) -> list:
+        cursor = self.__db().execute('SELECT path FROM records')
+        return [os.path.join(root, *row[0].split('/')) for row in cursor.fetchall()]
+
+    def close(self):
+        with self.__lock:
+            connections = self.__connections
+            self.__connections = []
+        for db in connections:
+            db.close()
+        self.__local = threading.local()
+
+
+def create_backend(name: str, root: str):
+    """ Create storage backend by name: 'file' or 'sqlite' """
+    if name == 'sqlite':
+        return SQLiteBackend(root=root)
+    elif name == 'file':
+        return FileBackend()
+    raise ValueError('unknown storage backend: %s' % name)
+
+
+def migrate(source, target, root: str) -> int:
+    """ Copy all records from source backend to target backend """
+    count = 0
+    batch = {}
+    for path in source.paths(root=root):
+        data = source.read(path=path)
+        if data is None:
+            continue
+        batch[path] = data
+        if len(batch) >= 1024:
+            target.write_batch(batch=batch)
+            count += len(batch)
+            batch = {}
+    if len(batch) > 0:
+        target.write_batch(batch=batch)
+        count += len(batch)
+    return count
@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+from .storage import Storage
+
+
+def memory_size(value, depth: int=4) -> int:
+    """ Bytes used by value (approximately), including items in dict/list """
+    size = sys.getsizeof(value)
+    if depth > 0:
+        if isinstance(value, dict):
+            for k, v in value.items():
+                size += memory_size(k, depth - 1) + memory_size(v, depth - 1)
+        elif isinstance(value, (list, tuple, set, frozenset)):
+            for item in value:
+                size += memory_size(item, depth - 1)
+    return size
+
+
+class MemoryCache:
+    """
+        Memory Cache
+        ~~~~~~~~~~~~
+
+        LRU cache for records loaded by a table, bounded by entries count and
+        bytes (estimated when stored); entries for records not found (empty)
+        expire after 'empty_ttl' seconds, so they will be loaded again.
+
+        All caches are registered by name, limits for each name are set by
+        MemoryCache.configure({name: (max entries, max bytes, empty TTL)}),
+        and the 'default' limits are used for the names not set.
+
+        After a record is written (on disk), changed(key) tells other processes
+        via the journal, which call MemoryCache.invalidate(name, key) to drop it.
+    """
+
+    MAX_ENTRIES = 65536
+    MAX_BYTES = 64 * 1024 * 1024
+    EMPTY_TTL = 300
+
+    # name -> (max entries, max bytes, empty ttl)
+    limits = {}
+
+    # change journal for other processes
+    journal = None
+
+    # all caches
+    __caches = weakref.WeakSet()
+    __caches_lock = threading.Lock()
+
+    def __init__(self, name: str):
+        super().__init__()
+        self.name = name
+        self.max_entries = self.MAX_ENTRIES
+        self.max_bytes = self.MAX_BYTES
+        self.empty_ttl = self.EMPTY_TTL
+        # key -> (value, size, expires)
+        self.__entries = OrderedDict()
+        self.__bytes = 0
+        self.__lock = threading.Lock()
+        # statistics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.__apply(limits=self.limits.get(name, self.limits.get('default')))
+        with self.__caches_lock:
+            self.__caches.add(self)
+
+    def __str__(self) -> str:
+        return '<%s: name=%s, entries=%d/%d, bytes=%d/%d, hits=%d, misses=%d, evictions=%d, expirations=%d />'\
+               % (self.__class__.__name__, self.name, len(self.__entries), self.max_entries,
+                  self.__bytes, self.max_bytes, self.hits, self.misses, self.evictions, self.expirations)
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    @property
+    def bytes(self) -> int:
+        return self.__bytes
+
+    def __apply(self, limits: tuple):
+        if limits is None:
+            return
+        self.max_entries, self.max_bytes, self.empty_ttl = limits
+        with self.__lock:
+            self.__purge()
+
+    @classmethod
+    def configure(cls, limits: dict):
+        """ Set limits for caches: name -> (max entries, max bytes, empty TTL) """
+        cls.limits = limits
+        with cls.__caches_lock:
+            caches = list(cls.__caches)
+        for item in caches:
+            item.__apply(limits=limits.get(item.name, limits.get('default')))
+
+    @classmethod
+    def caches(cls) -> list:
+        with cls.__caches_lock:
+            return sorted(cls.__caches, key=lambda item: item.name)
+
+    @classmethod
+    def invalidate(cls, name: str, key: str):
+        """ Drop the record changed by other process from caches with the name """
+        for item in cls.caches():
+            if item.name == name:
+                item.pop(key)
+
+    def changed(self, key) -> bool:
+        """ Record written, notify other processes """
+        journal = self.journal
+        if journal is not None:
+            Storage.defer(journal.record, self.name, str(key))
+        return True
+
+    def get(self, key, default=None):
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires = entry[2]
+            if expires is not None and expires < time.time():
+                self.__remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self.__entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, empty: bool=False):
+        """
+        Cache value for key
+
+        :param key:   record key
+        :param value: record value
+        :param empty: True for record not found, it will expire after 'empty_ttl' seconds
+        """
+        size = memory_size(value)
+        expires = time.time() + self.empty_ttl if empty else None
+        with self.__lock:
+            self.__remove(key)
+            self.__entries[key] = (value, size, expires)
+            self.__bytes += size
+            self.__purge()
+
+    def pop(self, key, default=None):
+        with self.__lock:
+            entry = self.__remove(key)
+            return default if entry is None else entry[0]
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+            self.__bytes = 0
+
+    def __remove(self, key):
+        entry = self.__entries.pop(key, None)
+        if entry is not None:
+            self.__bytes -= entry[1]
+        return entry
+
+    def __purge(self):
+        """ Evict least recently used entries while out of limits """
+        entries = self.__entries
+        while len(entries) > self.max_entries or (self.__bytes > self.max_bytes and len(entries) > 1):
+            _, entry = entries.popitem(last=False)
+            self.__bytes -= entry[1]
+            self.evictions += 1
@@ -28,6 +28,7 @@ import os
 from dimp import ID
 
 from .storage import Storage
+from .cache import MemoryCache
 
 
 class GroupTable(Storage):
@@ -35,7 +36,7 @@ class GroupTable(Storage):
     def __init__(self):
         super().__init__()
         # memory caches
-        self.__members: dict = {}
+        self.__members = MemoryCache(name='members')
 
     """
         Group members
@@ -50,7 +51,7 @@ class GroupTable(Storage):
         assert identifier.type.is_group(), 'group ID error: %s' % identifier
         if members is None or len(members) == 0:
             return False
-        self.__members[identifier] = members
+        self.__members.put(identifier, members)
         return True
 
     def __load_members(self, identifier: ID) -> list:
@@ -64,7 +65,7 @@ class GroupTable(Storage):
         path = self.__members_path(identifier=identifier)
         self.info('Saving members into: %s' % path)
         text = '\n'.join(members)
-        return self.write_text(text=text, path=path)
+        return self.write_text(text=text, path=path) and self.__members.changed(key=identifier)
 
     def members(self, group: ID) -> list:
         array = self.__members.get(group)
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Change Journal
+    ~~~~~~~~~~~~~~
+
+    Notify other processes sharing the same storage (station, webserver and
+    robots) to drop the stale records from their memory caches
+"""
+
+import os
+import threading
+import time
+from threading import Thread
+from typing import Callable, Optional
+
+from .storage import Storage
+
+
+class ChangeJournal(Thread):
+    """
+        file path: '.dim/changes.log'
+
+        A process appends a line 'PID<TAB>NAME<TAB>KEY' after updating a
+        record of the cache named NAME, and reads the lines appended by
+        others every 'interval' seconds, calling back with (name, key).
+
+        The file will be rotated to 'changes.log.1' when it's larger than
+        MAX_SIZE, readers finish the old file before opening the new one.
+    """
+
+    MAX_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, path: str, callback: Callable[[str, str], None], interval: float=1.0):
+        super().__init__()
+        self.daemon = True
+        self.path = path
+        self.callback = callback
+        self.interval = interval
+        self.pid = str(os.getpid())
+        self.__file = None
+        self.__pending = b''
+        self.__stopped = threading.Event()
+        # statistics
+        self.recorded = 0
+        self.received = 0
+
+    def __str__(self) -> str:
+        return '<%s: path=%s, recorded=%d, received=%d />'\
+               % (self.__class__.__name__, self.path, self.recorded, self.received)
+
+    def record(self, name: str, key: str) -> bool:
+        """ Append a change line, one write() with O_APPEND is atomic for small lines """
+        line = ('%s\t%s\t%s\n' % (self.pid, name, key)).encode('utf-8')
+        try:
+            directory = os.path.dirname(self.path)
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+                info = os.fstat(fd)
+            finally:
+                os.close(fd)
+            self.recorded += 1
+            if info.st_size > self.MAX_SIZE and self.__inode(self.path) == info.st_ino:
+                os.replace(self.path, self.path + '.1')
+            return True
+        except OSError as error:
+            Storage.error('failed to record change: %s, %s, %s' % (name, key, error))
+            return False
+
+    def stop(self):
+        self.__stopped.set()
+
+    def run(self):
+        # changes before starting are not needed, caches are empty now
+        self.__open(offset=None)
+        while not self.__stopped.is_set():
+            try:
+                self.__poll()
+            except Exception as error:
+                Storage.error('failed to read changes: %s, %s' % (self.path, error))
+            time.sleep(self.interval)
+        if self.__file is not None:
+            self.__file.close()
+
+    @staticmethod
+    def __inode(path: str) -> Optional[int]:
+        try:
+            return os.stat(path).st_ino
+        except OSError:
+            return None
+
+    def __open(self, offset: Optional[int]):
+        try:
+            self.__file = open(self.path, 'rb')
+        except OSError:
+            self.__file = None
+            return
+        if offset is None:
+            self.__file.seek(0, os.SEEK_END)
+        else:
+            self.__file.seek(offset)
+        self.__pending = b''
+
+    def __poll(self):
+        if self.__file is None:
+            self.__open(offset=0)
+            if self.__file is None:
+                # not created yet
+                return
+        self.__read()
+        if self.__inode(self.path) != os.fstat(self.__file.fileno()).st_ino:
+            # rotated, finish the old file then open the new one
+            self.__read()
+            self.__file.close()
+            self.__open(offset=0)
+            if self.__file is not None:
+                self.__read()
+
+    def __read(self):
+        data = self.__file.read()
+        if not data:
+            return
+        data = self.__pending + data
+        lines = data.split(b'\n')
+        # partially written
+        self.__pending = lines.pop()
+        pid = self.pid.encode('utf-8')
+        for line in lines:
+            fields = line.split(b'\t')
+            if len(fields) != 3 or fields[0] == pid:
+                continue
+            self.received += 1
+            self.callback(fields[1].decode('utf-8'), fields[2].decode('utf-8'))
@@ -25,136 +25,475 @@
 
 import json
 import os
-import time
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
 
 from dimp import ID
 from dimp import ReliableMessage
 
 from .storage import Storage
+from .signature_index import SignatureIndex
+
+
+def message_signature(line: bytes) -> Optional[bytes]:
+    """ Get signature from a stored message line without decoding JSON """
+    start = line.find(b'"signature": "')
+    if start < 0:
+        return None
+    start += 14
+    end = line.find(b'"', start)
+    if end > start:
+        return line[start:end]
+
+
+class MessageInbox:
+    """
+        Message Inbox
+        ~~~~~~~~~~~~~
+
+        Append-only segment files for one receiver, and the read position:
+
+            '{ADDRESS}/messages/0000000001.log' - messages, one JSON per line
+            '{ADDRESS}/messages/position.js'    - {"segment": 1, "offset": 0}
+
+        A segment file will be removed after all messages in it were read,
+        signatures of the unread messages are indexed in memory for checking
+        duplicated messages, the index will be built when first used.
+    """
+
+    def __init__(self, directory: str):
+        super().__init__()
+        self.directory = directory
+        self.lock = threading.RLock()
+        # segment numbers (sorted)
+        self.segments = []
+        # messages count in the last segment
+        self.tail_count = 0
+        # read position in the first segment
+        self.offset = 0
+        # signatures of unread messages
+        self.index: SignatureIndex = None
+        # segment files scanned and legacy files imported
+        self.loaded = False
+        # removed from memory cache, get it again
+        self.closed = False
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, '%010d.log' % segment)
+
+    @property
+    def position_path(self) -> str:
+        return os.path.join(self.directory, 'position.js')
+
+    def read_lines(self, segment: int, offset: int) -> list:
+        """ Read complete message lines from segment file """
+        lines = []
+        path = self.segment_path(segment)
+        if not os.path.exists(path):
+            return lines
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            for line in file:
+                if not line.endswith(b'\n'):
+                    # partially written
+                    break
+                lines.append(line)
+        return lines
+
+    def search_signature(self, signature: bytes, segment: int) -> bool:
+        """ Search signature in unread messages of the segment file """
+        needle = b'"signature": "' + signature + b'"'
+        path = self.segment_path(segment)
+        if not os.path.exists(path):
+            return False
+        with open(path, 'rb') as file:
+            if len(self.segments) > 0 and segment == self.segments[0]:
+                file.seek(self.offset)
+            return needle in file.read()
+
+    def read_range(self, segment: int, start: int, end: int) -> list:
+        """ Read message lines between offsets in segment file """
+        path = self.segment_path(segment)
+        if not os.path.exists(path):
+            return []
+        with open(path, 'rb') as file:
+            file.seek(start)
+            return file.read(end - start).splitlines()
+
+    def unread_signatures(self):
+        offset = self.offset
+        for segment in self.segments:
+            lines = self.read_lines(segment=segment, offset=offset)
+            offset = 0
+            for line in lines:
+                signature = message_signature(line=line)
+                if signature is not None:
+                    yield segment, signature
 
 
 class MessageTable(Storage):
 
+    # max messages count in one segment file
+    SEGMENT_SIZE = 1024
+
+    # max bytes of signature indexes for all receivers, the indexes of the
+    # least recently used inboxes are dropped (rebuilt when used again)
+    MAX_INDEX_MEMORY = 64 * 1024 * 1024
+
+    # max inboxes in memory, the least recently used inboxes are closed
+    # (loaded again when used)
+    MAX_INBOXES = 4096
+
     def __init__(self):
         super().__init__()
-        # memory caches
-        # self.__caches: dict = {}
+        # memory caches (least recently used first)
+        self.__inboxes = OrderedDict()
+        self.__lock = threading.Lock()
 
     """
         Reliable message for Receivers
         ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
-        file path: '.dim/dkd/{ADDRESS}/messages/*.msg'
-        file path: '.dim/public/{ADDRESS}/messages/*.msg'
+        file path: '.dim/public/{ADDRESS}/messages/*.log'
     """
     def __directory(self, identifier: ID) -> str:
         return os.path.join(self.root, 'public', identifier.address, 'messages')
 
-    def __message_path(self, msg: ReliableMessage) -> str:
-        # message filename
-        timestamp = msg.envelope.time
-        filename = time.strftime("%Y%m%d_%H%M%S", time.localtime(timestamp))
-        filename = filename + '.msg'
-        # message directory
-        receiver = self.identifier(msg.envelope.receiver)
-        directory = self.__directory(receiver)
-        # message file path
-        return os.path.join(directory, filename)
+    def __inbox(self, receiver: ID) -> MessageInbox:
+        """ Get inbox from memory cache (not loaded yet), or create a new one """
+        with self.__lock:
+            inbox = self.__inboxes.get(receiver)
+            if inbox is not None:
+                self.__inboxes.move_to_end(receiver)
+                return inbox
+            inbox = MessageInbox(directory=self.__directory(receiver))
+            self.__inboxes[receiver] = inbox
+        self.__trim_inboxes(current=inbox)
+        return inbox
+
+    @contextmanager
+    def __opened(self, receiver: ID):
+        """ Get loaded inbox with its lock """
+        while True:
+            inbox = self.__inbox(receiver=receiver)
+            with inbox.lock:
+                if inbox.closed:
+                    # closed by another thread, get it again
+                    continue
+                # load it out of the table lock (importing legacy files takes
+                # time, and building index will trim other inboxes)
+                self.__load_inbox(inbox=inbox)
+                yield inbox
+                return
+
+    def __trim_inboxes(self, current: MessageInbox):
+        """ Close the least recently used inboxes, until in MAX_INBOXES """
+        with self.__lock:
+            count = len(self.__inboxes) - self.MAX_INBOXES
+            if count <= 0:
+                return
+            candidates = []
+            for receiver, inbox in self.__inboxes.items():
+                if len(candidates) >= count:
+                    break
+                if inbox is not current:
+                    candidates.append((receiver, inbox))
+        for receiver, inbox in candidates:
+            if not inbox.lock.acquire(blocking=False):
+                # in use
+                continue
+            try:
+                with self.__lock:
+                    if self.__inboxes.get(receiver) is inbox:
+                        self.__inboxes.pop(receiver)
+                inbox.closed = True
+                inbox.index = None
+            finally:
+                inbox.lock.release()
+
+    def __load_inbox(self, inbox: MessageInbox) -> int:
+        """ Load inbox (only once) with its lock, return count of legacy messages imported """
+        if inbox.loaded:
+            return 0
+        inbox.loaded = True
+        directory = inbox.directory
+        if not self.exists(path=directory):
+            return 0
+        # 1. scan segment files (only once)
+        files = os.listdir(directory)
+        inbox.segments = sorted([int(filename[:-4]) for filename in files if filename.endswith('.log')])
+        position = self.read_json(path=inbox.position_path)
+        if position is not None and len(inbox.segments) > 0 and position.get('segment') == inbox.segments[0]:
+            inbox.offset = position.get('offset', 0)
+        # 2. count messages in the last segment
+        if len(inbox.segments) > 0:
+            lines = inbox.read_lines(segment=inbox.segments[-1], offset=0)
+            inbox.tail_count = len(lines)
+        # 3. import messages from old version files ('*.msg')
+        return self.__import_legacy(inbox=inbox)
+
+    def __import_legacy(self, inbox: MessageInbox) -> int:
+        directory = inbox.directory
+        if not self.exists(path=directory):
+            return 0
+        total = 0
+        legacy = sorted([filename for filename in os.listdir(directory) if filename.endswith('.msg')])
+        for filename in legacy:
+            path = os.path.join(directory, filename)
+            count = self.__import_messages(inbox=inbox, path=path)
+            self.info('imported %d message(s) from %s' % (count, path))
+            self.remove(path=path)
+            total += count
+        return total
 
-    def __load_messages(self, path: str) -> list:
+    def __import_messages(self, inbox: MessageInbox, path: str) -> int:
+        count = 0
         data = self.read_text(path=path)
-        lines = data.splitlines()
-        self.info('read %d line(s) from %s' % (len(lines), path))
-        # messages = [ReliableMessage(json.loads(line)) for line in lines]
-        messages = []
-        for line in lines:
-            msg = line.strip()
-            if len(msg) == 0:
-                self.info('skip empty line')
+        if data is None:
+            return 0
+        for line in data.splitlines():
+            line = line.strip()
+            if len(line) == 0:
                 continue
             try:
-                msg = json.loads(msg)
-                msg = ReliableMessage(msg)
-                messages.append(msg)
+                msg = ReliableMessage(json.loads(line))
             except Exception as error:
-                self.info('message package error %s, %s' % (error, line))
-        return messages
+                self.error('message package error %s, %s' % (error, line))
+                continue
+            if self.__append(inbox=inbox, msg=msg):
+                count += 1
+        return count
 
-    def __message_exists(self, msg: ReliableMessage, path: str) -> bool:
-        if not self.exists(path=path):
-            return False
-        # check whether message duplicated
-        messages = self.__load_messages(path=path)
-        for item in messages:
-            if item.get('signature') == msg.get('signature'):
-                # only same messages will have same signature
-                return True
+    def __index(self, inbox: MessageInbox) -> SignatureIndex:
+        if inbox.index is None:
+            # build signature index from segment files
+            index = SignatureIndex(capacity=self.SEGMENT_SIZE)
+            for segment, signature in inbox.unread_signatures():
+                index.add(signature=signature, segment=segment)
+            inbox.index = index
+            self.info('signature index built: %s, %s' % (inbox.directory, index))
+            self.__trim_indexes(current=inbox)
+        return inbox.index
+
+    def __trim_indexes(self, current: MessageInbox):
+        """ Drop indexes of the least recently used inboxes, until in MAX_INDEX_MEMORY """
+        with self.__lock:
+            inboxes = [item for item in self.__inboxes.values() if item.index is not None]
+        total = sum([item.index.memory for item in inboxes])
+        for inbox in inboxes:
+            if total <= self.MAX_INDEX_MEMORY:
+                break
+            if inbox is current or not inbox.lock.acquire(blocking=False):
+                # in use
+                continue
+            try:
+                if inbox.index is not None:
+                    total -= inbox.index.memory
+                    inbox.index = None
+            finally:
+                inbox.lock.release()
+
+    def __exists(self, inbox: MessageInbox, signature: bytes) -> bool:
+        index = self.__index(inbox=inbox)
+        exists = index.contains(signature)
+        if exists is None:
+            # not sure, confirm from the segment files which may contain it
+            segments = index.segments(signature)
+            exists = any(inbox.search_signature(signature=signature, segment=item) for item in segments)
+        return exists
+
+    def __append(self, inbox: MessageInbox, msg: ReliableMessage) -> bool:
+        data = json.dumps(msg)
+        return self.__append_data(inbox=inbox, data=data.encode('utf-8'))
+
+    def __append_data(self, inbox: MessageInbox, data: bytes) -> bool:
+        signature = message_signature(line=data)
+        with inbox.lock:
+            index = self.__index(inbox=inbox)
+            if signature is not None and self.__exists(inbox=inbox, signature=signature):
+                self.error('message duplicated: %s, %s' % (inbox.directory, signature))
+                return False
+            # rotate segment file
+            if len(inbox.segments) == 0 or inbox.tail_count >= self.SEGMENT_SIZE:
+                if len(inbox.segments) == 0:
+                    inbox.segments.append(1)
+                else:
+                    inbox.segments.append(inbox.segments[-1] + 1)
+                inbox.tail_count = 0
+            path = inbox.segment_path(segment=inbox.segments[-1])
+            if not self.append_text(text=data.decode('utf-8') + '\n', path=path):
+                return False
+            inbox.tail_count += 1
+            if signature is not None:
+                index.add(signature=signature, segment=inbox.segments[-1])
+            return True
 
     def message_exists(self, msg: ReliableMessage) -> bool:
-        path = self.__message_path(msg=msg)
-        return self.__message_exists(msg=msg, path=path)
+        receiver = self.identifier(msg.envelope.receiver)
+        signature = msg.get('signature')
+        if signature is None:
+            return False
+        with self.__opened(receiver=receiver) as inbox:
+            return self.__exists(inbox=inbox, signature=signature.encode('utf-8'))
 
     def store_message(self, msg: ReliableMessage) -> bool:
-        path = self.__message_path(msg=msg)
-        if self.__message_exists(msg=msg, path=path):
-            self.error('message duplicated: %s' % msg)
-            return False
-        self.info('Appending message into: %s' % path)
-        # message data
-        data = json.dumps(msg) + '\n'
-        return self.append_text(text=data, path=path)
-
-    def load_message_batch(self, receiver: ID) -> dict:
-        # message directory
-        directory = self.__directory(receiver)
-        # get all files in messages directory and sort by filename
-        if self.exists(path=directory):
-            files = sorted(os.listdir(directory))
-        else:
-            files = []
-        for filename in files:
-            # read ONE .msg file for each receiver and remove the file immediately
-            if filename[-4:] == '.msg':
-                # load messages from file path
-                path = os.path.join(directory, filename)
-                messages = self.__load_messages(path=path)
-                self.info('got %d message(s) for %s' % (len(messages), receiver))
-                if len(messages) == 0:
-                    self.info('remove empty message file %s' % path)
-                    self.remove(path)
-                return {'ID': receiver, 'filename': filename, 'path': path, 'messages': messages}
+        receiver = self.identifier(msg.envelope.receiver)
+        with self.__opened(receiver=receiver) as inbox:
+            return self.__append(inbox=inbox, msg=msg)
+
+    def iter_messages(self, receiver: ID, after: tuple=None, limit: int=0):
+        """
+        Read unread messages lazily from segment files
+
+        :param receiver: message receiver
+        :param after:    cursor of the last message got, None for the first unread message
+        :param limit:    max messages count, 0 means no limit
+        :return: cursors (segment, offset) and messages
+        """
+        with self.__opened(receiver=receiver) as inbox:
+            if len(inbox.segments) == 0:
+                return
+            segments = list(inbox.segments)
+            position = (segments[0], inbox.offset)
+        if after is not None and tuple(after) > position:
+            position = tuple(after)
+        count = 0
+        for segment in segments:
+            if segment < position[0]:
+                continue
+            offset = position[1] if segment == position[0] else 0
+            path = inbox.segment_path(segment=segment)
+            try:
+                file = open(path, 'rb')
+            except FileNotFoundError:
+                # acknowledged already
+                continue
+            with file:
+                file.seek(offset)
+                for line in file:
+                    offset += len(line)
+                    if not line.endswith(b'\n'):
+                        # partially written
+                        break
+                    try:
+                        msg = ReliableMessage(json.loads(line))
+                    except Exception as error:
+                        self.info('message package error %s, %s' % (error, line))
+                        continue
+                    yield (segment, offset), msg
+                    count += 1
+                    if 0 < limit <= count:
+                        return
+
+    def ack(self, receiver: ID, cursor: tuple) -> bool:
+        """
+        Acknowledge messages before the cursor (included) by moving read position forward,
+        segment files will be removed after all messages in them acknowledged
+
+        :param receiver: message receiver
+        :param cursor:   cursor of the last message received
+        :return: False on cursor expired
+        """
+        segment, offset = cursor
+        with self.__opened(receiver=receiver) as inbox:
+            if len(inbox.segments) == 0 or (segment, offset) <= (inbox.segments[0], inbox.offset):
+                return False
+            # 1. remove segments before the cursor
+            while len(inbox.segments) > 0 and inbox.segments[0] < segment:
+                lines = inbox.read_lines(segment=inbox.segments[0], offset=inbox.offset)
+                self.__forget(inbox=inbox, lines=lines)
+                self.__drop_segment(inbox=inbox)
+            if len(inbox.segments) == 0 or inbox.segments[0] != segment:
+                return True
+            # 2. move read position in this segment
+            lines = inbox.read_range(segment=segment, start=inbox.offset, end=offset)
+            self.__forget(inbox=inbox, lines=lines)
+            inbox.offset = offset
+            path = inbox.segment_path(segment=segment)
+            if offset >= os.path.getsize(path):
+                self.__drop_segment(inbox=inbox)
+            else:
+                self.write_json(container={'segment': segment, 'offset': offset}, path=inbox.position_path)
+            return True
+
+    def store_message_data(self, receiver: ID, data: bytes) -> bool:
+        """ Store message encoded in JSON already """
+        with self.__opened(receiver=receiver) as inbox:
+            return self.__append_data(inbox=inbox, data=data)
+
+    def load_message_batch(self, receiver: ID, limit: int=0) -> Optional[dict]:
+        if limit <= 0:
+            limit = self.SEGMENT_SIZE
+        cursors = []
+        messages = []
+        for cursor, msg in self.iter_messages(receiver=receiver, limit=limit):
+            cursors.append(cursor)
+            messages.append(msg)
+        if len(messages) > 0:
+            self.info('got %d message(s) for %s' % (len(messages), receiver))
+            return {'ID': receiver, 'cursors': cursors, 'messages': messages}
 
     def remove_message_batch(self, batch: dict, removed_count: int) -> bool:
         if removed_count <= 0:
             self.info('message count to removed error: %d' % removed_count)
             return False
-        # 0. get message file path
-        path = batch.get('path')
-        if path is None:
-            receiver = batch.get('ID')
-            filename = batch.get('filename')
-            if receiver and filename:
-                # message directory
-                directory = self.__directory(receiver)
-                # message file path
-                path = os.path.join(directory, filename)
-        if not self.exists(path):
-            self.info('message file not exists: %s' % path)
+        receiver = self.identifier(batch.get('ID'))
+        cursors = batch.get('cursors')
+        if receiver is None or cursors is None or len(cursors) == 0:
+            self.error('message batch error: %s' % batch)
             return False
-        # 1. remove all message(s)
-        self.info('remove message file: %s' % path)
-        self.remove(path)
-        # 2. store the rest messages back
-        messages = batch.get('messages')
-        if messages is None:
+        removed_count = min(removed_count, len(cursors))
+        if not self.ack(receiver=receiver, cursor=cursors[removed_count - 1]):
+            self.error('message batch expired: %s, %s' % (receiver, cursors[removed_count - 1]))
             return False
-        total_count = len(messages)
-        if removed_count < total_count:
-            # remove message(s) partially
-            messages = messages[removed_count:]
-            for msg in messages:
-                # message data
-                data = json.dumps(msg) + '\n'
-                self.append_text(text=data, path=path)
-            self.info('the rest messages(%d) write back into file: %s' % path)
         return True
+
+    @staticmethod
+    def __forget(inbox: MessageInbox, lines: list):
+        """ Remove signatures of read messages from index """
+        if inbox.index is None:
+            return
+        for line in lines:
+            signature = message_signature(line=line)
+            if signature is not None:
+                inbox.index.forget(signature)
+
+    def __drop_segment(self, inbox: MessageInbox):
+        segment = inbox.segments.pop(0)
+        if inbox.index is not None:
+            inbox.index.drop(segment)
+        path = inbox.segment_path(segment=segment)
+        self.info('remove message file: %s' % path)
+        self.remove(path=path)
+        inbox.offset = 0
+        if len(inbox.segments) == 0:
+            # all messages read
+            inbox.tail_count = 0
+            inbox.index = None
+            self.remove(path=inbox.position_path)
+        else:
+            self.write_json(container={'segment': inbox.segments[0], 'offset': 0}, path=inbox.position_path)
+
+    def migrate_messages(self, receiver: ID) -> int:
+        """ Import messages from old version files ('.dim/public/{ADDRESS}/messages/*.msg') """
+        while True:
+            inbox = self.__inbox(receiver=receiver)
+            with inbox.lock:
+                if inbox.closed:
+                    continue
+                # old version files will be imported while loading
+                count = self.__load_inbox(inbox=inbox)
+                return count + self.__import_legacy(inbox=inbox)
+
+    def inbox_count(self) -> int:
+        """ Count of inboxes in memory """
+        with self.__lock:
+            return len(self.__inboxes)
+
+    def index_memory(self) -> int:
+        """ Bytes used by signature indexes of all receivers """
+        with self.__lock:
+            inboxes = list(self.__inboxes.values())
+        return sum([inbox.index.memory for inbox in inboxes if inbox.index is not None])
@@ -24,12 +24,12 @@
 # ==============================================================================
 
 import os
-import random
 from typing import Optional
 
 from dimp import ID, Meta
 
 from .storage import Storage
+from .cache import MemoryCache
 
 
 def save_freshman(identifier: ID) -> bool:
@@ -48,7 +48,7 @@ class MetaTable(Storage):
     def __init__(self):
         super().__init__()
         # memory caches
-        self.__caches: dict = {}
+        self.__caches = MemoryCache(name='meta')
         self.__empty_meta = {'desc': 'just to avoid loading non-exists file again'}
 
     """
@@ -63,7 +63,7 @@ class MetaTable(Storage):
 
     def __cache_meta(self, meta: Meta, identifier: ID) -> bool:
         if meta.match_identifier(identifier):
-            self.__caches[identifier] = meta
+            self.__caches.put(identifier, meta)
             return True
 
     def __load_meta(self, identifier: ID) -> Meta:
@@ -78,7 +78,10 @@ class MetaTable(Storage):
             # meta file already exists
             return True
         self.info('Saving meta into: %s' % path)
-        return self.write_json(container=meta, path=path) and save_freshman(identifier=identifier)
+        if not self.write_json(container=meta, path=path):
+            return False
+        self.__caches.changed(key=identifier)
+        return save_freshman(identifier=identifier)
 
     def save_meta(self, meta: Meta, identifier: ID) -> bool:
         if not self.__cache_meta(meta=meta, identifier=identifier):
@@ -98,75 +101,8 @@ class MetaTable(Storage):
         # 2. load from storage
         info = self.__load_meta(identifier=identifier)
         if info is None:
-            self.__caches[identifier] = self.__empty_meta
+            self.__caches.put(identifier, self.__empty_meta, empty=True)
             return None
         # 3. update memory cache
-        self.__caches[identifier] = info
+        self.__caches.put(identifier, info)
         return info
-
-    """
-        Search Engine
-        ~~~~~~~~~~~~~
-
-        Search accounts by the 'Search Number'
-    """
-
-    def search(self, keywords: list) -> dict:
-        results = {}
-        max_count = 20
-        array = self.scan_ids()
-        array = random.sample(array, len(array))
-        for identifier in array:
-            network = identifier.type
-            if not network.is_person() and not network.is_robot():
-                # ignore
-                continue
-            string = identifier.lower()
-            number = '%010d' % identifier.number
-            match = True
-            for kw in keywords:
-                if string.find(kw.lower()) < 0 and number.find(kw) < 0:
-                    # not match
-                    match = False
-                    break
-            if not match:
-                continue
-            # got it
-            meta = self.meta(identifier)
-            if meta:
-                results[identifier] = meta
-                # force to stop
-                max_count = max_count - 1
-                if max_count <= 0:
-                    break
-        self.info('Got %d account(s) matched %s' % (len(results), keywords))
-        return results
-
-    def scan_ids(self) -> list:
-        ids = []
-        directory = os.path.join(self.root, 'public')
-        # get all files in messages directory and sort by filename
-        files = os.listdir(directory)
-        for filename in files:
-            path = os.path.join(directory, filename, 'meta.js')
-            if not os.path.exists(path):
-                # self.info('meta file not exists: %s' % path)
-                continue
-            address = self.identifier(filename)
-            if address is None:
-                # self.error('ID/address error: %s' % filename)
-                continue
-            meta = self.meta(identifier=address)
-            if meta is None:
-                self.error('meta error: %s' % address)
-            else:
-                # self.info('loaded meta for %s from %s: %s' % (identifier, path, meta))
-                identifier = meta.generate_identifier(network=address.type)
-                # the ID contains 'username' now
-                if identifier != address:
-                    # switch cache key
-                    # self.__caches.pop(address)
-                    self.__cache_meta(meta=meta, identifier=identifier)
-                ids.append(identifier)
-        self.info('Scanned %d ID(s) from %s' % (len(ids), directory))
-        return ids
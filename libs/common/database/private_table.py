@@ -28,6 +28,7 @@ import os
 from dimp import ID, PrivateKey
 
 from .storage import Storage
+from .cache import MemoryCache
 
 
 class PrivateKeyTable(Storage):
@@ -35,7 +36,7 @@ class PrivateKeyTable(Storage):
     def __init__(self):
         super().__init__()
         # memory caches
-        self.__caches: dict = {}
+        self.__caches = MemoryCache(name='private_key')
 
     """
         Private Key file for Local Users
@@ -48,7 +49,7 @@ class PrivateKeyTable(Storage):
 
     def __cache_private_key(self, key: PrivateKey, identifier: ID) -> bool:
         assert key is not None and identifier.valid, 'private key error: %s, %s' % (identifier, key)
-        self.__caches[identifier] = key
+        self.__caches.put(identifier, key)
         return True
 
     def __load_private_key(self, identifier: ID) -> PrivateKey:
@@ -63,7 +64,7 @@ class PrivateKeyTable(Storage):
             # meta file already exists
             return True
         self.info('Saving private key into: %s' % path)
-        return self.write_json(container=key, path=path)
+        return self.write_json(container=key, path=path) and self.__caches.changed(key=identifier)
 
     def save_private_key(self, key: PrivateKey, identifier: ID) -> bool:
         if not self.__cache_private_key(key=key, identifier=identifier):
@@ -81,5 +82,5 @@ class PrivateKeyTable(Storage):
         info = self.__load_private_key(identifier=identifier)
         if info is not None:
             # 3. update memory cache
-            self.__caches[identifier] = info
+            self.__caches.put(identifier, info)
             return info
@@ -29,6 +29,7 @@ from typing import Optional
 from dimp import ID, Profile
 
 from .storage import Storage
+from .cache import MemoryCache
 
 
 class ProfileTable(Storage):
@@ -36,7 +37,7 @@ class ProfileTable(Storage):
     def __init__(self):
         super().__init__()
         # memory caches
-        self.__caches: dict = {}
+        self.__caches = MemoryCache(name='profile')
 
     """
         Profile for Entities (User/Group)
@@ -52,7 +53,7 @@ class ProfileTable(Storage):
         identifier = Storage.identifier(profile.identifier)
         assert identifier.valid, 'profile ID not valid: %s' % profile
         if profile.valid:
-            self.__caches[identifier] = profile
+            self.__caches.put(identifier, profile)
             return True
 
     def __load_profile(self, identifier: ID) -> Profile:
@@ -74,7 +75,7 @@ class ProfileTable(Storage):
         assert identifier.valid, 'profile ID not valid: %s' % profile
         path = self.__path(identifier=identifier)
         self.info('Saving profile into: %s' % path)
-        return self.write_json(container=profile, path=path)
+        return self.write_json(container=profile, path=path) and self.__caches.changed(key=identifier)
 
     def save_profile(self, profile: Profile) -> bool:
         if not self.__cache_profile(profile=profile):
@@ -94,8 +95,10 @@ class ProfileTable(Storage):
         info = self.__load_profile(identifier=identifier)
         if info is None:
             info = Profile.new(identifier=identifier)
+            self.__caches.put(identifier, info, empty=True)
+            return info
         # 3. update memory cache
-        self.__caches[identifier] = info
+        self.__caches.put(identifier, info)
         return info
 
 
@@ -104,7 +107,7 @@ class DeviceTable(Storage):
     def __init__(self):
         super().__init__()
         # memory caches
-        self.__caches: dict = {}
+        self.__caches = MemoryCache(name='device')
 
     """
         Device Tokens for APNS
@@ -117,7 +120,7 @@ class DeviceTable(Storage):
 
     def __cache_device(self, device: dict, identifier: ID) -> bool:
         assert identifier.valid, 'ID not valid: %s' % identifier
-        self.__caches[identifier] = device
+        self.__caches.put(identifier, device)
         return True
 
     def __load_device(self, identifier: ID) -> dict:
@@ -128,7 +131,7 @@ class DeviceTable(Storage):
     def __save_device(self, device: dict, identifier: ID) -> bool:
         path = self.__path(identifier=identifier)
         self.info('Saving device info into: %s' % path)
-        return self.write_json(container=device, path=path)
+        return self.write_json(container=device, path=path) and self.__caches.changed(key=identifier)
 
     def save_device_token(self, token: str, identifier: ID) -> bool:
         # get device info with ID
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+import random
+import threading
+from array import array
+from typing import Optional
+
+
+class SearchIndex:
+    """
+        Search Index
+        ~~~~~~~~~~~~
+
+        N-gram inverted index over the lowercase ID names, search numbers
+        (10 digits) and nicknames of accounts:
+
+            - each account is a document with 3 fields, numbered by the order
+              it was added, and indexed by all 1/2/3-grams of its fields,
+              and the longer grams of digits (for searching numbers);
+            - a keyword takes the documents with the rarest gram of
+              it as candidates, which are checked by substring matching from a
+              random position, until enough results got (the rarest postings
+              are intersected first when there are too many candidates);
+            - postings are append-only arrays of document numbers, the stale
+              grams left by updated fields are removed by the checking.
+
+        A keyword equals to an indexed ID matches that account only.
+    """
+
+    GRAMS = (1, 2, 3)
+    DIGIT_GRAMS = (4, 5)
+
+    CANDIDATES = 1024   # check candidates directly when not more than it
+    INTERSECTIONS = 3   # max postings to be intersected with the smallest one
+
+    def __init__(self):
+        super().__init__()
+        self.__ids = []        # document -> ID
+        self.__texts = []      # document -> 'name\nnumber\nnickname'
+        self.__documents = {}  # ID -> document
+        self.__postings = {}   # gram -> array of documents
+        self.__lock = threading.Lock()
+
+    def __str__(self) -> str:
+        return '<%s: accounts=%d, grams=%d, postings=%d />'\
+               % (self.__class__.__name__, len(self.__documents), len(self.__postings), self.postings)
+
+    def __len__(self) -> int:
+        return len(self.__documents)
+
+    @property
+    def postings(self) -> int:
+        """ Total entries in postings """
+        return sum([len(item) for item in self.__postings.values()])
+
+    @classmethod
+    def grams(cls, text: str) -> set:
+        results = set()
+        size = len(text)
+        for n in cls.GRAMS:
+            results.update([text[pos:pos+n] for pos in range(size - n + 1)])
+        for n in cls.DIGIT_GRAMS:
+            results.update([text[pos:pos+n] for pos in range(size - n + 1) if text[pos:pos+n].isdigit()])
+        return results
+
+    def update(self, identifier: str, name: str=None, number: str=None, nickname: str=None):
+        """
+        Add or update an account, fields with None value will not be changed
+
+        :param identifier: account ID
+        :param name:       ID name
+        :param number:     search number
+        :param nickname:   profile name
+        """
+        with self.__lock:
+            document = self.__documents.get(identifier)
+            if document is None:
+                document = len(self.__ids)
+                self.__ids.append(identifier)
+                self.__texts.append('\n\n')
+                self.__documents[identifier] = document
+            text = self.__texts[document]
+            old = text.split('\n')
+            fields = [old[0] if name is None else name.lower(),
+                      old[1] if number is None else number,
+                      old[2] if nickname is None else nickname.lower().replace('\n', ' ')]
+            if fields == old:
+                return
+            grams = set()
+            for item in fields:
+                grams.update(self.grams(text=item))
+            for item in old:
+                # indexed already
+                if len(item) > 0:
+                    grams.difference_update(self.grams(text=item))
+            postings = self.__postings
+            for gram in grams:
+                posting = postings.get(gram)
+                if posting is None:
+                    posting = array('I')
+                    postings[gram] = posting
+                posting.append(document)
+            self.__texts[document] = '\n'.join(fields)
+
+    def remove(self, identifier: str) -> bool:
+        """ Remove an account, its document will never match again """
+        with self.__lock:
+            document = self.__documents.pop(identifier, None)
+            if document is None:
+                return False
+            self.__texts[document] = ''
+            return True
+
+    def search(self, keywords: list, max_count: int=20) -> list:
+        """
+        Search accounts matched all keywords
+
+        :param keywords:  words in ID name, search number or nickname
+        :param max_count: max length of the result
+        :return: IDs
+        """
+        keywords = [item for item in keywords if len(item) > 0]
+        for kw in keywords:
+            document = self.__documents.get(kw)
+            if document is not None:
+                # exactly matched an ID
+                return [self.__ids[document]]
+        keywords = [item.lower() for item in keywords]
+        with self.__lock:
+            candidates = self.__candidates(keywords=keywords)
+            if candidates is None:
+                # no keyword can be looked up, check all accounts
+                candidates = range(len(self.__ids))
+            count = len(candidates)
+            if count == 0:
+                return []
+            # check candidates from a random position, until got enough results
+            results = []
+            texts = self.__texts
+            offset = random.randrange(count)
+            for pos in range(count):
+                document = candidates[(offset + pos) % count]
+                text = texts[document]
+                for kw in keywords:
+                    if kw not in text:
+                        break
+                else:
+                    identifier = self.__ids[document]
+                    if identifier not in results:
+                        results.append(identifier)
+                        if len(results) >= max_count:
+                            break
+            return results
+
+    def __candidates(self, keywords: list) -> Optional[list]:
+        """ Get documents in the smallest postings of grams in keywords """
+        postings = []
+        for kw in keywords:
+            n = min(len(kw), max(self.GRAMS))
+            grams = [kw[pos:pos+n] for pos in range(len(kw) - n + 1)]
+            for n in self.DIGIT_GRAMS:
+                grams.extend([kw[pos:pos+n] for pos in range(len(kw) - n + 1) if kw[pos:pos+n].isdigit()])
+            for gram in grams:
+                posting = self.__postings.get(gram)
+                if posting is None:
+                    # no account has this gram
+                    return []
+                postings.append(posting)
+        if len(postings) == 0:
+            return None
+        postings.sort(key=len)
+        candidates = postings[0]
+        # intersect with the next smallest postings while too many candidates
+        for posting in postings[1:self.INTERSECTIONS+1]:
+            if len(candidates) <= self.CANDIDATES:
+                break
+            candidates = sorted(set(candidates).intersection(posting))
+        return candidates
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+import hashlib
+import sys
+from collections import OrderedDict
+from typing import Optional
+
+
+class SignatureIndex:
+    """
+        Signature Index
+        ~~~~~~~~~~~~~~~
+
+        Bloom filters (one for each segment file) for signatures of unread
+        messages, with an exact LRU set for confirmation:
+
+            - found in the LRU set      : exists
+            - nothing evicted from LRU  : not exists
+            - no filter says yes        : not exists
+            - otherwise                 : unknown, check the segment files
+                                          whose filters say yes
+
+        Each filter has a fixed size for 'capacity' signatures (messages in
+        one segment file), it will be dropped with the segment file after all
+        messages in it read, so the false positives never grow with the unread
+        messages, and the memory for one receiver is bounded by:
+
+            segments * capacity * BITS_PER_ITEM / 8 bytes (4 KB per segment)
+            + MAX_ENTRIES signatures in the LRU set
+
+        The memory for all receivers is bounded by the message table (see
+        'MessageTable.MAX_INDEX_MEMORY').
+    """
+
+    # bits per signature, about 0.00003% false positives with 16 hashes,
+    # so a duplicate check reads a segment file by mistake only once in
+    # about 3,000 checks for 1,000 segments (1M unread messages)
+    BITS_PER_ITEM = 32
+    HASHES = 16
+
+    # max signatures in the exact LRU set
+    MAX_ENTRIES = 1024
+
+    def __init__(self, capacity: int):
+        super().__init__()
+        self.__size = max(1, capacity) * self.BITS_PER_ITEM
+        # segment => bits
+        self.__filters = {}
+        self.__count = 0
+        # signature => segment
+        self.__entries = OrderedDict()
+        self.__entries_size = 0
+        self.__evicted = 0
+
+    def __str__(self) -> str:
+        return '<%s: count=%d, segments=%d, entries=%d, evicted=%d, memory=%d />'\
+               % (self.__class__.__name__, self.__count, len(self.__filters),
+                  len(self.__entries), self.__evicted, self.memory)
+
+    def __len__(self) -> int:
+        return self.__count
+
+    @property
+    def memory(self) -> int:
+        """ bytes used by filters and the LRU set (approximately) """
+        size = sys.getsizeof(self.__filters) + sys.getsizeof(self.__entries) + self.__entries_size
+        for bits in self.__filters.values():
+            size += sys.getsizeof(bits)
+        return size
+
+    def __positions(self, signature: bytes) -> list:
+        size = self.__size
+        digest = hashlib.blake2b(signature, digest_size=self.HASHES * 4).digest()
+        return [int.from_bytes(digest[i:i+4], 'little') % size for i in range(0, len(digest), 4)]
+
+    def add(self, signature: bytes, segment: int):
+        bits = self.__filters.get(segment)
+        if bits is None:
+            bits = bytearray(self.__size >> 3)
+            self.__filters[segment] = bits
+        for pos in self.__positions(signature):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.__count += 1
+        # exact LRU set
+        if signature not in self.__entries:
+            self.__entries_size += sys.getsizeof(signature)
+        self.__entries[signature] = segment
+        self.__entries.move_to_end(signature)
+        while len(self.__entries) > self.MAX_ENTRIES:
+            item, _ = self.__entries.popitem(last=False)
+            self.__entries_size -= sys.getsizeof(item)
+            self.__evicted += 1
+
+    def forget(self, signature: bytes):
+        """ Remove signature of read message from the LRU set
+            (the filter will be dropped with its segment) """
+        if self.__entries.pop(signature, None) is not None:
+            self.__entries_size -= sys.getsizeof(signature)
+
+    def drop(self, segment: int):
+        """ Drop filter of the segment after all messages in it read """
+        if self.__filters.pop(segment, None) is None:
+            return
+        for signature in [key for key, value in self.__entries.items() if value == segment]:
+            self.forget(signature)
+        if len(self.__filters) == 0:
+            self.__count = 0
+            self.__evicted = 0
+
+    def contains(self, signature: bytes) -> Optional[bool]:
+        """
+        Check signature
+
+        :return: True/False, or None when it must be confirmed from the segments
+        """
+        if signature in self.__entries:
+            self.__entries.move_to_end(signature)
+            return True
+        if self.__evicted == 0 or len(self.segments(signature)) == 0:
+            return False
+
+    def segments(self, signature: bytes) -> list:
+        """ Get segments which may contain the signature """
+        positions = self.__positions(signature)
+        candidates = []
+        for segment, bits in self.__filters.items():
+            for pos in positions:
+                if bits[pos >> 3] & (1 << (pos & 7)) == 0:
+                    break
+            else:
+                candidates.append(segment)
+        return candidates
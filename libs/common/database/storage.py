@@ -23,13 +23,17 @@
 # SOFTWARE.
 # ==============================================================================
 
+import atexit
 import json
-import os
 import time
+from typing import Optional
 
 from dimp import ID
 from dimp import Barrack
 
+from .backend import FileBackend
+from .writer import StorageWriter
+
 
 def current_time() -> str:
     time_array = time.localtime()
@@ -40,16 +44,58 @@ class Storage:
 
     root = '/tmp/.dim'
 
+    # where the files are kept
+    backend = FileBackend()
+
+    # write-behind queue, None for writing at once
+    writer: StorageWriter = None
+
+    @classmethod
+    def set_backend(cls, backend):
+        """ Switch backend after pending files written """
+        writer = cls.writer
+        if writer is not None:
+            writer.flush()
+            writer.backend = backend
+        old = cls.backend
+        cls.backend = backend
+        old.close()
+
+    @classmethod
+    def start_writer(cls, window: float) -> StorageWriter:
+        """ Write files in background, committed every 'window' seconds """
+        writer = cls.writer
+        if writer is None:
+            writer = StorageWriter(window=window, backend=cls.backend)
+            cls.writer = writer
+            writer.start()
+            atexit.register(writer.stop)
+        return writer
+
+    @classmethod
+    def flush(cls):
+        """ Write all pending files """
+        writer = cls.writer
+        if writer is not None:
+            writer.flush()
+
     @classmethod
     def exists(cls, path: str) -> bool:
-        return os.path.exists(path)
+        writer = cls.writer
+        if writer is not None and writer.read(path=path) is not None:
+            return True
+        return cls.backend.exists(path=path)
 
     @classmethod
     def read_text(cls, path: str) -> str:
-        if cls.exists(path):
-            # reading
-            with open(path, 'r') as file:
-                return file.read()
+        writer = cls.writer
+        if writer is not None:
+            data = writer.read(path=path)
+            if data is not None:
+                return data.decode('utf-8')
+        data = cls.backend.read(path=path)
+        if data is not None:
+            return data.decode('utf-8')
 
     @classmethod
     def read_json(cls, path: str) -> dict:
@@ -59,14 +105,12 @@ class Storage:
 
     @classmethod
     def write_text(cls, text: str, path: str) -> bool:
-        directory = os.path.dirname(path)
-        # make sure the dirs exists
-        if not cls.exists(directory):
-            os.makedirs(directory)
-        # writing
-        with open(path, 'w') as file:
-            wrote = file.write(text)
-            return wrote == len(text)
+        data = text.encode('utf-8')
+        writer = cls.writer
+        if writer is None:
+            return cls.backend.write(data=data, path=path)
+        writer.write(data=data, path=path)
+        return True
 
     @classmethod
     def write_json(cls, container: dict, path: str) -> bool:
@@ -75,19 +119,37 @@ class Storage:
 
     @classmethod
     def append_text(cls, text: str, path: str) -> bool:
-        if not cls.exists(path=path):
-            # new file
-            return cls.write_text(text=text, path=path)
-        # appending
-        with open(path, 'a') as file:
-            wrote = file.write(text)
-            return wrote == len(text)
+        data = text.encode('utf-8')
+        writer = cls.writer
+        if writer is None:
+            return cls.backend.append(data=data, path=path)
+        return writer.append(data=data, path=path)
 
     @classmethod
     def remove(cls, path: str) -> bool:
-        if cls.exists(path=path):
-            os.remove(path)
-            return True
+        writer = cls.writer
+        pending = writer is not None and writer.read(path=path) is not None
+        if writer is not None:
+            writer.discard(path=path)
+        return cls.backend.remove(path=path) or pending
+
+    @classmethod
+    def mtime(cls, path: str) -> Optional[float]:
+        return cls.backend.mtime(path=path)
+
+    @classmethod
+    def mtimes(cls, directory: str, filename: str) -> dict:
+        """ Get mtimes of '{directory}/{name}/{filename}': name -> mtime """
+        return cls.backend.mtimes(directory=directory, filename=filename)
+
+    @classmethod
+    def defer(cls, callback, *args):
+        """ Call after pending files written """
+        writer = cls.writer
+        if writer is None:
+            callback(*args)
+        else:
+            writer.defer(callback, *args)
 
     #
     #  Entity factory
@@ -24,10 +24,12 @@
 # ==============================================================================
 
 import os
+from typing import Optional
 
 from dimp import ID, Command
 
 from .storage import Storage
+from .cache import MemoryCache
 
 
 class UserTable(Storage):
@@ -35,11 +37,38 @@ class UserTable(Storage):
     def __init__(self):
         super().__init__()
         # caches
-        self.__contacts = {}
+        self.__contacts = MemoryCache(name='contacts')
         # stored commands
-        self.__contacts_commands = {}
-        self.__block_commands = {}
-        self.__mute_commands = {}
+        self.__contacts_commands = MemoryCache(name='contacts_command')
+        self.__block_commands = MemoryCache(name='block_command')
+        self.__mute_commands = MemoryCache(name='mute_command')
+        # receiver -> frozenset, invalidated with the commands (same names)
+        self.__block_lists = MemoryCache(name='block_command')
+        self.__mute_lists = MemoryCache(name='mute_command')
+
+    @staticmethod
+    def __pure(identifier: str) -> Optional[ID]:
+        """ ID without terminal (terminal is hashed), None for invalid ID """
+        if not isinstance(identifier, str):
+            return None
+        if not isinstance(identifier, ID):
+            identifier = ID(identifier)
+        if '/' not in identifier:
+            return identifier
+        try:
+            name = identifier.name
+            return ID.new(address=identifier.address, name=name if name else None)
+        except ValueError:
+            # address check code error
+            return None
+
+    @classmethod
+    def __list_set(cls, cmd: Command) -> frozenset:
+        array = None if cmd is None else cmd.get('list')
+        if array is None:
+            return frozenset()
+        array = [cls.__pure(identifier=item) for item in array]
+        return frozenset([item for item in array if item is not None])
 
     """
         User contacts
@@ -54,7 +83,7 @@ class UserTable(Storage):
         assert identifier.type.is_user(), 'user ID error: %s' % identifier
         if contacts is None:
             return False
-        self.__contacts[identifier] = contacts
+        self.__contacts.put(identifier, contacts)
         return True
 
     def __load_contacts(self, identifier: ID) -> list:
@@ -68,7 +97,7 @@ class UserTable(Storage):
         path = self.__contacts_path(identifier=identifier)
         self.info('Saving contacts into: %s' % path)
         text = '\n'.join(contacts)
-        return self.write_text(text=text, path=path)
+        return self.write_text(text=text, path=path) and self.__contacts.changed(key=identifier)
 
     def contacts(self, user: ID) -> list:
         array = self.__contacts.get(user)
@@ -99,15 +128,15 @@ class UserTable(Storage):
             dictionary = self.read_json(path=path)
             if dictionary is not None:
                 cmd = Command(dictionary)
-                self.__contacts_commands[identifier] = cmd
+                self.__contacts_commands.put(identifier, cmd)
         return cmd
 
     def save_contacts_command(self, cmd: Command, sender: ID) -> bool:
         assert cmd is not None, 'contacts command cannot be empty'
-        self.__contacts_commands[sender] = cmd
+        self.__contacts_commands.put(sender, cmd)
         path = self.__contacts_command_path(identifier=sender)
         self.info('Saving contacts command into: %s' % path)
-        return self.write_json(container=cmd, path=path)
+        return self.write_json(container=cmd, path=path) and self.__contacts_commands.changed(key=sender)
 
     """
         Block Command
@@ -126,15 +155,34 @@ class UserTable(Storage):
             dictionary = self.read_json(path=path)
             if dictionary is not None:
                 cmd = Command(dictionary)
-                self.__block_commands[identifier] = cmd
+                self.__block_commands.put(identifier, cmd)
         return cmd
 
     def save_block_command(self, cmd: Command, sender: ID) -> bool:
         assert cmd is not None, 'block command cannot be empty'
-        self.__block_commands[sender] = cmd
+        self.__block_commands.put(sender, cmd)
+        self.__block_lists.put(sender, self.__list_set(cmd=cmd))
         path = self.__block_command_path(identifier=sender)
         self.info('Saving block command into: %s' % path)
-        return self.write_json(container=cmd, path=path)
+        return self.write_json(container=cmd, path=path) and self.__block_commands.changed(key=sender)
+
+    def block_list(self, identifier: ID) -> frozenset:
+        """ IDs blocked by this user """
+        array = self.__block_lists.get(identifier)
+        if array is None:
+            cmd = self.block_command(identifier=identifier)
+            array = self.__list_set(cmd=cmd)
+            self.__block_lists.put(identifier, array, empty=cmd is None)
+        return array
+
+    def is_blocked(self, receiver: ID, sender: ID, group: ID=None) -> bool:
+        array = self.block_list(identifier=receiver)
+        if group is None:
+            # check for personal message
+            return self.__pure(identifier=sender) in array
+        else:
+            # check for group message
+            return self.__pure(identifier=group) in array
 
     """
         Mute Command
@@ -153,12 +201,31 @@ class UserTable(Storage):
             dictionary = self.read_json(path=path)
             if dictionary is not None:
                 cmd = Command(dictionary)
-                self.__mute_commands[identifier] = cmd
+                self.__mute_commands.put(identifier, cmd)
         return cmd
 
     def save_mute_command(self, cmd: Command, sender: ID) -> bool:
         assert cmd is not None, 'mute command cannot be empty'
-        self.__mute_commands[sender] = cmd
+        self.__mute_commands.put(sender, cmd)
+        self.__mute_lists.put(sender, self.__list_set(cmd=cmd))
         path = self.__mute_command_path(identifier=sender)
         self.info('Saving mute command into: %s' % path)
-        return self.write_json(container=cmd, path=path)
+        return self.write_json(container=cmd, path=path) and self.__mute_commands.changed(key=sender)
+
+    def mute_list(self, identifier: ID) -> frozenset:
+        """ IDs muted by this user """
+        array = self.__mute_lists.get(identifier)
+        if array is None:
+            cmd = self.mute_command(identifier=identifier)
+            array = self.__list_set(cmd=cmd)
+            self.__mute_lists.put(identifier, array, empty=cmd is None)
+        return array
+
+    def is_muted(self, receiver: ID, sender: ID, group: ID=None) -> bool:
+        array = self.mute_list(identifier=receiver)
+        if group is None:
+            # check for personal message
+            return self.__pure(identifier=sender) in array
+        else:
+            # check for group message
+            return self.__pure(identifier=group) in array
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Storage Writer
+    ~~~~~~~~~~~~~~
+
+    Write-behind queue with group commit
+"""
+
+import threading
+import time
+from threading import Thread
+from typing import Optional
+
+from ..utils import Log
+from .backend import FileBackend
+
+
+class StorageWriter(Thread):
+    """
+        Write-behind queue for the whole file writings:
+
+            - the latest data for the same path replaces the pending one, so
+              a file updated many times in a window is written only once;
+            - every 'window' seconds, all pending files are written by the
+              backend together (group commit): for files, the temporary files
+              are synced then renamed to the paths, the directories are synced
+              once; for database, in one transaction;
+            - appending is done at once (the readers may open the file
+              directly), but it will be merged into the pending data if the
+              file is waiting to be written, and synced at next commit;
+            - callbacks deferred will be called after the next commit, for
+              telling other processes after the changes are on disk.
+
+        Reading a path waiting to be written gets the pending data.
+
+        If the commit failed (e.g. disk full), the batch is put back to the
+        queue (newer data for the same path wins), with the appended files
+        and callbacks; it will be retried after 'window * 2^failures' seconds,
+        up to MAX_BACKOFF.
+    """
+
+    MAX_BACKOFF = 30.0
+
+    def __init__(self, window: float=0.5, backend=None):
+        super().__init__()
+        self.daemon = True
+        self.window = window
+        self.backend = FileBackend() if backend is None else backend
+        # path -> data
+        self.__pending = {}
+        self.__committing = {}
+        # appended files to be synced
+        self.__dirty = set()
+        self.__callbacks = []
+        self.__lock = threading.Condition()
+        self.__commit_lock = threading.Lock()
+        self.__stopped = threading.Event()
+        # statistics
+        self.writes = 0
+        self.coalesced = 0
+        self.appends = 0
+        self.commits = 0
+        self.files = 0
+        self.commit_time = 0.0
+        self.errors = 0
+        self.failures = 0  # continuous
+
+    def __str__(self) -> str:
+        return '<%s: window=%.3f, writes=%d, coalesced=%d, appends=%d, commits=%d, files=%d, errors=%d, avg=%.3fms />'\
+               % (self.__class__.__name__, self.window, self.writes, self.coalesced, self.appends,
+                  self.commits, self.files, self.errors, self.commit_time * 1000 / max(self.commits, 1))
+
+    def info(self, msg: str):
+        Log.info('%s >\t%s' % (self.__class__.__name__, msg))
+
+    def error(self, msg: str):
+        Log.error('%s >\t%s' % (self.__class__.__name__, msg))
+
+    @property
+    def pending(self) -> int:
+        with self.__lock:
+            return len(self.__pending) + len(self.__committing)
+
+    def write(self, data: bytes, path: str):
+        with self.__lock:
+            if path in self.__pending:
+                self.coalesced += 1
+            self.__pending[path] = data
+            self.writes += 1
+
+    def append(self, data: bytes, path: str) -> bool:
+        with self.__lock:
+            while path in self.__committing:
+                self.__lock.wait()
+            self.appends += 1
+            pending = self.__pending.get(path)
+            if pending is not None:
+                self.__pending[path] = pending + data
+                return True
+            if self.backend.append(data=data, path=path):
+                self.__dirty.add(path)
+                return True
+            return False
+
+    def read(self, path: str) -> Optional[bytes]:
+        """ Get the data waiting to be written """
+        with self.__lock:
+            data = self.__pending.get(path)
+            if data is None:
+                data = self.__committing.get(path)
+            return data
+
+    def discard(self, path: str):
+        """ Cancel the pending writing for the file to be removed """
+        with self.__lock:
+            while path in self.__committing:
+                self.__lock.wait()
+            self.__pending.pop(path, None)
+            self.__dirty.discard(path)
+
+    def defer(self, callback, *args):
+        """ Call after the pending data written """
+        with self.__lock:
+            if len(self.__pending) > 0 or len(self.__committing) > 0:
+                self.__callbacks.append((callback, args))
+                return
+        callback(*args)
+
+    def flush(self) -> bool:
+        """ Commit all pending data now, return False on error (kept in queue) """
+        return self.__commit()
+
+    def stop(self):
+        self.__stopped.set()
+        if not self.flush():
+            self.error('stopped with %d file(s) not written' % self.pending)
+
+    def __delay(self) -> float:
+        if self.failures == 0:
+            return self.window
+        return min(self.window * (2 ** self.failures), self.MAX_BACKOFF)
+
+    def run(self):
+        while not self.__stopped.wait(self.__delay()):
+            self.__commit()
+
+    def __commit(self) -> bool:
+        with self.__commit_lock:
+            with self.__lock:
+                if len(self.__pending) == 0 and len(self.__dirty) == 0 and len(self.__callbacks) == 0:
+                    return True
+                batch = self.__pending
+                dirty = self.__dirty
+                callbacks = self.__callbacks
+                self.__pending = {}
+                self.__committing = batch
+                self.__dirty = set()
+                self.__callbacks = []
+            start = time.time()
+            try:
+                self.backend.write_batch(batch=batch)
+                self.backend.sync(paths=dirty)
+            except Exception as error:
+                with self.__lock:
+                    # put back, the data written while committing is newer
+                    batch.update(self.__pending)
+                    self.__pending = batch
+                    self.__dirty = dirty | self.__dirty
+                    self.__callbacks = callbacks + self.__callbacks
+                    self.__committing = {}
+                    self.__lock.notify_all()
+                self.errors += 1
+                self.failures += 1
+                self.error('failed to commit %d file(s), retry in %.3f seconds: %s'
+                           % (len(batch), self.__delay(), error))
+                return False
+            with self.__lock:
+                self.__committing = {}
+                self.__lock.notify_all()
+            self.failures = 0
+            self.commits += 1
+            self.files += len(batch)
+            self.commit_time += time.time() - start
+        for callback, args in callbacks:
+            callback(*args)
+        return True
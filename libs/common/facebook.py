@@ -39,6 +39,7 @@ from dimp import ID, Meta, Profile, User
 from dimsdk import Facebook as Barrack
 
 from .database import Database
+from .database.cache import MemoryCache
 
 
 class Facebook(Barrack):
@@ -57,24 +58,29 @@ class Facebook(Barrack):
         #     Monkey King:   'moki@4WDfe3zZ4T7opFSi3iDAKiuTnUHjxmXekk'
         self.__immortals = Immortals()
         self.__local_users = None
+        # display names, dropped with the profiles (same name)
+        self.__names = MemoryCache(name='profile')
+
+    def __display_name(self, identifier: ID) -> str:
+        name = self.__names.get(identifier)
+        if name is None:
+            profile = self.profile(identifier=identifier)
+            if profile is not None:
+                name = profile.name
+            if name is None or len(name) == 0:
+                name = identifier.name
+                if name is None:
+                    name = identifier
+            self.__names.put(identifier, name)
+        return name
 
     def nickname(self, identifier: ID) -> str:
         assert identifier.type.is_user(), 'user ID error: %s' % identifier
-        profile = self.profile(identifier=identifier)
-        if profile is not None:
-            name = profile.name
-            if name is not None and len(name) > 0:
-                return name
-        return identifier.name
+        return self.__display_name(identifier=identifier)
 
     def group_name(self, identifier: ID) -> str:
         assert identifier.type.is_group(), 'group ID error: %s' % identifier
-        profile = self.profile(identifier=identifier)
-        if profile is not None:
-            name = profile.name
-            if name is not None and len(name) > 0:
-                return name
-        return identifier.name
+        return self.__display_name(identifier=identifier)
 
     #
     #   super()
@@ -116,7 +122,10 @@ class Facebook(Barrack):
     def save_profile(self, profile: Profile, identifier: ID=None) -> bool:
         if not self.verify_profile(profile=profile, identifier=identifier):
             raise ValueError('profile error: %s, %s' % (identifier, profile))
-        return self.database.save_profile(profile=profile)
+        if not self.database.save_profile(profile=profile):
+            return False
+        self.__names.pop(profile.identifier)
+        return True
 
     def load_profile(self, identifier: ID) -> Optional[Profile]:
         # profile = super().load_profile(identifier=identifier)
@@ -37,9 +37,14 @@ from dimp import Message, SecureMessage, ReliableMessage
 from dimsdk import Messenger
 from dkd import InstantMessage, Content
 
+from .signature_cache import SignatureCache
+
 
 class CommonMessenger(Messenger):
 
+    # verified signatures, shared by all messengers (one for each connection)
+    signature_cache = SignatureCache()
+
     #
     #   Message
     #
@@ -76,3 +81,11 @@ class CommonMessenger(Messenger):
         except LookupError:
             # TODO: keep this message in waiting list for meta response
             return None
+
+    def verify_data_signature(self, data: bytes, signature: bytes, sender: str, msg: ReliableMessage) -> bool:
+        # retransmitted messages (receipt lost) and group messages relayed
+        # carry the same signature, verify them only once
+        verifier = super().verify_data_signature
+        return self.signature_cache.verify(sender=sender, data=data, signature=signature,
+                                           verifier=lambda: verifier(data=data, signature=signature,
+                                                                     sender=sender, msg=msg))
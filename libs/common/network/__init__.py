@@ -24,8 +24,14 @@
 # ==============================================================================
 
 from .server import Server
+from .decoder import FrameDecoder
+from .buffer import ReceiveBuffer
+from .outbox import Outbox
 
 
 __all__ = [
     'Server',
+    'FrameDecoder',
+    'ReceiveBuffer',
+    'Outbox',
 ]
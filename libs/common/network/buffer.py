@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Receive Buffer
+    ~~~~~~~~~~~~~~
+
+    Preallocated buffer for receiving data from socket
+"""
+
+import socket
+
+
+class ReceiveBuffer:
+    """
+        Receive Buffer
+        ~~~~~~~~~~~~~~
+
+        Data is received by 'recv_into()' a preallocated buffer, the buffer
+        grows (x2) when a read fills it up, and shrinks (/2) after several
+        reads which only used less than a quarter of it, always bounded
+        between 'min_size' and 'max_size'.
+
+        Counters 'calls' and 'received' record how many times the socket
+        was read and how many bytes were received.
+    """
+
+    # default limits, can be changed by configuration
+    MIN_SIZE = 1024
+    MAX_SIZE = 1024 * 1024
+    # how many small reads before shrinking the buffer
+    SHRINK_DELAY = 8
+
+    def __init__(self, min_size: int=None, max_size: int=None):
+        super().__init__()
+        if min_size is None:
+            min_size = self.MIN_SIZE
+        if max_size is None:
+            max_size = self.MAX_SIZE
+        assert 0 < min_size <= max_size, 'buffer size error: %d, %d' % (min_size, max_size)
+        self.__min_size = min_size
+        self.__max_size = max_size
+        self.__buffer = bytearray(min_size)
+        self.__view = memoryview(self.__buffer)
+        self.__small_reads = 0
+        # counters
+        self.calls = 0
+        self.received = 0
+
+    def __str__(self) -> str:
+        clazz = self.__class__.__name__
+        return '<%s size=%d calls=%d received=%d />' % (clazz, self.size, self.calls, self.received)
+
+    @property
+    def size(self) -> int:
+        return len(self.__buffer)
+
+    def buffer(self) -> memoryview:
+        """ Writable buffer for the next read """
+        return self.__view
+
+    def update(self, length: int) -> memoryview:
+        """
+        Data received into the buffer, count it and adapt the buffer size
+
+        :param length: received data length
+        :return: received data, valid until next read
+        """
+        data = self.__view[:length]
+        self.calls += 1
+        self.received += length
+        size = len(self.__buffer)
+        if length >= size:
+            # buffer full, grow it
+            self.__small_reads = 0
+            self.__resize(size << 1)
+        elif length < (size >> 2):
+            # too large for the recent reads
+            self.__small_reads += 1
+            if self.__small_reads >= self.SHRINK_DELAY:
+                self.__small_reads = 0
+                self.__resize(size >> 1)
+        else:
+            self.__small_reads = 0
+        return data
+
+    def __resize(self, size: int):
+        size = max(self.__min_size, min(self.__max_size, size))
+        if size != len(self.__buffer):
+            # NOTICE: the previous buffer is still referred by the data returned
+            self.__buffer = bytearray(size)
+            self.__view = memoryview(self.__buffer)
+
+    def receive(self, sock: socket.socket) -> memoryview:
+        """
+        Read data from socket
+
+        :param sock: connected socket
+        :return: received data (empty when connection closed), valid until next read
+        :raise IOError: socket error
+        """
+        length = sock.recv_into(self.__view)
+        return self.update(length)
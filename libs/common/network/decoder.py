@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Frame Decoder
+    ~~~~~~~~~~~~~
+
+    Incremental package splitter for received data
+"""
+
+import struct
+from typing import Optional
+
+
+# head_length, version, cmd, seq, body_length (4 bytes for each, big-endian)
+MARS_HEAD = struct.Struct('>IIIII')
+MIN_HEAD_LEN = MARS_HEAD.size
+MARS_VERSION = 200
+
+
+class FrameDecoder:
+    """
+        Frame Decoder
+        ~~~~~~~~~~~~~
+
+        Received data is appended to one buffer with a read cursor, packages
+        are cut out from the cursor without re-slicing the whole buffer, and
+        the consumed bytes are discarded only when they take up more than half
+        of the buffer, so each byte is copied a constant number of times.
+
+        protocols:
+            mars - Tencent mars package: head(20+ bytes) + body
+            raw  - JSON data with no wrap, ends with '\\n'
+            noop - heartbeat(s): '\\n'
+
+        If 'mars' is False, the data will be split by '\\n' only, any line
+        will be taken as a raw package (for client).
+    """
+
+    MARS = 'mars'
+    RAW = 'raw'
+    NOOP = 'noop'
+    UNKNOWN = 'unknown'
+
+    def __init__(self, mars: bool=True):
+        super().__init__()
+        self.__mars = mars
+        self.__buffer = bytearray()
+        self.__offset = 0
+        # position already searched for '\n' in the current partial line
+        self.__scanned = 0
+
+    def __len__(self) -> int:
+        """ length of the data not decoded yet """
+        return len(self.__buffer) - self.__offset
+
+    def feed(self, data: bytes):
+        """ Append received data """
+        self.__buffer += data
+
+    def clear(self):
+        self.__buffer.clear()
+        self.__offset = 0
+        self.__scanned = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> (str, bytes):
+        frame = self.next()
+        if frame is None:
+            raise StopIteration
+        return frame
+
+    def next(self) -> Optional[tuple]:
+        """
+        Cut out the next completed package
+
+        :return: (protocol, package), or None for partially data
+        """
+        buffer = self.__buffer
+        start = self.__offset
+        end = len(buffer)
+        if start >= end:
+            self.__compact()
+            return None
+        first = buffer[start]
+        # heartbeat(s)
+        if first == 0x0A:
+            while start < end and buffer[start] == 0x0A:
+                start += 1
+            return self.__cut(self.NOOP, start, start, b'\n')
+        # (Protocol A) Tencent mars?
+        if self.__mars and first != 0x7B:  # '{'
+            frame = self.__next_mars(start=start, end=end)
+            if frame is not False:
+                return frame
+        # (Protocol B) raw data with no wrap?
+        return self.__next_line(start=start, end=end)
+
+    def __next_mars(self, start: int, end: int):
+        buffer = self.__buffer
+        if end - start < MIN_HEAD_LEN:
+            if buffer[start] == 0:
+                # head length (4 bytes, big-endian) starts with zero,
+                # it seems be a partially mars head
+                return None
+            return False
+        head_len, version, _, _, body_len = MARS_HEAD.unpack_from(buffer, start)
+        if version != MARS_VERSION or head_len < MIN_HEAD_LEN:
+            # not mars
+            return False
+        pack_len = head_len + body_len
+        if start + pack_len > end:
+            # partially data, keep it for next time
+            return None
+        return self.__cut(self.MARS, start, start + pack_len)
+
+    def __next_line(self, start: int, end: int):
+        buffer = self.__buffer
+        if self.__mars and not buffer.startswith(b'{"', start):
+            if end - start < 2:
+                # partially data
+                return None
+            return self.__drop(start=start, end=end)
+        # check completion
+        pos = buffer.find(b'\n', max(start, self.__scanned), end)
+        if pos < 0:
+            # partially data, keep it for next time
+            self.__scanned = end
+            return None
+        if self.__mars and buffer.find(b'\0', start, pos) >= 0:
+            return self.__drop(start=start, end=end)
+        return self.__cut(self.RAW, start, pos + 1)
+
+    def __drop(self, start: int, end: int) -> tuple:
+        # TODO: split and unwrap data package(s)
+        return self.__cut(self.UNKNOWN, start, end)
+
+    def __cut(self, protocol: str, start: int, end: int, pack: bytes=None) -> tuple:
+        if pack is None:
+            view = memoryview(self.__buffer)
+            pack = bytes(view[start:end])
+            view.release()
+        self.__offset = end
+        self.__scanned = end
+        self.__compact()
+        return protocol, pack
+
+    def __compact(self):
+        buffer = self.__buffer
+        offset = self.__offset
+        if offset == 0:
+            return
+        if offset >= len(buffer):
+            buffer.clear()
+        elif offset > (len(buffer) >> 1):
+            del buffer[:offset]
+        else:
+            return
+        self.__scanned -= offset
+        self.__offset = 0
+
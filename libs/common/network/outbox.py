@@ -0,0 +1,215 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Outbox
+    ~~~~~~
+
+    Outgoing queue for each connection
+"""
+
+import threading
+import time
+from typing import Callable, Optional
+
+
+class Outbox:
+    """
+        Outbox
+        ~~~~~~
+
+        Data to be sent are appended to the queue from any thread, the first
+        thread which gets the flush lock joins all pending data and sends them
+        in one call, the others return immediately and leave their data to it.
+
+        When the pending data exceed the high-water mark (the client stops
+        reading), new data will be rejected, the caller should store the
+        message for the receiver; after the pending data fall below the
+        low-water mark, 'drained()' will be called for retrying them.
+
+        Data may be put with an item (e.g. the message body) for recovering,
+        if the sending failed after the caller returned, or the connection
+        closed before the data sent, the items will be given back by calling
+        'failed(items)', so the caller can store them for the receiver.
+    """
+
+    # default limit of pending data, can be changed by configuration
+    HIGH_WATER_MARK = 1024 * 1024
+    LOW_WATER_MARK = 256 * 1024
+
+    def __init__(self, sender: Callable[[bytes], bool], high_water_mark: int=None, low_water_mark: int=None,
+                 failed: Optional[Callable[[list], None]]=None, drained: Optional[Callable[[], None]]=None):
+        super().__init__()
+        if high_water_mark is None:
+            high_water_mark = self.HIGH_WATER_MARK
+        if low_water_mark is None:
+            low_water_mark = min(self.LOW_WATER_MARK, high_water_mark)
+        self.__sender = sender
+        self.__failed = failed
+        self.__drained = drained
+        self.__high_water_mark = high_water_mark
+        self.__low_water_mark = low_water_mark
+        self.__full = False  # data rejected, waiting for draining
+        self.__lock = threading.Lock()
+        self.__flush_lock = threading.Lock()
+        self.__frames = []
+        self.__items = []
+        self.__length = 0
+        self.__since = 0  # time of the oldest pending data
+        self.__paused = False
+        # counters
+        self.max_depth = 0
+        self.flushes = 0
+        self.sent = 0
+        self.rejected = 0
+        self.lost = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.__total_latency = 0.0
+
+    def __str__(self) -> str:
+        clazz = self.__class__.__name__
+        return '<%s depth=%d(max=%d) length=%d flushes=%d sent=%d rejected=%d lost=%d latency=%.3f(avg=%.3f, max=%.3f) />'\
+               % (clazz, self.depth, self.max_depth, self.length, self.flushes, self.sent, self.rejected, self.lost,
+                  self.last_latency, self.average_latency, self.max_latency)
+
+    @property
+    def depth(self) -> int:
+        """ count of pending data """
+        return len(self.__frames)
+
+    @property
+    def length(self) -> int:
+        """ bytes of pending data """
+        return self.__length
+
+    @property
+    def average_latency(self) -> float:
+        if self.flushes > 0:
+            return self.__total_latency / self.flushes
+        return 0.0
+
+    def put(self, data: bytes, force: bool=False, item=None) -> bool:
+        """
+        Append data to the queue
+
+        :param data:  data to be sent
+        :param force: ignore the high-water mark (for responses)
+        :param item:  given back by 'failed()' if the data not sent
+        :return: False when the queue is full
+        """
+        with self.__lock:
+            if not force and self.__length > 0 and self.__length + len(data) > self.__high_water_mark:
+                self.rejected += 1
+                self.__full = True
+                return False
+            if len(self.__frames) == 0:
+                self.__since = time.time()
+            self.__frames.append(data)
+            self.__items.append(item)
+            self.__length += len(data)
+            if len(self.__frames) > self.max_depth:
+                self.max_depth = len(self.__frames)
+            return True
+
+    def __pop(self) -> (list, list, float):
+        with self.__lock:
+            frames = self.__frames
+            items = self.__items
+            since = self.__since
+            self.__frames = []
+            self.__items = []
+            self.__length = 0
+            return frames, items, since
+
+    def __pending(self) -> bool:
+        with self.__lock:
+            return len(self.__frames) > 0 and not self.__paused
+
+    def flush(self, blocking: bool=True) -> bool:
+        """
+        Send all pending data
+
+        :param blocking: wait for the other thread which is flushing
+        :return: False on sending error
+        """
+        ok = True
+        while self.__pending():
+            if not self.__flush_lock.acquire(blocking=blocking):
+                # another thread is flushing, it will send our data too
+                return ok
+            try:
+                while not self.__paused:
+                    frames, items, since = self.__pop()
+                    if len(frames) == 0:
+                        break
+                    if self.__sender(b''.join(frames)):
+                        self.__count(frames=frames, since=since)
+                        self.__check_drained()
+                    else:
+                        ok = False
+                        self.__lose(items=items)
+            finally:
+                self.__flush_lock.release()
+            # check again for data which arrived before the lock released
+        return ok
+
+    def __check_drained(self):
+        with self.__lock:
+            if not self.__full or self.__length > self.__low_water_mark:
+                return
+            self.__full = False
+        if self.__drained is not None:
+            self.__drained()
+
+    def close(self) -> int:
+        """ Connection closed, give back the items of pending data """
+        frames, items, _ = self.__pop()
+        self.__lose(items=items)
+        return len(frames)
+
+    def __lose(self, items: list):
+        self.lost += len(items)
+        items = [item for item in items if item is not None]
+        if len(items) > 0 and self.__failed is not None:
+            self.__failed(items)
+
+    def __count(self, frames: list, since: float):
+        latency = time.time() - since
+        self.flushes += 1
+        self.sent += len(frames)
+        self.last_latency = latency
+        self.__total_latency += latency
+        if latency > self.max_latency:
+            self.max_latency = latency
+
+    def pause(self):
+        """ stop flushing (the transport buffer is full) """
+        self.__paused = True
+
+    def resume(self):
+        """ continue flushing """
+        self.__paused = False
+        self.flush(blocking=False)
@@ -38,6 +38,8 @@ from libs.common.network.server import Server
 from .messenger import ServerMessenger
 from .dispatcher import Dispatcher
 from .filter import Filter
+from .pusher import NotificationPusher
+from .relay import Relay
 
 
 __all__ = [
@@ -50,4 +52,5 @@ __all__ = [
     'Server',
     'ServerMessenger',
     'Dispatcher', 'Filter',
+    'NotificationPusher', 'Relay',
 ]
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Broadcast Engine
+    ~~~~~~~~~~~~~~~~
+
+    Deliver messages to everyone@everywhere
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
+
+from dimp import ID
+from dimp import ReliableMessage
+
+from ..common import Log
+
+
+class BroadcastTask:
+
+    def __init__(self, msg: ReliableMessage, origin: ID=None):
+        super().__init__()
+        self.msg = msg
+        self.origin = origin
+        self.data = json.dumps(msg).encode('utf-8')
+        self.users = 0
+        self.chunks = 0
+        self.pushed = 0
+        self.failed = 0
+        self.neighbors = 0
+        self.start_time = time.time()
+        self.end_time = 0.0
+        self.finished = threading.Event()
+        self.__remaining = 0
+        self.__lock = threading.Lock()
+
+    def __str__(self) -> str:
+        return '<%s: sender=%s, origin=%s, users=%d, chunks=%d, pushed=%d, failed=%d, neighbors=%d,' \
+               ' time=%.3f, rate=%.1f />'\
+               % (self.__class__.__name__, self.msg.envelope.sender, self.origin,
+                  self.users, self.chunks, self.pushed, self.failed, self.neighbors, self.elapsed, self.rate)
+
+    @property
+    def elapsed(self) -> float:
+        end_time = self.end_time if self.finished.is_set() else time.time()
+        return end_time - self.start_time
+
+    @property
+    def rate(self) -> float:
+        """ Pushed sessions per second """
+        elapsed = self.elapsed
+        return self.pushed / elapsed if elapsed > 0 else 0.0
+
+    def wait(self, timeout: float=None) -> bool:
+        return self.finished.wait(timeout=timeout)
+
+    def split(self, users: list, size: int) -> list:
+        chunks = [users[pos:pos+size] for pos in range(0, len(users), size)]
+        self.users = len(users)
+        self.chunks = len(chunks)
+        self.__remaining = len(chunks)
+        return chunks
+
+    def chunk_done(self, pushed: int, failed: int) -> bool:
+        """ Count the results of a chunk, return True when all chunks done """
+        with self.__lock:
+            self.pushed += pushed
+            self.failed += failed
+            self.__remaining -= 1
+            return self.__remaining <= 0
+
+
+class Broadcaster:
+    """
+        Messages to everyone@everywhere are delivered in background:
+
+            1. each station remembers the signatures of broadcast messages it has
+               seen, a message seen before is dropped, so the broadcast stops after
+               it went around the ring of stations;
+            2. the message is forwarded to the neighbor stations (except where it
+               came from) via the relay links, in the broadcast lane of each link;
+            3. the online users are split into chunks, and pushed by a small
+               pool of workers, separated from the group fan-out.
+
+        Point-to-point messages are never queued behind broadcasts: they are
+        delivered by the request handlers directly, and take precedence over
+        broadcasts in the relay frames.
+    """
+
+    CHUNK_SIZE = 256
+    WORKERS = 2
+    MAX_SIGNATURES = 10000
+
+    def __init__(self, dispatcher):
+        super().__init__()
+        self.dispatcher = dispatcher
+        self.__workers = ThreadPoolExecutor(max_workers=self.WORKERS)
+        self.__signatures = OrderedDict()  # signature -> time
+        self.__lock = threading.Lock()
+        # metrics
+        self.running = 0
+        self.finished = 0
+        self.suppressed = 0
+        self.pushed = 0
+        self.failed = 0
+        self.push_time = 0.0
+
+    def __str__(self) -> str:
+        return '<%s: running=%d, finished=%d, suppressed=%d, pushed=%d, failed=%d, rate=%.1f />'\
+               % (self.__class__.__name__, self.running, self.finished,
+                  self.suppressed, self.pushed, self.failed, self.rate)
+
+    @property
+    def rate(self) -> float:
+        """ Pushed sessions per second (worker time) """
+        return self.pushed / self.push_time if self.push_time > 0 else 0.0
+
+    def info(self, msg: str):
+        Log.info('%s >\t%s' % (self.__class__.__name__, msg))
+
+    def error(self, msg: str):
+        Log.error('%s >\t%s' % (self.__class__.__name__, msg))
+
+    def __seen(self, signature: str) -> bool:
+        """ Check and remember the signature of broadcast message """
+        with self.__lock:
+            if signature in self.__signatures:
+                self.suppressed += 1
+                return True
+            self.__signatures[signature] = time.time()
+            while len(self.__signatures) > self.MAX_SIGNATURES:
+                self.__signatures.popitem(last=False)
+            return False
+
+    def broadcast(self, msg: ReliableMessage, origin: ID=None) -> Optional[BroadcastTask]:
+        """
+        Deliver message to all online users, and forward to neighbor stations
+
+        :param msg:    broadcast message
+        :param origin: neighbor station where the message came from
+        :return: None if the message was broadcast already
+        """
+        signature = msg.get('signature')
+        if signature is None or self.__seen(signature=signature):
+            return None
+        task = BroadcastTask(msg=msg, origin=origin)
+        # forward to neighbors
+        relay = self.dispatcher.relay
+        if relay is not None:
+            task.neighbors = relay.broadcast(data=task.data, origin=origin)
+        # push to local sessions
+        users = self.dispatcher.session_server.online_users()
+        sender = msg.envelope.sender
+        users = [item for item in users if item != sender]
+        chunks = task.split(users=users, size=self.CHUNK_SIZE)
+        with self.__lock:
+            self.running += 1
+        if len(chunks) == 0:
+            self.__finish(task=task)
+        for chunk in chunks:
+            self.__workers.submit(self.__run, task, chunk)
+        return task
+
+    def __run(self, task: BroadcastTask, chunk: list):
+        start = time.time()
+        pushed = 0
+        failed = 0
+        try:
+            for identifier in chunk:
+                handlers = self.dispatcher.online_handlers(receiver=identifier)
+                for request_handler in handlers:
+                    if request_handler.push_data(body=task.data):
+                        pushed += 1
+                    else:
+                        failed += 1
+        except Exception as error:
+            self.error('failed to broadcast message: %s, %s' % (error, task))
+        with self.__lock:
+            self.pushed += pushed
+            self.failed += failed
+            self.push_time += time.time() - start
+        if task.chunk_done(pushed=pushed, failed=failed):
+            self.__finish(task=task)
+
+    def __finish(self, task: BroadcastTask):
+        task.end_time = time.time()
+        with self.__lock:
+            self.running -= 1
+            self.finished += 1
+        task.finished.set()
+        self.info('message broadcast: %s' % task)
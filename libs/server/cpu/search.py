@@ -80,7 +80,7 @@ class UsersCommandProcessor(CommandProcessor):
     #
     def process(self, content: Content, sender: ID, msg: InstantMessage) -> Optional[Content]:
         assert isinstance(content, Command), 'command error: %s' % content
-        users = self.session_server.random_users()
+        users = self.session_server.random_users(exclude=sender)
         response = Command.new(command='users')
         response['message'] = '%d user(s) connected' % len(users)
         response['users'] = users
@@ -30,17 +30,43 @@
     A dispatcher to decide which way to deliver message.
 """
 
+import json
 from typing import Optional
 
 from dimp import ID
 from dimp import ReliableMessage
 from dimp import ContentType, Content
 from dimsdk import ReceiptCommand
-from dimsdk import ApplePushNotificationService
 
 from ..common import Database, Facebook
 from ..common import Log
 from .session import SessionServer
+from .pusher import NotificationPusher, LazyText
+from .fanout import FanOut
+from .broadcast import Broadcaster
+from .relay import Relay
+
+
+class DisplayName:
+    """ Name of user/group, resolved when it's used """
+
+    def __init__(self, facebook: Facebook, identifier: ID):
+        super().__init__()
+        self.facebook = facebook
+        self.identifier = identifier
+
+    def __str__(self) -> str:
+        if self.identifier.type.is_group():
+            return self.facebook.group_name(identifier=self.identifier)
+        return self.facebook.nickname(identifier=self.identifier)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, DisplayName):
+            return self.identifier == other.identifier
+        return False
+
+    def __hash__(self) -> int:
+        return hash(self.identifier)
 
 
 class Dispatcher:
@@ -50,8 +76,13 @@ class Dispatcher:
         self.database: Database = None
         self.facebook: Facebook = None
         self.session_server: SessionServer = None
-        self.apns: ApplePushNotificationService = None
+        self.apns: NotificationPusher = None
+        # receptionist for pushing stored messages to online users
+        self.receptionist = None
         self.neighbors: list = []
+        self.relay: Relay = None
+        self.__fan_out: FanOut = None
+        self.__broadcaster: Broadcaster = None
 
     def info(self, msg: str):
         Log.info('%s >\t%s' % (self.__class__.__name__, msg))
@@ -68,39 +99,98 @@ class Dispatcher:
                 receipt[key] = value
         return receipt
 
-    def __transmit(self, msg: ReliableMessage) -> bool:
-        # TODO: broadcast to neighbor stations
-        receiver = msg.envelope.receiver
-        self.info('transmitting to neighbors %s, receiver: %s' % (self.neighbors, receiver))
-        return False
+    def transmit(self, receiver: ID, data: bytes) -> bool:
+        """ Forward message data (JSON) to the station where the receiver is """
+        if self.relay is None:
+            return False
+        return self.relay.transmit(receiver=receiver, data=data)
 
     def __broadcast(self, msg: ReliableMessage) -> Optional[Content]:
-        # TODO: split for all users
-        self.info('broadcasting message %s' % msg)
-        return self.__receipt(message='Message broadcasting', msg=msg)
+        # deliver in background
+        task = self.broadcaster.broadcast(msg=msg)
+        if task is None:
+            return self.__receipt(message='Message broadcast already', msg=msg)
+        self.info('broadcasting message: %s' % task)
+        response = self.__receipt(message='Message broadcasting', msg=msg)
+        response['users'] = task.users
+        return response
 
     def __split_group_message(self, msg: ReliableMessage) -> Optional[Content]:
         receiver = self.facebook.identifier(msg.envelope.receiver)
         assert receiver.type.is_group(), 'receiver not a group: %s' % receiver
         members = self.facebook.members(identifier=receiver)
         if members is not None:
-            messages = msg.split(members=members)
-            success_list = []
-            failed_list = []
-            for item in messages:
-                if self.deliver(msg=item) is None:
-                    failed_list.append(item.envelope.receiver)
-                else:
-                    success_list.append(item.envelope.receiver)
+            # deliver in background
+            task = self.fan_out.deliver(msg=msg, members=members)
             response = ReceiptCommand.new(message='Message split and delivering')
-            if len(success_list) > 0:
-                response['success'] = success_list
-            if len(failed_list) > 0:
-                response['failed'] = failed_list
+            response['members'] = task.total
             return response
 
-    def deliver(self, msg: ReliableMessage) -> Optional[Content]:
+    @property
+    def fan_out(self) -> FanOut:
+        if self.__fan_out is None:
+            self.__fan_out = FanOut(dispatcher=self)
+        return self.__fan_out
+
+    @property
+    def broadcaster(self) -> Broadcaster:
+        if self.__broadcaster is None:
+            self.__broadcaster = Broadcaster(dispatcher=self)
+        return self.__broadcaster
+
+    def online_handlers(self, receiver: ID) -> list:
+        """ Get request handlers of the activated sessions """
+        return self.session_server.active_handlers(identifier=receiver)
+
+    def has_backlog(self, receiver: ID) -> bool:
+        """ Whether messages stored for the online receiver are not pushed yet,
+            new messages must be stored after them to keep the order """
+        if self.receptionist is None:
+            return False
+        return self.receptionist.has_backlog(identifier=receiver)
+
+    def push(self, msg: ReliableMessage, handlers: list) -> int:
+        """ Push message via connections, return success count """
+        success = 0
+        for request_handler in handlers:
+            if request_handler.push_message(msg):
+                success = success + 1
+            else:
+                self.error('failed to push message via connection (%s, %s)' % request_handler.client_address)
+        return success
+
+    def store(self, msg: ReliableMessage, online: bool=False) -> bool:
+        """ Store message for offline receiver and push notification """
+        receiver = self.facebook.identifier(msg.envelope.receiver)
+        # store in local cache file
+        self.info('%s is offline, store message from: %s' % (receiver, msg.envelope.sender))
+        stored = self.database.store_message(msg)
+        if stored and online:
+            # receiver is online, let the receptionist retry it
+            self.receptionist.add_guest(identifier=receiver)
+        self.notify(msg=msg)
+        return stored
+
+    def notify(self, msg: ReliableMessage, receiver: ID=None):
+        """ Push notification for offline receiver (or group member) """
         sender = self.facebook.identifier(msg.envelope.sender)
+        group = self.facebook.identifier(msg.envelope.group)
+        if receiver is None:
+            receiver = self.facebook.identifier(msg.envelope.receiver)
+        elif group is None:
+            # group message not split
+            group = self.facebook.identifier(msg.envelope.receiver)
+        # check mute-list
+        if self.database.is_muted(sender=sender, receiver=receiver, group=group):
+            self.info('this sender/group is muted: %s' % msg)
+        else:
+            # push notification
+            msg_type = msg.envelope.type
+            if msg_type is None:
+                msg_type = 0
+            self.__push_msg(sender=sender, receiver=receiver, group=group, msg_type=msg_type)
+
+    def deliver(self, msg: ReliableMessage) -> Optional[Content]:
         receiver = self.facebook.identifier(msg.envelope.receiver)
         group = self.facebook.identifier(msg.envelope.group)
         # check broadcast message
@@ -113,43 +203,37 @@ class Dispatcher:
         if receiver.type.is_group():
             # split and deliver them
             return self.__split_group_message(msg=msg)
-        # try for online user
-        sessions = self.session_server.all(identifier=receiver)
-        if sessions and len(sessions) > 0:
-            self.info('%s is online(%d), try to push message: %s' % (receiver, len(sessions), msg.envelope))
-            success = 0
-            for sess in sessions:
-                if sess.valid is False or sess.active is False:
-                    # self.info('session invalid %s' % sess)
-                    continue
-                request_handler = self.session_server.get_handler(client_address=sess.client_address)
-                if request_handler is None:
-                    self.error('handler lost: %s' % sess)
-                    continue
-                if request_handler.push_message(msg):
-                    success = success + 1
-                else:
-                    self.error('failed to push message via connection (%s, %s)' % sess.client_address)
-            if success > 0:
-                self.info('message pushed to activated session(%d) of user: %s' % (success, receiver))
-                return self.__receipt(message='Message sent', msg=msg)
-        # store in local cache file
-        self.info('%s is offline, store message from: %s' % (receiver, sender))
-        self.database.store_message(msg)
-        # transmit to neighbor stations
-        self.__transmit(msg=msg)
-        # check mute-list
-        if self.database.is_muted(sender=sender, receiver=receiver, group=group):
-            self.info('this sender/group is muted: %s' % msg)
-        else:
-            # push notification
-            msg_type = msg.envelope.type
-            if msg_type is None:
-                msg_type = 0
-            self.__push_msg(sender=sender, receiver=receiver, group=group, msg_type=msg_type)
+        handlers = self.online_handlers(receiver=receiver)
+        if len(handlers) == 0:
+            # forward to the station where the receiver is
+            data = json.dumps(msg).encode('utf-8')
+            if self.transmit(receiver=receiver, data=data):
+                return self.__receipt(message='Message transmitting', msg=msg)
+        if self.deliver_local(msg=msg, handlers=handlers):
+            return self.__receipt(message='Message sent', msg=msg)
         # response
         return self.__receipt(message='Message delivering', msg=msg)
 
+    def deliver_local(self, msg: ReliableMessage, handlers: list=None) -> bool:
+        """
+        Push message to the online receiver, or store it
+
+        :return: True on pushed
+        """
+        receiver = self.facebook.identifier(msg.envelope.receiver)
+        if handlers is None:
+            handlers = self.online_handlers(receiver=receiver)
+        # try for online user (after the messages stored for it)
+        if len(handlers) > 0 and not self.has_backlog(receiver=receiver):
+            self.info('%s is online(%d), try to push message: %s' % (receiver, len(handlers), msg.envelope))
+            success = self.push(msg=msg, handlers=handlers)
+            if success > 0:
+                self.info('message pushed to activated session(%d) of user: %s' % (success, receiver))
+                return True
+        # store for offline user
+        self.store(msg=msg, online=len(handlers) > 0)
+        return False
+
     def __push_msg(self, sender: ID, receiver: ID, group: ID, msg_type: int=0) -> bool:
         if msg_type == 0:
             something = 'a message'
@@ -166,13 +250,15 @@ class Dispatcher:
         else:
             self.info('ignore msg type: %d' % msg_type)
             return False
-        from_name = self.facebook.nickname(identifier=sender)
-        to_name = self.facebook.nickname(identifier=receiver)
-        text = 'Dear %s: %s sent you %s' % (to_name, from_name, something)
-        # check group
-        if group is not None:
+        # names will be resolved when the notification is sent (after coalesced)
+        from_name = DisplayName(facebook=self.facebook, identifier=sender)
+        to_name = DisplayName(facebook=self.facebook, identifier=receiver)
+        if group is None:
+            text = LazyText('Dear %s: %s sent you %s', to_name, from_name, something)
+        else:
             # group message
-            text += ' in group [%s]' % self.facebook.group_name(identifier=group)
+            grp_name = DisplayName(facebook=self.facebook, identifier=group)
+            text = LazyText('Dear %s: %s sent you %s in group [%s]', to_name, from_name, something, grp_name)
         # push it
-        self.info('APNs message: %s' % text)
-        return self.apns.push(identifier=receiver, message=text)
+        self.info('APNs message: %s -> %s, %s' % (sender, receiver, something))
+        return self.apns.push(identifier=receiver, message=text, sender=from_name)
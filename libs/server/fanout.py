@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Group Message Fan-out
+    ~~~~~~~~~~~~~~~~~~~~~
+
+    Deliver split group messages to members in background
+"""
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dimp import ID
+from dimp import ReliableMessage
+
+from ..common import Log
+
+
+class MessageTemplate:
+    """
+        Group message encoded once for all members, instead of splitting
+        a copy for each member; the member's 'receiver' and 'key' will be
+        spliced before the shared body:
+
+            {"receiver": "{MEMBER}", "key": "{KEY}", "sender": ..., "group": ..., ...}
+    """
+
+    def __init__(self, msg: ReliableMessage):
+        super().__init__()
+        info = dict(msg)
+        keys = info.pop('keys', None)
+        info.pop('receiver', None)
+        info.pop('key', None)
+        # same as 'ReliableMessage.split()'
+        info['group'] = msg.envelope.receiver
+        self.keys: dict = {} if keys is None else keys
+        self.body = json.dumps(info).encode('utf-8')
+
+    def encode(self, member: str) -> bytes:
+        """ JSON data of the message for the member """
+        head = '{"receiver": %s, ' % json.dumps(member)
+        key = self.keys.get(member)
+        if key is not None:
+            head += '"key": %s, ' % json.dumps(key)
+        return head.encode('utf-8') + self.body[1:]
+
+
+class FanOutTask:
+
+    def __init__(self, msg: ReliableMessage, members: list):
+        super().__init__()
+        self.msg = msg
+        self.members = members
+        self.total = len(members)
+        self.pushed = 0
+        self.relayed = 0
+        self.stored = 0
+        self.failed = 0
+        self.start_time = time.time()
+        self.end_time = 0.0
+        self.finished = threading.Event()
+
+    def __str__(self) -> str:
+        return '<%s: group=%s, total=%d, pushed=%d, relayed=%d, stored=%d, failed=%d, time=%.3f />'\
+               % (self.__class__.__name__, self.msg.envelope.receiver,
+                  self.total, self.pushed, self.relayed, self.stored, self.failed, self.elapsed)
+
+    @property
+    def elapsed(self) -> float:
+        end_time = self.end_time if self.finished.is_set() else time.time()
+        return end_time - self.start_time
+
+    def wait(self, timeout: float=None) -> bool:
+        return self.finished.wait(timeout=timeout)
+
+
+class FanOut:
+    """
+        Group messages are split in background:
+
+            1. members are partitioned into online and offline by their sessions;
+            2. copies for online members are pushed via their connections in parallel,
+               which only put data into the outbox of each connection;
+            3. copies for offline members are forwarded to the stations where they are,
+               or stored (with the failed to push) in one pass.
+
+        The message is encoded once as a template, the copy for each member is
+        spliced from the template bytes when pushing or storing.
+
+        The dispatcher responds the sender immediately, the results are counted
+        in each task and the totals.
+    """
+
+    # threads for splitting group messages, and for pushing copies
+    TASK_WORKERS = 2
+    PUSH_WORKERS = 8
+
+    def __init__(self, dispatcher):
+        super().__init__()
+        self.dispatcher = dispatcher
+        self.__tasks = ThreadPoolExecutor(max_workers=self.TASK_WORKERS)
+        self.__pushers = ThreadPoolExecutor(max_workers=self.PUSH_WORKERS)
+        self.__lock = threading.Lock()
+        # metrics
+        self.running = 0
+        self.finished = 0
+        self.pushed = 0
+        self.relayed = 0
+        self.stored = 0
+        self.failed = 0
+
+    def __str__(self) -> str:
+        return '<%s: running=%d, finished=%d, pushed=%d, relayed=%d, stored=%d, failed=%d />'\
+               % (self.__class__.__name__, self.running, self.finished,
+                  self.pushed, self.relayed, self.stored, self.failed)
+
+    def info(self, msg: str):
+        Log.info('%s >\t%s' % (self.__class__.__name__, msg))
+
+    def error(self, msg: str):
+        Log.error('%s >\t%s' % (self.__class__.__name__, msg))
+
+    def deliver(self, msg: ReliableMessage, members: list) -> FanOutTask:
+        task = FanOutTask(msg=msg, members=members)
+        with self.__lock:
+            self.running += 1
+        self.__tasks.submit(self.__run, task)
+        return task
+
+    def __run(self, task: FanOutTask):
+        try:
+            self.__split(task=task)
+        except Exception as error:
+            self.error('failed to deliver group message: %s, %s' % (error, task))
+            task.failed = task.total - task.pushed - task.relayed - task.stored
+        finally:
+            task.end_time = time.time()
+            with self.__lock:
+                self.running -= 1
+                self.finished += 1
+                self.pushed += task.pushed
+                self.relayed += task.relayed
+                self.stored += task.stored
+                self.failed += task.failed
+            task.finished.set()
+            self.info('group message delivered: %s' % task)
+
+    def __split(self, task: FanOutTask):
+        dispatcher = self.dispatcher
+        facebook = dispatcher.facebook
+        template = MessageTemplate(msg=task.msg)
+        # 1. partition members
+        online = []
+        offline = []
+        retries = []
+        for member in task.members:
+            receiver = facebook.identifier(member)
+            handlers = dispatcher.online_handlers(receiver=receiver)
+            if len(handlers) == 0:
+                offline.append(receiver)
+            elif dispatcher.has_backlog(receiver=receiver):
+                # store after the messages waiting for it
+                retries.append(receiver)
+            else:
+                online.append((receiver, handlers))
+        # 2. push to online members
+        futures = [self.__pushers.submit(self.__push, template, receiver, handlers)
+                   for receiver, handlers in online]
+        for (receiver, handlers), future in zip(online, futures):
+            if future.result() > 0:
+                task.pushed += 1
+            else:
+                retries.append(receiver)
+        # 3. store for offline members
+        database = dispatcher.database
+        for receiver in offline:
+            data = template.encode(member=receiver)
+            if dispatcher.transmit(receiver=receiver, data=data):
+                # forward to the station where the member is
+                task.relayed += 1
+                continue
+            if database.store_message_data(receiver=receiver, data=data):
+                task.stored += 1
+            dispatcher.notify(msg=task.msg, receiver=receiver)
+        for receiver in retries:
+            if database.store_message_data(receiver=receiver, data=template.encode(member=receiver)):
+                task.stored += 1
+            dispatcher.notify(msg=task.msg, receiver=receiver)
+        for receiver in retries:
+            dispatcher.receptionist.add_guest(identifier=receiver)
+        task.failed = task.total - task.pushed - task.relayed - task.stored
+
+    def __push(self, template: MessageTemplate, receiver: ID, handlers: list) -> int:
+        data = template.encode(member=receiver)
+        success = 0
+        for request_handler in handlers:
+            if request_handler.push_data(body=data):
+                success = success + 1
+            else:
+                self.error('failed to push message via connection (%s, %s)' % request_handler.client_address)
+        return success
@@ -60,12 +60,9 @@ class Filter:
         return self.facebook.database
 
     def __name(self, identifier: ID) -> str:
-        profile = self.facebook.profile(identifier)
-        if profile is not None:
-            name = profile.name
-            if name is not None:
-                return name
-        return identifier
+        if identifier.type.is_group():
+            return self.facebook.group_name(identifier=identifier)
+        return self.facebook.nickname(identifier=identifier)
 
     #
     #   check
@@ -137,3 +134,10 @@ class Filter:
         if res is not None:
             # blocked
             return res
+
+    def check_relay(self, msg: ReliableMessage) -> Optional[Content]:
+        # the sender logged in the neighbor station, check block-list only
+        res = self.__check_blocked(envelope=msg.envelope)
+        if res is not None:
+            # blocked
+            return res
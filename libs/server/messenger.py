@@ -33,10 +33,11 @@
 from typing import Optional
 
 from dimp import ID, User
-from dimp import Content, TextContent
+from dimp import Content
 from dimp import InstantMessage, ReliableMessage
 from dimsdk import Session
 
+from ..common import Log
 from ..common import CommonMessenger
 
 from .session import SessionServer
@@ -123,11 +124,8 @@ class ServerMessenger(CommonMessenger):
         if res is not None:
             # broadcast is not allowed
             return res
-        # TODO: broadcast this message
-        text = 'Message broadcast to "%s" is not implemented' % msg.envelope.receiver
-        res = TextContent.new(text=text)
-        res.group = msg.envelope.group
-        return res
+        # call dispatcher to broadcast this message
+        return self.dispatcher.deliver(msg=msg)
 
     def deliver_message(self, msg: ReliableMessage) -> Optional[Content]:
         """ Deliver message to the receiver, or broadcast to neighbours """
@@ -138,6 +136,16 @@ class ServerMessenger(CommonMessenger):
         # call dispatcher to deliver this message
         return self.dispatcher.deliver(msg=msg)
 
+    def check_relayed(self, msg: ReliableMessage) -> bool:
+        """ Verify message relayed from neighbor station, as the messages from clients """
+        try:
+            if self.verify_message(msg=msg) is None:
+                return False
+        except Exception as error:
+            Log.error('failed to verify relayed message: %s, %s' % (msg.envelope, error))
+            return False
+        return self.filter.check_relay(msg=msg) is None
+
     def forward_message(self, msg: ReliableMessage) -> Optional[Content]:
         """ Re-pack and deliver (Top-Secret) message to the real receiver """
         res = self.filter.check_forward(msg=msg)
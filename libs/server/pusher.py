@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Notification Pusher
+    ~~~~~~~~~~~~~~~~~~~
+
+    Push notifications to offline devices in background
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from threading import Thread
+
+from dimp import ID
+from dimsdk import ApplePushNotificationService
+
+from ..common import Log
+
+
+class LazyText:
+    """ Text formatted when it's sent, so the names in arguments will not be
+        resolved for the notifications coalesced or dropped """
+
+    def __init__(self, fmt: str, *args):
+        super().__init__()
+        self.fmt = fmt
+        self.args = args
+
+    def __str__(self) -> str:
+        return self.fmt % tuple([str(item) for item in self.args])
+
+
+class Notification:
+
+    def __init__(self, receiver: ID):
+        super().__init__()
+        self.receiver = receiver
+        self.messages = []
+        self.senders = set()
+        self.time = time.time()
+
+    @property
+    def text(self) -> str:
+        count = len(self.messages)
+        if count == 1:
+            return str(self.messages[0])
+        if len(self.senders) == 1 and None not in self.senders:
+            return '%d new messages from %s' % (count, next(iter(self.senders)))
+        return '%d new messages' % count
+
+
+class NotificationPusher(Thread):
+    """
+        Notifications are queued and sent by a background thread:
+
+            1. notifications for the same receiver are coalesced in 'DELAY' seconds;
+            2. at most 'MAX_PENDING' receivers waiting, new notifications will be dropped when full;
+            3. at most 'RATE' pushes per second.
+
+        It has the same 'push'/'clear_badge' as ApplePushNotificationService,
+        so it can be used in place of the service.
+    """
+
+    DELAY = 1.0
+    MAX_PENDING = 10000
+    RATE = 100
+
+    def __init__(self, service: ApplePushNotificationService):
+        super().__init__()
+        self.daemon = True
+        self.service = service
+        self.running = False
+        self.__pending = OrderedDict()  # ID -> Notification
+        self.__clears = set()
+        self.__condition = threading.Condition()
+        # rate limit
+        self.__tokens = float(self.RATE)
+        self.__last_time = time.time()
+        # metrics
+        self.queued = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.sent = 0
+        self.failed = 0
+
+    def __str__(self) -> str:
+        return '<%s: pending=%d, queued=%d, coalesced=%d, dropped=%d, sent=%d, failed=%d />'\
+               % (self.__class__.__name__, len(self.__pending),
+                  self.queued, self.coalesced, self.dropped, self.sent, self.failed)
+
+    def info(self, msg: str):
+        Log.info('%s >\t%s' % (self.__class__.__name__, msg))
+
+    def error(self, msg: str):
+        Log.error('%s >\t%s' % (self.__class__.__name__, msg))
+
+    def push(self, identifier: ID, message: str, sender: str=None) -> bool:
+        """
+        Queue a notification
+
+        :param identifier: receiver
+        :param message:    notification text (str or LazyText)
+        :param sender:     sender name, for coalesced text (str() when sent)
+        :return: False on queue full
+        """
+        with self.__condition:
+            item = self.__pending.get(identifier)
+            if item is None:
+                if len(self.__pending) >= self.MAX_PENDING:
+                    self.dropped += 1
+                    self.error('queue full, notification dropped: %s' % identifier)
+                    return False
+                item = Notification(receiver=identifier)
+                self.__pending[identifier] = item
+                self.__condition.notify()
+            else:
+                self.coalesced += 1
+            item.messages.append(message)
+            item.senders.add(sender)
+            self.queued += 1
+            return True
+
+    def clear_badge(self, identifier: ID) -> bool:
+        """ Drop pending notifications and clear badge for the receiver who has come in """
+        with self.__condition:
+            item = self.__pending.pop(identifier, None)
+            if item is not None:
+                self.dropped += len(item.messages)
+            self.__clears.add(identifier)
+            self.__condition.notify()
+            return True
+
+    def stop(self):
+        with self.__condition:
+            self.running = False
+            self.__condition.notify_all()
+
+    def start(self):
+        self.running = True
+        super().start()
+
+    def __next_batch(self) -> (list, list):
+        """ Wait for notifications ready to send, and cleared receivers """
+        with self.__condition:
+            while self.running:
+                clears = list(self.__clears)
+                self.__clears.clear()
+                batch = []
+                now = time.time()
+                timeout = None
+                while len(self.__pending) > 0:
+                    item = next(iter(self.__pending.values()))
+                    delay = item.time + self.DELAY - now
+                    if delay > 0:
+                        timeout = delay
+                        break
+                    self.__pending.popitem(last=False)
+                    batch.append(item)
+                if len(batch) > 0 or len(clears) > 0:
+                    return batch, clears
+                self.__condition.wait(timeout=timeout)
+            return [], []
+
+    def __acquire(self):
+        """ Wait for rate limit """
+        while True:
+            now = time.time()
+            self.__tokens = min(float(self.RATE), self.__tokens + (now - self.__last_time) * self.RATE)
+            self.__last_time = now
+            if self.__tokens >= 1:
+                self.__tokens -= 1
+                return
+            time.sleep((1 - self.__tokens) / self.RATE)
+
+    def __send(self, item: Notification) -> bool:
+        self.__acquire()
+        # one push for the coalesced messages, but badge for each
+        for _ in range(len(item.messages) - 1):
+            self.service.badge(item.receiver)
+        return self.service.push(identifier=item.receiver, message=item.text)
+
+    def run(self):
+        self.info('starting...')
+        while self.running:
+            batch, clears = self.__next_batch()
+            for identifier in clears:
+                try:
+                    self.service.clear_badge(identifier=identifier)
+                except Exception as error:
+                    self.error('failed to clear badge: %s, %s' % (identifier, error))
+            for item in batch:
+                try:
+                    if self.__send(item=item):
+                        self.sent += 1
+                    else:
+                        self.failed += 1
+                except Exception as error:
+                    self.failed += 1
+                    self.error('failed to push notification: %s, %s' % (item.receiver, error))
+        self.info('exit! %s' % self)
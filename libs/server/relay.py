@@ -0,0 +1,510 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Station Relay
+    ~~~~~~~~~~~~~
+
+    Forward messages to the station where the receiver is
+"""
+
+import json
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict, deque
+from threading import Thread
+from typing import Optional
+
+from dimp import ID
+from dimp import ReliableMessage
+from dimsdk import Station
+
+from ..common import Log
+from ..common import FrameDecoder, ReceiveBuffer
+
+
+class RoutingTable:
+    """
+        Which station the user was seen on last time
+    """
+
+    MAX_ENTRIES = 100000
+
+    def __init__(self):
+        super().__init__()
+        self.__routes = OrderedDict()  # user ID -> (station ID, time)
+        self.__lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.__routes)
+
+    def update(self, user: ID, station: ID):
+        with self.__lock:
+            self.__routes[user] = (station, time.time())
+            self.__routes.move_to_end(user)
+            while len(self.__routes) > self.MAX_ENTRIES:
+                self.__routes.popitem(last=False)
+
+    def lookup(self, user: ID) -> Optional[ID]:
+        with self.__lock:
+            route = self.__routes.get(user)
+        if route is not None:
+            return route[0]
+
+
+class RelayLink(Thread):
+    """
+        Persistent connection to a neighbor station, messages are sent in batches
+        (raw JSON lines, the same framing as clients):
+
+            >>> {"relay": "1.0", "station": "{ID}", "session": "{HEX}", "seq": 1, "seen": [...],
+                 "messages": [...], "broadcasts": [...]}
+            <<< {"relay": "ack", "seq": 1}
+            <<< {"relay": "denied", "seq": 1}    (not from neighbor station)
+
+        Broadcast messages are queued in a separated lane, they only take the room
+        left by the point-to-point messages in each frame (at least one).
+
+        Only one batch is on the way, it will be sent again (after reconnected)
+        if no ack received in 'ACK_TIMEOUT' seconds; after 'MAX_RETRIES' times
+        failed, the messages are returned to the relay for storing locally.
+    """
+
+    BATCH_SIZE = 100
+    BATCH_DELAY = 0.05
+    MAX_QUEUE = 10000
+
+    CONNECT_TIMEOUT = 5.0
+    ACK_TIMEOUT = 5.0
+    MAX_RETRIES = 3
+    RETRY_INTERVAL = 1.0
+
+    def __init__(self, relay, station: Station):
+        super().__init__()
+        self.daemon = True
+        self.relay = relay
+        self.station = station
+        self.running = False
+        self.__messages = deque()  # JSON data of messages
+        self.__broadcasts = deque()  # JSON data of broadcast messages
+        self.__seen = []
+        self.__condition = threading.Condition()
+        self.__sock: socket.socket = None
+        self.__decoder = FrameDecoder(mars=False)
+        self.__reader = ReceiveBuffer()
+        # frame sequence in this session
+        self.__session = os.urandom(8).hex()
+        self.__seq = 0
+        # metrics
+        self.batches = 0
+        self.sent = 0
+        self.retries = 0
+        self.failed = 0
+
+    def __str__(self) -> str:
+        return '<%s: station=%s, queue=%d, batches=%d, sent=%d, retries=%d, failed=%d />'\
+               % (self.__class__.__name__, self.station.identifier, len(self.__messages),
+                  self.batches, self.sent, self.retries, self.failed)
+
+    def info(self, msg: str):
+        Log.info('%s >\t%s' % (self.__class__.__name__, msg))
+
+    def error(self, msg: str):
+        Log.error('%s >\t%s' % (self.__class__.__name__, msg))
+
+    def send(self, data: bytes, broadcast: bool=False) -> bool:
+        """ Queue message data (JSON), return False when the queue is full """
+        queue = self.__broadcasts if broadcast else self.__messages
+        with self.__condition:
+            if len(queue) >= self.MAX_QUEUE:
+                return False
+            queue.append(data)
+            self.__condition.notify()
+            return True
+
+    def announce(self, user: ID):
+        """ Tell the neighbor that the user was seen here """
+        with self.__condition:
+            self.__seen.append(user)
+            self.__condition.notify()
+
+    def start(self):
+        self.running = True
+        super().start()
+
+    def stop(self):
+        with self.__condition:
+            self.running = False
+            self.__condition.notify_all()
+
+    def run(self):
+        self.info('link to %s (%s:%d)' % (self.station.identifier, self.station.host, self.station.port))
+        while self.running:
+            frame, messages, broadcasts = self.__next_frame()
+            if frame is None:
+                break
+            if self.__deliver(frame=frame, seq=self.__seq):
+                self.batches += 1
+                self.sent += len(messages) + len(broadcasts)
+            else:
+                self.failed += len(messages) + len(broadcasts)
+                self.relay.link_failed(link=self, messages=messages, broadcasts=broadcasts)
+        self.__close()
+        self.info('link closed: %s' % self)
+
+    def __next_frame(self) -> (Optional[bytes], list, list):
+        with self.__condition:
+            while len(self.__messages) == 0 and len(self.__broadcasts) == 0 and len(self.__seen) == 0:
+                if not self.running:
+                    return None, [], []
+                self.__condition.wait()
+            # wait a moment for more messages, until the batch is full;
+            # every send() wakes this up, so wait again for the time left
+            expired = time.time() + self.BATCH_DELAY
+            while len(self.__messages) < self.BATCH_SIZE and self.running:
+                timeout = expired - time.time()
+                if timeout <= 0:
+                    break
+                self.__condition.wait(timeout=timeout)
+            count = min(len(self.__messages), self.BATCH_SIZE)
+            messages = [self.__messages.popleft() for _ in range(count)]
+            count = min(len(self.__broadcasts), max(self.BATCH_SIZE - count, 1))
+            broadcasts = [self.__broadcasts.popleft() for _ in range(count)]
+            seen = self.__seen
+            self.__seen = []
+        self.__seq += 1
+        head = json.dumps({
+            'relay': '1.0',
+            'station': self.relay.station,
+            'session': self.__session,
+            'seq': self.__seq,
+            'seen': seen,
+        })
+        # messages are encoded already
+        frame = head[:-1].encode('utf-8') + b', "messages": [' + b', '.join(messages) + b']'
+        if len(broadcasts) > 0:
+            frame += b', "broadcasts": [' + b', '.join(broadcasts) + b']'
+        return frame + b'}\n', messages, broadcasts
+
+    def __deliver(self, frame: bytes, seq: int) -> bool:
+        for attempt in range(self.MAX_RETRIES):
+            if attempt > 0:
+                self.retries += 1
+                time.sleep(self.RETRY_INTERVAL * attempt)
+            try:
+                sock = self.__connect()
+                sock.sendall(frame)
+                if self.__wait_ack(sock=sock, seq=seq):
+                    return True
+                self.error('ack timeout: %s, seq=%d' % (self.station.identifier, seq))
+            except IOError as error:
+                self.error('relay error: %s, %s' % (self.station.identifier, error))
+            self.__close()
+        return False
+
+    def __connect(self) -> socket.socket:
+        if self.__sock is None:
+            address = (self.station.host, self.station.port)
+            self.__sock = socket.create_connection(address, timeout=self.CONNECT_TIMEOUT)
+            self.__decoder.clear()
+        return self.__sock
+
+    def __close(self):
+        sock = self.__sock
+        self.__sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except IOError as error:
+                self.error('failed to close socket: %s' % error)
+
+    def __wait_ack(self, sock: socket.socket, seq: int) -> bool:
+        expired = time.time() + self.ACK_TIMEOUT
+        while True:
+            for _, pack in self.__decoder:
+                try:
+                    info = json.loads(pack)
+                except ValueError:
+                    continue
+                if info.get('relay') == 'ack' and info.get('seq') == seq:
+                    return True
+            timeout = expired - time.time()
+            if timeout <= 0:
+                return False
+            sock.settimeout(timeout)
+            try:
+                data = self.__reader.receive(sock)
+            except socket.timeout:
+                return False
+            if len(data) == 0:
+                raise ConnectionResetError('connection closed by %s' % self.station.identifier)
+            self.__decoder.feed(data)
+
+
+class Relay:
+    """
+        Message relay between stations
+
+        Each station announces users logged in to its neighbors, so they know
+        where to forward the messages for those users; the relayed messages
+        are delivered locally by the receiving station (never forwarded again).
+
+        Broadcast messages go along the ring of stations, each station forwards
+        them to its neighbors except the one where they came from.
+
+        Relay frames are accepted only from the neighbor stations: the station
+        ID in frame must be a neighbor, and the connection must come from the
+        address of its host; the messages relayed are verified (signature and
+        block-list) by the messenger of the connection, as the messages from
+        clients.
+    """
+
+    # sessions remembered for each neighbor (restarted)
+    MAX_SESSIONS = 4
+
+    # seconds to keep the addresses of neighbor hosts resolved
+    RESOLVE_EXPIRES = 300
+
+    def __init__(self):
+        super().__init__()
+        self.dispatcher = None
+        # current station and neighbors
+        self.station: ID = None
+        self.neighbors: list = []
+        self.routing = RoutingTable()
+        self.__links = {}  # station ID -> RelayLink
+        self.__sessions = {}  # station ID -> OrderedDict(session -> last sequence)
+        self.__addresses = {}  # host -> (IP addresses, expires)
+        self.__lock = threading.Lock()
+        # metrics
+        self.incoming = 0
+        self.denied = 0
+
+    def __str__(self) -> str:
+        links = ', '.join([str(link) for link in list(self.__links.values())])
+        return '<%s: routes=%d, incoming=%d, denied=%d, links=[%s] />'\
+               % (self.__class__.__name__, len(self.routing), self.incoming, self.denied, links)
+
+    def info(self, msg: str):
+        Log.info('%s >\t%s' % (self.__class__.__name__, msg))
+
+    def error(self, msg: str):
+        Log.error('%s >\t%s' % (self.__class__.__name__, msg))
+
+    def __neighbor(self, identifier: ID) -> Optional[Station]:
+        for station in self.neighbors:
+            if station.identifier == identifier:
+                return station
+
+    def link(self, station: Station) -> RelayLink:
+        """ Get (or create) the link to the station """
+        with self.__lock:
+            link = self.__links.get(station.identifier)
+            if link is None or not link.is_alive():
+                link = RelayLink(relay=self, station=station)
+                link.start()
+                self.__links[station.identifier] = link
+            return link
+
+    def stop(self):
+        with self.__lock:
+            links = list(self.__links.values())
+            self.__links.clear()
+        for link in links:
+            link.stop()
+
+    #
+    #   sending
+    #
+    def transmit(self, receiver: ID, data: bytes) -> bool:
+        """
+        Forward message data (JSON) to the station where the receiver was seen
+
+        :return: False if the receiver is not seen on neighbor station
+        """
+        identifier = self.routing.lookup(user=receiver)
+        if identifier is None or identifier == self.station:
+            return False
+        station = self.__neighbor(identifier=identifier)
+        if station is None:
+            return False
+        self.info('relay message for %s to %s' % (receiver, identifier))
+        return self.link(station=station).send(data=data)
+
+    def broadcast(self, data: bytes, origin: ID=None) -> int:
+        """
+        Forward broadcast message data (JSON) to neighbors
+
+        :param data:   message data
+        :param origin: neighbor station where the message came from
+        :return: count of neighbors
+        """
+        count = 0
+        for station in self.neighbors:
+            if station.identifier == origin:
+                continue
+            if self.link(station=station).send(data=data, broadcast=True):
+                count += 1
+        return count
+
+    def user_seen(self, user: ID):
+        """ User logged in this station, tell the neighbors """
+        self.routing.update(user=user, station=self.station)
+        for station in self.neighbors:
+            self.link(station=station).announce(user=user)
+
+    def link_failed(self, link: RelayLink, messages: list, broadcasts: list):
+        """ Failed to forward messages, store them locally """
+        self.error('relay failed, store %d message(s) locally, drop %d broadcast(s): %s'
+                   % (len(messages), len(broadcasts), link))
+        for data in messages:
+            msg = ReliableMessage(json.loads(data))
+            self.dispatcher.deliver_local(msg=msg)
+
+    #
+    #   receiving
+    #
+    @staticmethod
+    def is_relay_package(pack: bytes) -> bool:
+        return pack.startswith(b'{"relay"')
+
+    def process_package(self, pack: bytes, address: tuple, messenger) -> bytes:
+        """
+        Process relay package received by station connection
+
+        :param pack:      relay frame (JSON)
+        :param address:   peer address of the connection (IP, port)
+        :param messenger: messenger of the connection, for verifying messages
+        :return: response data
+        """
+        try:
+            frame = json.loads(pack)
+            ack = self.received(frame=frame, address=address, messenger=messenger)
+            return json.dumps(ack).encode('utf-8')
+        except Exception as error:
+            self.error('relay package error: %s, %s' % (error, address))
+            return b''
+
+    def __resolve(self, host: str) -> set:
+        now = time.time()
+        with self.__lock:
+            item = self.__addresses.get(host)
+        if item is not None and item[1] > now:
+            return item[0]
+        try:
+            addresses = set([info[4][0] for info in socket.getaddrinfo(host, None)])
+        except socket.error as error:
+            self.error('failed to resolve neighbor host: %s, %s' % (host, error))
+            addresses = set()
+        with self.__lock:
+            self.__addresses[host] = (addresses, now + self.RESOLVE_EXPIRES)
+        return addresses
+
+    @staticmethod
+    def __station(value) -> Optional[ID]:
+        """ Parse station ID from relay frame, None for invalid ID """
+        if not isinstance(value, str):
+            return None
+        try:
+            identifier = ID(value)
+            if identifier.valid:
+                return identifier
+        except ValueError:
+            # address check code error
+            return None
+
+    def authorize(self, identifier: ID, address: tuple) -> Optional[Station]:
+        """ Get the neighbor station sending relay frame from this address """
+        station = self.__neighbor(identifier=identifier)
+        if station is None or address is None:
+            return None
+        if address[0] in self.__resolve(host=station.host):
+            return station
+
+    def __check_session(self, station: ID, session: str, seq: int) -> bool:
+        """ Remember the last sequence, return False for duplicated frame """
+        with self.__lock:
+            sessions = self.__sessions.get(station)
+            if sessions is None:
+                sessions = OrderedDict()
+                self.__sessions[station] = sessions
+            last = sessions.get(session, 0)
+            if seq <= last:
+                return False
+            sessions[session] = seq
+            sessions.move_to_end(session)
+            while len(sessions) > self.MAX_SESSIONS:
+                sessions.popitem(last=False)
+            return True
+
+    def __verified(self, items: list, messenger) -> list:
+        messages = []
+        for item in items:
+            msg = ReliableMessage(item)
+            if messenger.check_relayed(msg=msg):
+                messages.append(msg)
+            else:
+                self.denied += 1
+                self.error('relayed message denied: %s' % msg.envelope)
+        return messages
+
+    def received(self, frame: dict, address: tuple, messenger) -> dict:
+        """
+        Relay frame received from neighbor station
+
+        :param frame:     relay frame
+        :param address:   peer address of the connection (IP, port)
+        :param messenger: messenger of the connection, for verifying messages
+        :return: ack
+        """
+        station = self.__station(frame.get('station'))
+        seq = frame.get('seq')
+        if station is None or self.authorize(identifier=station, address=address) is None:
+            self.denied += 1
+            self.error('relay frame denied: %s from %s' % (frame.get('station'), address))
+            return {'relay': 'denied', 'seq': seq}
+        if not self.__check_session(station=station, session=frame.get('session'), seq=seq):
+            # ack lost, the neighbor sent it again
+            self.info('duplicated relay frame: %s, seq=%d' % (station, seq))
+            return {'relay': 'ack', 'seq': seq}
+        seen = frame.get('seen')
+        if seen is not None:
+            for user in seen:
+                self.routing.update(user=ID(user), station=station)
+        messages = frame.get('messages')
+        if messages is not None:
+            self.incoming += len(messages)
+            for msg in self.__verified(items=messages, messenger=messenger):
+                self.dispatcher.deliver_local(msg=msg)
+        broadcasts = frame.get('broadcasts')
+        if broadcasts is not None:
+            self.incoming += len(broadcasts)
+            # forged broadcasts will not be spread to everyone, and the origin
+            # for loop suppression is a neighbor authorized above
+            for msg in self.__verified(items=broadcasts, messenger=messenger):
+                self.dispatcher.broadcaster.broadcast(msg=msg, origin=station)
+        return {'relay': 'ack', 'seq': seq}
@@ -28,11 +28,24 @@
     ~~~~~~~~~~~~~~
 
     for login user
+
+    Sessions are indexed by user ID and client address, the request handlers
+    of activated sessions (valid and active) are indexed by user ID too, so
+    the online users and their connections can be got without walking all
+    sessions; the index is updated when the state of a session changed:
+
+        1. handshake accepted     - update(session)
+        2. report online/offline  - update(session)
+        3. connection finished    - remove(session), clear_handler(address)
 """
 
 import random
+import threading
+from typing import Optional
 from weakref import WeakValueDictionary
 
+from dimp import ID
+from dimsdk import Session
 from dimsdk import SessionServer as Server
 
 
@@ -40,23 +53,192 @@ class SessionServer(Server):
 
     def __init__(self):
         super().__init__()
-        self.__handlers: dict = WeakValueDictionary()
+        self.__sessions = {}  # ID -> {address: Session}
+        self.__online = {}    # ID -> {address: RequestHandler}, activated sessions only
+        self.__active = {}    # ID -> (RequestHandler, ...), snapshot of the online index for readers
+        # online users in array for sampling, removed by swapping with the last one
+        self.__users = []     # [ID]
+        self.__positions = {}  # ID -> index in array
+        self.__owners = {}    # address -> ID, user of the activated session on this connection
+        self.__handlers: dict = WeakValueDictionary()  # address -> RequestHandler
+        self.__lock = threading.RLock()
+
+    #
+    #   Sessions
+    #
+    def all(self, identifier: ID) -> Optional[list]:
+        """ Get all sessions of this user """
+        with self.__lock:
+            sessions = self.__sessions.get(identifier)
+            if sessions is not None:
+                return list(sessions.values())
+
+    def clear(self, identifier: ID) -> bool:
+        """ Remove all sessions of this user """
+        with self.__lock:
+            handlers = self.__online.pop(identifier, None)
+            self.__active.pop(identifier, None)
+            if handlers is not None:
+                self.__discard(identifier=identifier)
+                for address in handlers:
+                    self.__owners.pop(address, None)
+            return self.__sessions.pop(identifier, None) is not None
+
+    def add(self, session: Session) -> bool:
+        """ Add a session with ID into memory cache """
+        identifier = session.identifier
+        address = session.client_address
+        with self.__lock:
+            sessions = self.__sessions.get(identifier)
+            if sessions is None:
+                sessions = {}
+                self.__sessions[identifier] = sessions
+            elif address in sessions:
+                # already exists
+                return False
+            sessions[address] = session
+            self.__update(session=session)
+            return True
+
+    def remove(self, session: Session) -> bool:
+        """ Remove the session from memory cache """
+        identifier = session.identifier
+        address = session.client_address
+        with self.__lock:
+            sessions = self.__sessions.get(identifier)
+            if sessions is None or sessions.get(address) is not session:
+                return False
+            sessions.pop(address)
+            if len(sessions) == 0:
+                self.__sessions.pop(identifier)
+            self.__deactivate(identifier=identifier, client_address=address)
+            return True
+
+    def get(self, identifier: ID, client_address) -> Optional[Session]:
+        """ Search session with ID and client address """
+        with self.__lock:
+            sessions = self.__sessions.get(identifier)
+            if sessions is not None:
+                return sessions.get(client_address)
+
+    def new(self, identifier: ID, client_address) -> Session:
+        """ Session factory """
+        with self.__lock:
+            session = self.get(identifier=identifier, client_address=client_address)
+            if session is None:
+                # create a new session
+                session = Session(identifier=identifier, client_address=client_address)
+                self.add(session=session)
+            return session
+
+    def update(self, session: Session):
+        """ Session state (valid/active) changed, update the online index """
+        with self.__lock:
+            if self.get(identifier=session.identifier, client_address=session.client_address) is session:
+                self.__update(session=session)
 
+    def __update(self, session: Session):
+        identifier = session.identifier
+        address = session.client_address
+        handler = self.__handlers.get(address)
+        if session.valid and session.active and handler is not None:
+            owner = self.__owners.get(address)
+            if owner is not None and owner != identifier:
+                # user switched on this connection
+                self.__deactivate(identifier=owner, client_address=address)
+            self.__owners[address] = identifier
+            handlers = self.__online.get(identifier)
+            if handlers is None:
+                handlers = {}
+                self.__online[identifier] = handlers
+            handlers[address] = handler
+            self.__active[identifier] = tuple(handlers.values())
+            if identifier not in self.__positions:
+                self.__positions[identifier] = len(self.__users)
+                self.__users.append(identifier)
+        else:
+            self.__deactivate(identifier=identifier, client_address=address)
+
+    def __deactivate(self, identifier: ID, client_address):
+        handlers = self.__online.get(identifier)
+        if handlers is not None and client_address in handlers:
+            handlers.pop(client_address)
+            if len(handlers) == 0:
+                self.__online.pop(identifier)
+                self.__active.pop(identifier)
+                self.__discard(identifier=identifier)
+            else:
+                self.__active[identifier] = tuple(handlers.values())
+            self.__owners.pop(client_address, None)
+
+    def __discard(self, identifier: ID):
+        pos = self.__positions.pop(identifier)
+        last = self.__users.pop()
+        if last != identifier:
+            # move the last one to fill the hole
+            self.__users[pos] = last
+            self.__positions[last] = pos
+
+    #
+    #   Request handlers
+    #
     def set_handler(self, client_address, request_handler):
-        self.__handlers[client_address] = request_handler
+        with self.__lock:
+            self.__handlers[client_address] = request_handler
 
     def get_handler(self, client_address):
         return self.__handlers.get(client_address)
 
     def clear_handler(self, client_address):
-        self.__handlers.pop(client_address, None)
-
-    def random_users(self, max_count=20) -> list:
-        array = self.online_users()
-        count = len(array)
-        # limit the response
-        if count < 2:
-            return array
-        elif count > max_count:
-            count = max_count
-        return random.sample(array, count)
+        with self.__lock:
+            self.__handlers.pop(client_address, None)
+            owner = self.__owners.get(client_address)
+            if owner is not None:
+                self.__deactivate(identifier=owner, client_address=client_address)
+
+    def active_handlers(self, identifier: ID) -> list:
+        """ Get request handlers of the activated sessions of this user """
+        # the snapshot is replaced (not modified) by writers, no lock needed
+        handlers = self.__active.get(identifier)
+        if handlers is None:
+            return []
+        return list(handlers)
+
+    #
+    #   Users
+    #
+    def all_users(self) -> list:
+        """ Get all users """
+        with self.__lock:
+            return list(self.__sessions.keys())
+
+    def online_users(self) -> list:
+        """ Get online users """
+        with self.__lock:
+            return list(self.__active.keys())
+
+    def is_online(self, identifier: ID) -> bool:
+        return identifier in self.__active
+
+    def random_users(self, max_count=20, exclude: ID=None) -> list:
+        """
+        Get random online users (valid and active)
+
+        :param max_count: max length of the result
+        :param exclude:   user not to be responded (the requester)
+        :return: users
+        """
+        with self.__lock:
+            users = self.__users
+            count = len(users)
+            # take one more in case of the excluded user chosen
+            limit = max_count + 1 if exclude in self.__positions else max_count
+            if count > limit:
+                # pick indexes only, O(max_count)
+                array = [users[pos] for pos in random.sample(range(count), limit)]
+            else:
+                array = list(users)
+                random.shuffle(array)
+        if exclude is not None:
+            array = [item for item in array if item != exclude]
+        return array[:max_count]
@@ -44,17 +44,22 @@ from dimsdk.ans import keywords as ans_keywords
 #
 from libs.common import Log
 from libs.common import Database, Facebook, AddressNameServer
+from libs.common import ReceiveBuffer, Outbox
 from libs.server import SessionServer, Server
 from libs.server import Dispatcher
+from libs.server import NotificationPusher
+from libs.server import Relay
 
 #
 #  Configurations
 #
 from etc.cfg_apns import apns_credentials, apns_use_sandbox, apns_topic
 from etc.cfg_db import base_dir, ans_reserved_records
+from etc.cfg_db import db_backend, db_write_window, db_cache_limits, db_changes_interval
 from etc.cfg_admins import administrators
 from etc.cfg_gsp import all_stations, local_servers
 from etc.cfg_gsp import station_id, station_host, station_port, station_name
+from etc.cfg_gsp import station_recv_buffer, station_outbox_limit, station_receptionist
 from etc.cfg_bots import tuling_keys, tuling_ignores, xiaoi_keys, xiaoi_ignores
 
 from etc.cfg_loader import load_station
@@ -63,6 +68,26 @@ from .receptionist import Receptionist
 from .monitor import Monitor
 
 
+"""
+    Receive Buffer
+    ~~~~~~~~~~~~~~
+
+    Buffer size limits for receiving data from each connection
+"""
+ReceiveBuffer.MIN_SIZE, ReceiveBuffer.MAX_SIZE = station_recv_buffer
+Log.info('receive buffer: %d ~ %d bytes' % station_recv_buffer)
+
+
+"""
+    Outbox
+    ~~~~~~
+
+    Limit of data waiting to be sent to each connection
+"""
+Outbox.HIGH_WATER_MARK = station_outbox_limit
+Log.info('outbox limit: %d bytes' % station_outbox_limit)
+
+
 """
     Key Store
     ~~~~~~~~~
@@ -80,6 +105,10 @@ g_keystore = KeyStore()
 """
 g_database = Database()
 g_database.base_dir = base_dir
+g_database.backend = db_backend
+g_database.write_window = db_write_window
+g_database.cache_limits = db_cache_limits
+g_database.watch_changes(interval=db_changes_interval)
 Log.info("database directory: %s" % g_database.base_dir)
 
 
@@ -124,6 +153,15 @@ g_apns.delegate = g_database
 Log.info('APNs credentials: %s' % apns_credentials)
 
 
+"""
+    Notification Pusher
+    ~~~~~~~~~~~~~~~~~~~
+
+    Queue notifications and push them via APNs in background
+"""
+g_pusher = NotificationPusher(service=g_apns)
+
+
 """
     Message Dispatcher
     ~~~~~~~~~~~~~~~~~~
@@ -134,7 +172,18 @@ g_dispatcher = Dispatcher()
 g_dispatcher.database = g_database
 g_dispatcher.facebook = g_facebook
 g_dispatcher.session_server = g_session_server
-g_dispatcher.apns = g_apns
+g_dispatcher.apns = g_pusher
+
+
+"""
+    Station Relay
+    ~~~~~~~~~~~~~
+
+    Forward messages to neighbor stations where the receivers are
+"""
+g_relay = Relay()
+g_relay.dispatcher = g_dispatcher
+g_dispatcher.relay = g_relay
 
 
 """
@@ -148,7 +197,7 @@ g_monitor.database = g_database
 g_monitor.facebook = g_facebook
 g_monitor.keystore = g_keystore
 g_monitor.session_server = g_session_server
-g_monitor.apns = g_apns
+g_monitor.apns = g_pusher
 
 
 """
@@ -160,7 +209,12 @@ g_monitor.apns = g_apns
 g_receptionist = Receptionist()
 g_receptionist.session_server = g_session_server
 g_receptionist.database = g_database
-g_receptionist.apns = g_apns
+g_receptionist.apns = g_pusher
+g_receptionist.workers, g_receptionist.batch_size = station_receptionist
+Log.info('receptionist: %d worker(s), %d message(s) per batch' % station_receptionist)
+
+g_dispatcher.receptionist = g_receptionist
+g_monitor.receptionist = g_receptionist
 
 
 """
@@ -312,6 +366,8 @@ Log.info('-------- loading neighbor stations: %d' % len(neighbors))
 for node in neighbors:
     Log.info('add node: %s' % node)
     g_dispatcher.neighbors.append(node)
+g_relay.station = current_station.identifier
+g_relay.neighbors = neighbors
 
 # load admins for receiving system reports
 Log.info('-------- loading administrators: %d' % len(administrators))
@@ -34,27 +34,40 @@ import json
 from socketserver import BaseRequestHandler
 from typing import Optional
 
-from dimp import User
+from dimp import ID, User
 from dimp import InstantMessage, ReliableMessage
-from dimsdk import NetMsgHead, NetMsg, CompletionHandler
+from dimsdk import NetMsg, CompletionHandler
 from dimsdk import MessengerDelegate
 
 from libs.common import Log
+from libs.common import FrameDecoder, ReceiveBuffer, Outbox
 from libs.server import Session
 from libs.server import ServerMessenger
 from libs.server import HandshakeDelegate
+from libs.server import Relay
 
 from .config import g_database, g_facebook, g_keystore, g_session_server
-from .config import g_dispatcher, g_receptionist, g_monitor
+from .config import g_dispatcher, g_receptionist, g_monitor, g_relay
 from .config import current_station, station_name, chat_bot
 
 
-class RequestHandler(BaseRequestHandler, MessengerDelegate, HandshakeDelegate):
+class BaseHandler(MessengerDelegate, HandshakeDelegate):
+    """
+        Connection Handler
+        ~~~~~~~~~~~~~~~~~~
 
-    def __init__(self, request, client_address, server):
-        super().__init__(request=request, client_address=client_address, server=server)
-        # messenger
-        self.__messenger: ServerMessenger = None
+        Protocols and message processing shared by all kinds of connection,
+        the subclass should provide 'client_address' and 'send(data)'
+    """
+
+    # messenger for this connection, created after 'open_session()'
+    __messenger: ServerMessenger = None
+    # buffer for receiving data from socket
+    __reader: ReceiveBuffer = None
+    # splitter for received data, created when first data arrived
+    __decoder: FrameDecoder = None
+    # queue for outgoing data
+    __outbox: Outbox = None
 
     def info(self, msg: str):
         Log.info('%s >\t%s' % (self.__class__.__name__, msg))
@@ -99,16 +112,16 @@ class RequestHandler(BaseRequestHandler, MessengerDelegate, HandshakeDelegate):
             return self.__messenger.remote_user
 
     #
+    #   Session
     #
-    #
-    def setup(self):
+    def open_session(self):
         address = self.client_address
         self.__messenger: ServerMessenger = None
         self.info('set up with %s [%s]' % (address, station_name))
         g_session_server.set_handler(client_address=address, request_handler=self)
         g_monitor.report(message='Client connected %s [%s]' % (address, station_name))
 
-    def finish(self):
+    def close_session(self):
         address = self.client_address
         user = self.remote_user
         if user is None:
@@ -124,95 +137,75 @@ class RequestHandler(BaseRequestHandler, MessengerDelegate, HandshakeDelegate):
                 g_session_server.remove(session=session)
         # remove request handler fro session handler
         g_session_server.clear_handler(client_address=address)
+        # data not sent yet
+        if self.__outbox is not None:
+            self.__outbox.close()
         self.__messenger = None
-        self.info('finish with %s %s' % (address, user))
-
-    """
-        DIM Request Handler
-    """
-
-    def handle(self):
-        self.info('client connected (%s, %s)' % self.client_address)
-        data = b''
-        while current_station.running:
-            # receive all data
-            incomplete_length = len(data)
-            while True:
-                part = self.receive(1024)
-                if part is None:
-                    break
-                data += part
-                if len(part) < 1024:
-                    break
-            if len(data) == incomplete_length:
-                self.info('no more data, exit (%d, %s)' % (incomplete_length, self.client_address))
-                break
-
-            # process package(s) one by one
-            #    the received data packages maybe spliced,
-            #    if the message data was wrap by other transfer protocol,
-            #    use the right split char(s) to split it
-            while len(data) > 0:
-
-                # (Protocol A) Tencent mars?
-                mars = False
-                head = None
-                try:
-                    head = NetMsgHead(data=data)
-                    if head.version == 200:
-                        # OK, it seems be a mars package!
-                        mars = True
-                        self.push_data = self.push_mars_data
-                except ValueError:
-                    # self.error('not mars message pack: %s' % error)
-                    pass
-                # check mars head
-                if mars:
-                    self.info('@@@ msg via mars, len: %d+%d' % (head.head_length, head.body_length))
-                    # check completion
-                    pack_len = head.head_length + head.body_length
-                    if pack_len > len(data):
-                        # partially data, keep it for next loop
-                        break
-                    # cut out the first package from received data
-                    pack = data[:pack_len]
-                    data = data[pack_len:]
-                    # process mars data package
-                    response = self.process_mars_package(pack)
-                    self.send(response)
-                    # mars OK
-                    continue
-
-                if data.startswith(b'\n'):
-                    # NOOP: heartbeat package
-                    self.info('trim <heartbeats>: %s' % data)
-                    data = data.lstrip(b'\n')
-                    self.send(b'\n')
-                    continue
+        self.info('finish with %s %s, %s, %s' % (address, user, self.reader, self.outbox))
 
-                # (Protocol B) raw data with no wrap?
-                if data.startswith(b'{"') and data.find(b'\0') < 0:
-                    # OK, it seems be a raw package!
-                    self.push_data = self.push_raw_data
-                    # check completion
-                    pos = data.find(b'\n')
-                    if pos < 0:
-                        # partially data, keep it for next loop
-                        break
-                    # cut out the first package from received data
-                    pack = data[:pos+1]
-                    data = data[pos+1:]
-                    # process raw data package
-                    response = self.process_package(pack)
-                    self.send(response + b'\n')
-                    # raw data OK
-                    continue
+    #
+    #   Package splitting
+    #
+    @property
+    def reader(self) -> ReceiveBuffer:
+        if self.__reader is None:
+            self.__reader = ReceiveBuffer()
+        return self.__reader
 
+    @property
+    def decoder(self) -> FrameDecoder:
+        if self.__decoder is None:
+            self.__decoder = FrameDecoder()
+        return self.__decoder
+
+    def split_packages(self, data: bytes) -> list:
+        """
+        Cut out completed packages from the received data
+
+        :param data: received data
+        :return: list of (protocol, package), the partially data will be kept for next time
+        """
+        decoder = self.decoder
+        decoder.feed(data)
+        packages = []
+        for protocol, pack in decoder:
+            if protocol == FrameDecoder.MARS:
+                # OK, it seems be a mars package!
+                self.info('@@@ msg via mars, len: %d' % len(pack))
+                self.push_data = self.push_mars_data
+            elif protocol == FrameDecoder.RAW:
+                # OK, it seems be a raw package!
+                self.push_data = self.push_raw_data
+            elif protocol == FrameDecoder.NOOP:
+                # NOOP: heartbeat package
+                self.info('trim <heartbeats>')
+            else:
                 # (Protocol ?)
-                # TODO: split and unwrap data package(s)
-                self.error('unknown protocol %s' % data)
-                data = b''
-                # raise AssertionError('unknown protocol')
+                self.error('unknown protocol %s' % pack)
+                continue
+            packages.append((protocol, pack))
+        return packages
+
+    def process_received(self, protocol: str, pack: bytes) -> Optional[bytes]:
+        """
+        Process one package cut out by 'split_packages()'
+
+        :param protocol: package protocol
+        :param pack:     package data
+        :return: response data
+        """
+        if protocol == FrameDecoder.MARS:
+            return self.process_mars_package(pack)
+        elif protocol == FrameDecoder.RAW:
+            if Relay.is_relay_package(pack):
+                return self.process_relay_package(pack) + b'\n'
+            return self.process_package(pack) + b'\n'
+        elif protocol == FrameDecoder.NOOP:
+            return b'\n'
+
+    def process_relay_package(self, pack: bytes) -> bytes:
+        """ Messages from neighbor station """
+        return g_relay.process_package(pack=pack, address=self.client_address, messenger=self.messenger)
 
     #
     #   process package with mars format
@@ -246,15 +239,58 @@ class RequestHandler(BaseRequestHandler, MessengerDelegate, HandshakeDelegate):
     #
     #   push message
     #
+    @property
+    def outbox(self) -> Outbox:
+        if self.__outbox is None:
+            self.__outbox = Outbox(sender=self.send, failed=self.__store_unsent, drained=self.__drained)
+        return self.__outbox
+
+    def __drained(self):
+        """ Outbox drained after rejecting data, retry the messages stored for the receiver """
+        user = self.remote_user
+        if user is not None:
+            g_receptionist.add_guest(identifier=user.identifier)
+
+    def __store_unsent(self, bodies: list):
+        """ Messages pushed into outbox but failed to send, store them for the receiver """
+        user = self.remote_user
+        if user is None:
+            self.error('failed to send %d message(s), receiver unknown %s' % (len(bodies), self.client_address))
+            return
+        receiver = user.identifier
+        self.error('failed to send %d message(s), store for %s' % (len(bodies), receiver))
+        self.store_messages(receiver=receiver, bodies=bodies)
+
+    def store_messages(self, receiver: ID, bodies: list):
+        """ Store messages (encoded in JSON) for the receiver, and let the receptionist retry them """
+        for body in bodies:
+            g_database.store_message_data(receiver=receiver, data=body)
+        # other sessions of the receiver may be online
+        g_receptionist.add_guest(identifier=receiver)
+
+    def respond(self, data: bytes) -> bool:
+        """ Send response data after the pending data """
+        outbox = self.outbox
+        outbox.put(data=data, force=True)
+        return outbox.flush()
+
+    def __push(self, data: bytes, body: bytes) -> bool:
+        outbox = self.outbox
+        if not outbox.put(data=data, item=body):
+            self.error('outbox full, push later %s %s' % (self.client_address, outbox))
+            return False
+        # if another thread is flushing, leave the data to it
+        return outbox.flush(blocking=False)
+
     def push_mars_data(self, body: bytes) -> bool:
         # kPushMessageCmdId = 10001
         # PUSH_DATA_TASK_ID = 0
         data = NetMsg(cmd=10001, seq=0, body=body)
-        return self.send(data)
+        return self.__push(data=data, body=body)
 
     def push_raw_data(self, body: bytes) -> bool:
         data = body + b'\n'
-        return self.send(data=data)
+        return self.__push(data=data, body=body)
 
     push_data = push_raw_data
 
@@ -279,23 +315,6 @@ class RequestHandler(BaseRequestHandler, MessengerDelegate, HandshakeDelegate):
             # return TextContent.new(text='parse message failed: %s' % error)
             return b''
 
-    #
-    #   Socket IO
-    #
-    def receive(self, buffer_size=1024) -> bytes:
-        try:
-            return self.request.recv(buffer_size)
-        except IOError as error:
-            self.error('failed to receive data %s' % error)
-
-    def send(self, data: bytes) -> bool:
-        try:
-            self.request.sendall(data)
-            return True
-        except IOError as error:
-            self.error('failed to send data %s' % error)
-            return False
-
     #
     #   MessengerDelegate
     #
@@ -331,7 +350,56 @@ class RequestHandler(BaseRequestHandler, MessengerDelegate, HandshakeDelegate):
         g_monitor.report(message='User %s logged in %s %s' % (user.name, client_address, sender))
         # add the new guest for checking offline messages
         g_receptionist.add_guest(identifier=sender)
+        # tell neighbor stations where the user is
+        g_relay.user_seen(user=sender)
 
     def handshake_success(self):
         # TODO: broadcast 'login'
         pass
+
+
+class RequestHandler(BaseRequestHandler, BaseHandler):
+
+    #
+    #
+    #
+    def setup(self):
+        self.open_session()
+
+    def finish(self):
+        self.close_session()
+
+    """
+        DIM Request Handler
+    """
+
+    def handle(self):
+        self.info('client connected (%s, %s)' % self.client_address)
+        while current_station.running:
+            # receive data
+            data = self.receive()
+            if data is None or len(data) == 0:
+                self.info('no more data, exit (%d, %s)' % (len(self.decoder), self.client_address))
+                break
+            # process package(s) one by one
+            for protocol, pack in self.split_packages(data):
+                response = self.process_received(protocol=protocol, pack=pack)
+                if response is not None:
+                    self.respond(response)
+
+    #
+    #   Socket IO
+    #
+    def receive(self) -> Optional[memoryview]:
+        try:
+            return self.reader.receive(self.request)
+        except IOError as error:
+            self.error('failed to receive data %s' % error)
+
+    def send(self, data: bytes) -> bool:
+        try:
+            self.request.sendall(data)
+            return True
+        except IOError as error:
+            self.error('failed to send data %s' % error)
+            return False
@@ -35,24 +35,26 @@ import time
 from dimp import ID
 from dimp import TextContent
 from dimp import InstantMessage
-from dimsdk import ApplePushNotificationService
 from dimsdk import KeyStore
 
 from libs.common import Database, Facebook
 from libs.common import Log
 from libs.server import ServerMessenger
 from libs.server import SessionServer
+from libs.server import NotificationPusher
 
 
 class Monitor:
 
     def __init__(self):
         super().__init__()
-        self.apns: ApplePushNotificationService = None
+        self.apns: NotificationPusher = None
         self.session_server: SessionServer = None
         self.database: Database = None
         self.facebook: Facebook = None
         self.keystore: KeyStore = None
+        # receptionist for pushing stored messages to online users
+        self.receptionist = None
         # message from the station to administrator(s)
         self.sender: ID = None
         self.admins: set = set()
@@ -93,26 +95,22 @@ class Monitor:
         r_msg = self.messenger.sign_message(msg=s_msg)
         # try for online user
         sessions = self.session_server.all(identifier=receiver)
-        if sessions and len(sessions) > 0:
-            self.info('%s is online(%d), try to push report: %s' % (receiver, len(sessions), text))
+        handlers = self.session_server.active_handlers(identifier=receiver)
+        if len(handlers) > 0:
+            self.info('%s is online(%d), try to push report: %s' % (receiver, len(handlers), text))
             success = 0
-            for sess in sessions:
-                if sess.valid is False or sess.active is False:
-                    # self.info('session invalid %s' % sess)
-                    continue
-                request_handler = self.session_server.get_handler(client_address=sess.client_address)
-                if request_handler is None:
-                    self.error('handler lost: %s' % sess)
-                    continue
+            for request_handler in handlers:
                 if request_handler.push_message(r_msg):
                     success = success + 1
                 else:
-                    self.error('failed to push report via connection (%s, %s)' % sess.client_address)
+                    self.error('failed to push report via connection (%s, %s)' % request_handler.client_address)
             if success > 0:
                 self.info('report pushed to activated session(%d) of user: %s' % (success, receiver))
                 return True
         # store in local cache file
         self.info('%s is offline, store report: %s' % (receiver, text))
-        self.database.store_message(r_msg)
+        if self.database.store_message(r_msg) and sessions and len(sessions) > 0:
+            # receiver is online, let the receptionist retry it
+            self.receptionist.add_guest(identifier=receiver)
         # push notification
         return self.apns.push(identifier=receiver, message=text)
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Station Protocol
+    ~~~~~~~~~~~~~~~~
+
+    Handler for each connection on asyncio event loop
+"""
+
+import asyncio
+from concurrent.futures import Executor
+from typing import Optional
+
+from dimp import ID
+
+from libs.common import FrameDecoder
+
+from .handler import BaseHandler
+
+
+class StationProtocol(asyncio.BufferedProtocol, BaseHandler):
+    """
+        Asyncio Connection Handler
+        ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+        Data is received into the adaptive buffer of 'reader' directly,
+        packages are split on the event loop, and processed one by one in the
+        executor (verifying/decrypting/signing messages is too heavy for loop),
+        so the responses will keep the same order with the requests.
+
+        Heartbeats are responded on the loop directly only when no package is
+        waiting or processing, otherwise they are queued after the packages.
+
+        Nothing blocks the loop: responses are flushed without waiting for the
+        thread which is flushing (it will send them too), and the messages
+        failed to send are stored by the executor.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, executor: Executor):
+        super().__init__()
+        self.__loop = loop
+        self.__executor = executor
+        self.__transport: asyncio.Transport = None
+        self.__client_address = None
+        self.__packages: asyncio.Queue = None
+        self.__processing = False
+        self.__task: asyncio.Task = None
+
+    @property
+    def client_address(self):  # (IP, port)
+        return self.__client_address
+
+    #
+    #   asyncio.Protocol
+    #
+    def connection_made(self, transport: asyncio.Transport):
+        self.__transport = transport
+        self.__client_address = transport.get_extra_info('peername')
+        self.__packages = asyncio.Queue()
+        self.__task = self.__loop.create_task(self.__process())
+        self.info('client connected (%s, %s)' % self.client_address)
+
+    def connection_lost(self, error: Optional[Exception]):
+        if error is not None:
+            self.error('connection lost %s, %s' % (self.client_address, error))
+        self.__transport = None
+        # finish after all received packages processed
+        self.__packages.put_nowait(None)
+
+    def eof_received(self) -> bool:
+        # keep the transport open for responding the received packages
+        self.__packages.put_nowait(None)
+        return True
+
+    def pause_writing(self):
+        # transport buffer full, keep data in outbox
+        self.outbox.pause()
+
+    def resume_writing(self):
+        self.outbox.resume()
+
+    def get_buffer(self, sizehint: int) -> memoryview:
+        return self.reader.buffer()
+
+    def buffer_updated(self, nbytes: int):
+        data = self.reader.update(nbytes)
+        packages = self.split_packages(data)
+        for protocol, pack in packages:
+            if protocol == FrameDecoder.NOOP and not self.__processing and self.__packages.empty():
+                # nothing to respond before it, respond heartbeats on the loop directly
+                self.respond(data=pack)
+            else:
+                self.__packages.put_nowait((protocol, pack))
+
+    async def __process(self):
+        await self.__loop.run_in_executor(self.__executor, self.open_session)
+        while True:
+            item = await self.__packages.get()
+            if item is None:
+                # no more data
+                break
+            protocol, pack = item
+            if protocol == FrameDecoder.NOOP:
+                # heartbeat after the responses of the packages before it
+                self.respond(data=pack)
+                continue
+            self.__processing = True
+            try:
+                response = await self.__loop.run_in_executor(self.__executor, self.process_received, protocol, pack)
+            except Exception as error:
+                self.error('failed to process package: %s' % error)
+                continue
+            finally:
+                self.__processing = False
+            if response is not None:
+                self.respond(data=response)
+        transport = self.__transport
+        if transport is not None:
+            # close after the responses written
+            self.__loop.call_soon(transport.close)
+        await self.__loop.run_in_executor(self.__executor, self.close_session)
+
+    def respond(self, data: bytes) -> bool:
+        """ Send response data after the pending data (on the event loop) """
+        outbox = self.outbox
+        outbox.put(data=data, force=True)
+        return outbox.flush(blocking=False)
+
+    def store_messages(self, receiver: ID, bodies: list):
+        # writing files, not on the event loop
+        self.__executor.submit(super().store_messages, receiver, bodies)
+
+    #
+    #   Socket IO
+    #
+    def send(self, data: bytes) -> bool:
+        """ Thread-safe sending, called by outbox from any thread """
+        transport = self.__transport
+        if transport is None or transport.is_closing():
+            self.error('failed to send data, connection closed %s' % (self.client_address,))
+            return False
+        self.__loop.call_soon_threadsafe(transport.write, data)
+        return True
@@ -30,28 +30,69 @@
     A message scanner for new guests who have just come in.
 """
 
+import threading
 import time
+from collections import deque
 from json import JSONDecodeError
 from threading import Thread
 
 from dimp import ID
-from dimsdk import ApplePushNotificationService
 
 from libs.common import Database
 from libs.common import Log
 from libs.server import Server, SessionServer
+from libs.server import NotificationPusher
 
 
 class Receptionist(Thread):
+    """
+        Guests are served by a pool of worker threads in turn, each turn
+        pushes one batch of messages to a guest, then the guest will be
+        added to the tail of the queue if more messages waiting.
+        A guest is served by only one worker at the same time, so messages
+        for the same receiver are always pushed in order.
+
+        If pushing failed (outbox full), the guest stalls until added again
+        (outbox drained); while a guest is waiting, being served or stalled,
+        new messages for it should be stored after the others (see
+        'has_backlog()'), instead of overtaking them.
+    """
+
+    # max seconds to wait for new guests, then check whether station stopped
+    IDLE_TIMEOUT = 1.0
 
     def __init__(self):
         super().__init__()
         self.session_server: SessionServer = None
-        self.apns: ApplePushNotificationService = None
+        self.apns: NotificationPusher = None
         self.database: Database = None
         # current station and guests
         self.station: Server = None
-        self.guests = []
+        self.__guests = set()  # waiting in the queue
+        self.__queue = deque()
+        self.__serving = set()  # being served by workers
+        self.__returned = set()  # come again while being served
+        self.__stalled = set()  # pushing failed, waiting for outbox drained
+        self.__condition = threading.Condition()
+        # worker threads, and max messages pushed to one guest each turn
+        self.workers = 4
+        self.batch_size = 64
+        # metrics
+        self.__arrivals = {}  # ID -> time when the guest came in
+        self.pushed = 0
+        self.batches = 0
+        self.busy_time = 0.0
+        self.emptied = 0
+        self.last_empty_time = 0.0
+        self.max_empty_time = 0.0
+        self.__total_empty_time = 0.0
+
+    def __str__(self) -> str:
+        return '<%s: waiting=%d, serving=%d, pushed=%d, batches=%d, rate=%.1f/s,' \
+               ' emptied=%d, time_to_empty(last=%.3f, avg=%.3f, max=%.3f) />'\
+               % (self.__class__.__name__, len(self.__queue), len(self.__serving),
+                  self.pushed, self.batches, self.drain_rate,
+                  self.emptied, self.last_empty_time, self.avg_empty_time, self.max_empty_time)
 
     def info(self, msg: str):
         Log.info('%s >\t%s' % (self.__class__.__name__, msg))
@@ -59,66 +100,114 @@ class Receptionist(Thread):
     def error(self, msg: str):
         Log.error('%s >\t%s' % (self.__class__.__name__, msg))
 
+    @property
+    def guests(self) -> list:
+        with self.__condition:
+            return list(self.__queue)
+
+    @property
+    def drain_rate(self) -> float:
+        """ messages pushed per second by each worker """
+        if self.busy_time > 0:
+            return self.pushed / self.busy_time
+        return 0.0
+
+    @property
+    def avg_empty_time(self) -> float:
+        """ average seconds from guest coming in to all messages pushed """
+        if self.emptied > 0:
+            return self.__total_empty_time / self.emptied
+        return 0.0
+
+    def has_backlog(self, identifier: ID) -> bool:
+        """ Whether there are messages stored for the guest not pushed yet """
+        with self.__condition:
+            return identifier in self.__guests or identifier in self.__serving or identifier in self.__stalled
+
     def add_guest(self, identifier: ID):
-        self.guests.append(identifier)
+        with self.__condition:
+            self.__stalled.discard(identifier)
+            if identifier not in self.__arrivals:
+                self.__arrivals[identifier] = time.time()
+            if identifier in self.__serving:
+                # serve it again after this turn
+                self.__returned.add(identifier)
+                return
+            if identifier in self.__guests:
+                # already waiting
+                return
+            self.__guests.add(identifier)
+            self.__queue.append(identifier)
+            self.__condition.notify()
+
+    def stop(self):
+        with self.__condition:
+            self.__condition.notify_all()
+
+    def __next_guest(self) -> ID:
+        with self.__condition:
+            while len(self.__queue) == 0:
+                if not self.station.running:
+                    return None
+                self.__condition.wait(timeout=self.IDLE_TIMEOUT)
+            identifier = self.__queue.popleft()
+            self.__guests.discard(identifier)
+            self.__serving.add(identifier)
+            return identifier
+
+    def __finish_turn(self, identifier: ID, more: bool, stalled: bool=False):
+        with self.__condition:
+            self.__serving.discard(identifier)
+            if identifier in self.__returned:
+                self.__returned.discard(identifier)
+                more = True
+            elif stalled:
+                # wait for outbox drained
+                self.__stalled.add(identifier)
+            if more:
+                # add it to the tail for next batch
+                self.__guests.add(identifier)
+                self.__queue.append(identifier)
+                self.__condition.notify()
+            else:
+                self.__arrivals.pop(identifier, None)
+
+    def __pushed(self, count: int, elapsed: float):
+        with self.__condition:
+            self.pushed += count
+            self.batches += 1
+            self.busy_time += elapsed
+
+    def __emptied(self, identifier: ID):
+        with self.__condition:
+            arrival = self.__arrivals.pop(identifier, None)
+            if arrival is None:
+                return
+            elapsed = time.time() - arrival
+            self.emptied += 1
+            self.last_empty_time = elapsed
+            self.max_empty_time = max(self.max_empty_time, elapsed)
+            self.__total_empty_time += elapsed
 
     def run(self):
-        self.info('starting...')
+        self.info('starting %d worker(s)...' % self.workers)
+        threads = [Thread(target=self.__serve) for _ in range(self.workers - 1)]
+        for thread in threads:
+            thread.start()
+        self.__serve()
+        for thread in threads:
+            thread.join()
+        self.info('exit! %s' % self)
+
+    def __serve(self):
         while self.station.running:
+            identifier = self.__next_guest()
+            if identifier is None:
+                break
+            more = False
+            stalled = False
             try:
-                guests = self.guests.copy()
-                for identifier in guests:
-                    # 1. get all sessions of the receiver
-                    self.info('checking session for new guest %s' % identifier)
-                    sessions = self.session_server.all(identifier=identifier)
-                    if sessions is None or len(sessions) == 0:
-                        self.info('guest not connect, remove it: %s' % identifier)
-                        self.guests.remove(identifier)
-                        continue
-                    # 2. this guest is connected, scan new messages for it
-                    self.info('%s is connected, scanning messages for it' % identifier)
-                    batch = self.database.load_message_batch(identifier)
-                    if batch is None:
-                        self.info('no message for this guest, remove it: %s' % identifier)
-                        self.guests.remove(identifier)
-                        self.apns.clear_badge(identifier=identifier)
-                        continue
-                    messages = batch.get('messages')
-                    if messages is None or len(messages) == 0:
-                        self.error('message batch error: %s' % batch)
-                        # raise AssertionError('message batch error: %s' % batch)
-                        continue
-                    # 3. send new messages to each session
-                    self.info('got %d message(s) for %s' % (len(messages), identifier))
-                    count = 0
-                    for msg in messages:
-                        # try to push message
-                        success = 0
-                        for sess in sessions:
-                            if sess.valid is False or sess.active is False:
-                                # self.info('session invalid %s' % sess)
-                                continue
-                            request_handler = self.session_server.get_handler(client_address=sess.client_address)
-                            if request_handler is None:
-                                self.error('handler lost: %s' % sess)
-                                continue
-                            if request_handler.push_message(msg):
-                                success = success + 1
-                            else:
-                                self.error('failed to push message (%s, %s)' % sess.client_address)
-                        if success > 0:
-                            # push message success (at least one)
-                            count = count + 1
-                        else:
-                            # push message failed, remove session here?
-                            break
-                    # 4. remove messages after success, or remove the guest on failed
-                    total_count = len(messages)
-                    self.info('a batch message(%d/%d) pushed to %s' % (count, total_count, identifier))
-                    self.database.remove_message_batch(batch, removed_count=count)
-                    if count < total_count:
-                        self.error('pushing message failed, remove the guest: %s' % identifier)
-                        self.guests.remove(identifier)
+                more, stalled = self.__receive(identifier=identifier)
             except IOError as error:
                 self.error('IO error %s' % error)
             except JSONDecodeError as error:
@@ -128,6 +217,59 @@ class Receptionist(Thread):
             except ValueError as error:
                 self.error('value error %s' % error)
             finally:
-                # sleep for next loop
-                time.sleep(0.01)
-        self.info('exit!')
+                self.__finish_turn(identifier=identifier, more=more, stalled=stalled)
+
+    def __receive(self, identifier: ID) -> (bool, bool):
+        """
+        Push one batch of new messages to the guest
+
+        :return: (more, stalled) - True if the guest still connected and there are more messages,
+                                   True if pushing failed with messages left
+        """
+        # 1. get connections of the activated sessions
+        self.info('checking session for new guest %s' % identifier)
+        handlers = self.session_server.active_handlers(identifier=identifier)
+        if len(handlers) == 0:
+            self.info('guest not connect (or in background), remove it: %s' % identifier)
+            return False, False
+        # 2. this guest is connected, scan new messages for it
+        self.info('%s is connected, scanning messages for it' % identifier)
+        start = time.time()
+        batch = self.database.load_message_batch(identifier, limit=self.batch_size)
+        if batch is None:
+            self.__emptied(identifier=identifier)
+            self.info('no message for this guest, remove it: %s %s' % (identifier, self))
+            self.apns.clear_badge(identifier=identifier)
+            return False, False
+        messages = batch.get('messages')
+        if messages is None or len(messages) == 0:
+            self.error('message batch error: %s' % batch)
+            # raise AssertionError('message batch error: %s' % batch)
+            return False, False
+        # 3. send new messages to each session
+        self.info('got %d message(s) for %s' % (len(messages), identifier))
+        count = 0
+        for msg in messages:
+            # try to push message
+            success = 0
+            for request_handler in handlers:
+                if request_handler.push_message(msg):
+                    success = success + 1
+                else:
+                    self.error('failed to push message (%s, %s)' % request_handler.client_address)
+            if success > 0:
+                # push message success (at least one)
+                count = count + 1
+            else:
+                # push message failed, remove session here?
+                break
+        # 4. remove messages after success, or remove the guest on failed
+        self.__pushed(count=count, elapsed=time.time() - start)
+        total_count = len(messages)
+        self.info('a batch message(%d/%d) pushed to %s' % (count, total_count, identifier))
+        if count > 0:
+            self.database.remove_message_batch(batch, removed_count=count)
+        if count < total_count:
+            self.error('pushing message failed, wait for outbox drained: %s' % identifier)
+            return False, True
+        return True, False
@@ -29,8 +29,13 @@
     ~~~~~~~~~~~
 
     DIM network server node
+
+    usage: start.py [--asyncio]
+        --asyncio   serve all connections on one event loop instead of threads
 """
 
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from socketserver import TCPServer, ThreadingTCPServer
 
 import sys
@@ -44,24 +49,54 @@ sys.path.append(os.path.join(rootPath, 'libs'))
 from libs.common import Log
 
 from station.handler import RequestHandler
+from station.protocol import StationProtocol
+
+from station.config import g_receptionist, g_pusher, g_relay, current_station
+
+
+def start_threading_server(host: str, port: int):
+    """ One thread for each connection """
+    TCPServer.allow_reuse_address = True
+    server = ThreadingTCPServer(server_address=(host, port), RequestHandlerClass=RequestHandler)
+    Log.info('server (%s:%s) is listening...' % (host, port))
+    server.serve_forever()
 
-from station.config import g_receptionist, current_station
+
+def start_asyncio_server(host: str, port: int, max_workers: int=None):
+    """ All connections on one event loop, processing messages in thread pool """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    coroutine = loop.create_server(lambda: StationProtocol(loop=loop, executor=executor),
+                                   host=host, port=port, reuse_address=True)
+    server = loop.run_until_complete(coroutine)
+    Log.info('server (%s:%s) is listening on event loop...' % (host, port))
+    try:
+        loop.run_forever()
+    finally:
+        server.close()
+        loop.run_until_complete(server.wait_closed())
+        executor.shutdown(wait=False)
+        loop.close()
 
 
 if __name__ == '__main__':
 
     current_station.running = True
+    g_pusher.start()
     g_receptionist.start()
 
     # start TCP Server
     try:
-        TCPServer.allow_reuse_address = True
-        server = ThreadingTCPServer(server_address=(current_station.host, current_station.port),
-                                    RequestHandlerClass=RequestHandler)
-        Log.info('server (%s:%s) is listening...' % (current_station.host, current_station.port))
-        server.serve_forever()
+        if '--asyncio' in sys.argv:
+            start_asyncio_server(host=current_station.host, port=current_station.port)
+        else:
+            start_threading_server(host=current_station.host, port=current_station.port)
     except KeyboardInterrupt as ex:
         Log.info('~~~~~~~~ %s' % ex)
     finally:
         current_station.running = False
+        g_receptionist.stop()
+        g_pusher.stop()
+        g_relay.stop()
         Log.info('======== station shutdown!')
@@ -0,0 +1,106 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Benchmark for Storage Backends
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Reading meta & profile records of accounts from files and SQLite:
+
+        cold - first reading with a new backend (new connection for SQLite),
+               the OS page cache is not dropped, so it's 'cold' for the
+               process only
+        warm - reading all records again
+
+    usage: bench_backend.py [accounts]
+"""
+
+import json
+import random
+import shutil
+import tempfile
+import time
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.common.database.backend import FileBackend, SQLiteBackend, migrate
+
+
+def create_records(root: str, count: int) -> list:
+    paths = []
+    batch = {}
+    files = FileBackend()
+    for index in range(count):
+        address = 'address%08d' % index
+        meta = {'version': 1, 'seed': 'user%d' % index, 'key': {'data': 'x' * 300}, 'fingerprint': 'y' * 344}
+        profile = {'ID': 'user%d@%s' % (index, address), 'data': json.dumps({'name': 'User %d' % index}),
+                   'signature': 'z' * 344}
+        for filename, info in [('meta.js', meta), ('profile.js', profile)]:
+            path = os.path.join(root, 'public', address, filename)
+            batch[path] = json.dumps(info).encode('utf-8')
+            paths.append(path)
+        if len(batch) >= 1024:
+            files.write_batch(batch=batch)
+            batch = {}
+    if len(batch) > 0:
+        files.write_batch(batch=batch)
+    return paths
+
+
+def read_all(name: str, backend, paths: list):
+    start = time.time()
+    for path in paths:
+        assert backend.read(path=path) is not None, 'failed to read: %s' % path
+    elapsed = time.time() - start
+    print('    %-12s %8.3f s, %10.0f reads/s' % (name, elapsed, len(paths) / elapsed))
+
+
+def main(count: int):
+    print('---- %d accounts' % count)
+    root = tempfile.mkdtemp()
+    try:
+        paths = create_records(root=root, count=count)
+        random.shuffle(paths)
+        start = time.time()
+        copied = migrate(source=FileBackend(), target=SQLiteBackend(root=root), root=root)
+        print('    migrated %d records in %.3f s' % (copied, time.time() - start))
+        read_all(name='file cold', backend=FileBackend(), paths=paths)
+        read_all(name='file warm', backend=FileBackend(), paths=paths)
+        database = SQLiteBackend(root=root)
+        read_all(name='sqlite cold', backend=database, paths=paths)
+        read_all(name='sqlite warm', backend=database, paths=paths)
+        database.close()
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main(count=int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
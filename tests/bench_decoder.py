@@ -0,0 +1,135 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Frame Decoder Benchmark
+    ~~~~~~~~~~~~~~~~~~~~~~~
+
+    Throughput of splitting pipelined packages (1 KB, 64 KB, 1 MB),
+    received in 1024 bytes parts, comparing the old splitting in
+    'RequestHandler.handle' with 'FrameDecoder'
+
+    usage: bench_decoder.py [total_megabytes]
+"""
+
+import time
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from dimsdk import NetMsgHead, NetMsg
+
+from libs.common import FrameDecoder
+
+
+PART_SIZE = 1024
+
+
+def raw_package(size: int) -> bytes:
+    prefix = b'{"data": "'
+    suffix = b'"}\n'
+    return prefix + b'x' * (size - len(prefix) - len(suffix)) + suffix
+
+
+def mars_package(size: int) -> bytes:
+    body = raw_package(size=size - 20)
+    return NetMsg(cmd=3, seq=1, body=body)
+
+
+def legacy_split(stream: bytes) -> int:
+    """ the old way: 'data += part' and 'data = data[pack_len:]' """
+    count = 0
+    data = b''
+    pos = 0
+    while pos < len(stream):
+        part = stream[pos:pos+PART_SIZE]
+        pos += PART_SIZE
+        data += part
+        while len(data) > 0:
+            try:
+                head = NetMsgHead(data=data)
+                mars = head.version == 200
+            except ValueError:
+                mars = False
+            if mars:
+                pack_len = head.head_length + head.body_length
+                if pack_len > len(data):
+                    break
+                pack = data[:pack_len]
+                data = data[pack_len:]
+                count += len(pack) > 0
+                continue
+            if data.startswith(b'{"') and data.find(b'\0') < 0:
+                end = data.find(b'\n')
+                if end < 0:
+                    break
+                pack = data[:end+1]
+                data = data[end+1:]
+                count += len(pack) > 0
+                continue
+            raise AssertionError('unknown protocol')
+    return count
+
+
+def decoder_split(stream: bytes) -> int:
+    count = 0
+    decoder = FrameDecoder()
+    view = memoryview(stream)
+    pos = 0
+    while pos < len(stream):
+        decoder.feed(view[pos:pos+PART_SIZE])
+        pos += PART_SIZE
+        for _ in decoder:
+            count += 1
+    return count
+
+
+def bench(name: str, func, stream: bytes, expected: int):
+    start = time.time()
+    count = func(stream)
+    elapsed = time.time() - start
+    assert count == expected, 'package count error: %d, %d' % (count, expected)
+    speed = len(stream) / elapsed / (1024 * 1024)
+    print('    %-8s %8.3f s, %10.2f MB/s' % (name, elapsed, speed))
+
+
+def main(total: int):
+    for size in [1024, 64 * 1024, 1024 * 1024]:
+        count = max(1, total // size)
+        for protocol, pack in [('raw', raw_package(size)), ('mars', mars_package(size))]:
+            stream = pack * count
+            print('---- %d x %d bytes (%s), %d bytes in total' % (count, size, protocol, len(stream)))
+            bench(name='legacy', func=legacy_split, stream=stream, expected=count)
+            bench(name='decoder', func=decoder_split, stream=stream, expected=count)
+
+
+if __name__ == '__main__':
+    megabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 8
+    main(total=megabytes * 1024 * 1024)
@@ -0,0 +1,119 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Benchmark for Message Table
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Throughput of storing, checking and loading (then removing) offline
+    messages for one receiver with 1k, 100k and 1M messages queued
+
+    usage: bench_messages.py [count ...]
+"""
+
+import contextlib
+import shutil
+import tempfile
+import time
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from dimp import ID, ReliableMessage
+
+from libs.common import Database
+
+
+SENDER = ID('moky@4DnqXWdTV8wuZgfqSCX9GjE2kNq7HJrUgQ')
+RECEIVER = ID('gsp-s001@x5Zh9ixt8ECr59XLye1y5WWfaX4fcoaaSC')
+
+
+def create_message(index: int) -> ReliableMessage:
+    return ReliableMessage({
+        'sender': SENDER,
+        'receiver': RECEIVER,
+        'time': 1560000000 + index,
+        'data': 'x' * 128,
+        'signature': 'sig%010d' % index,
+    })
+
+
+def report(name: str, count: int, elapsed: float):
+    print('    %-8s %8.3f s, %10.0f msg/s' % (name, elapsed, count / elapsed))
+
+
+def bench(count: int):
+    # logs from tables are discarded
+    quiet = contextlib.redirect_stdout(open(os.devnull, 'w'))
+    database = Database()
+    database.base_dir = tempfile.mkdtemp(prefix='bench_messages_')
+    try:
+        messages = [create_message(index=index) for index in range(count)]
+        print('---- %d message(s)' % count)
+        # store
+        start = time.time()
+        with quiet:
+            for msg in messages:
+                database.store_message(msg=msg)
+        report(name='store', count=count, elapsed=time.time() - start)
+        print('    index memory: %d bytes' % database.message_index_memory())
+        # check duplicated
+        start = time.time()
+        with quiet:
+            for msg in messages[:1000]:
+                assert not database.store_message(msg=msg), 'duplicated message stored'
+        report(name='dedup', count=min(count, 1000), elapsed=time.time() - start)
+        # load & remove
+        start = time.time()
+        loaded = 0
+        with quiet:
+            while True:
+                batch = database.load_message_batch(receiver=RECEIVER)
+                if batch is None:
+                    break
+                total = len(batch.get('messages'))
+                database.remove_message_batch(batch=batch, removed_count=total)
+                loaded += total
+        report(name='load', count=loaded, elapsed=time.time() - start)
+        assert loaded == count, 'message count error: %d, %d' % (loaded, count)
+    finally:
+        shutil.rmtree(database.base_dir, ignore_errors=True)
+
+
+def main(counts: list):
+    for count in counts:
+        bench(count=count)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        main(counts=[int(item) for item in sys.argv[1:]])
+    else:
+        main(counts=[1000, 100000, 1000000])
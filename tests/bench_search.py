@@ -0,0 +1,107 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Benchmark for Search Index
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Building time, memory and search latency of the search index with
+    1,000,000 accounts (random names, numbers and nicknames)
+
+    usage: bench_search.py [accounts] [queries]
+"""
+
+import random
+import resource
+import string
+import time
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.common.database.search_index import SearchIndex
+
+
+SYLLABLES = ['ka', 'mo', 'ky', 'li', 'ng', 'xi', 'ao', 'hu', 'lk', 'ba', 'lo', 'su', 'ne', 'ta', 'ri']
+
+
+def random_word(count: int) -> str:
+    return ''.join([random.choice(SYLLABLES) for _ in range(count)])
+
+
+def create_accounts(count: int) -> list:
+    accounts = []
+    for index in range(count):
+        name = '%s%d' % (random_word(random.randint(2, 4)), index % 1000)
+        number = '%010d' % random.randrange(4000000000)
+        nickname = '%s %s' % (random_word(2).title(), random_word(3).title())
+        address = ''.join(random.choice(string.ascii_letters + string.digits) for _ in range(34))
+        accounts.append(('%s@%s' % (name, address), name, number, nickname))
+    return accounts
+
+
+def bench(name: str, index: SearchIndex, queries: list):
+    found = 0
+    worst = 0.0
+    start = time.time()
+    for keywords in queries:
+        begin = time.time()
+        found += len(index.search(keywords=keywords))
+        worst = max(worst, time.time() - begin)
+    elapsed = time.time() - start
+    print('    %-10s %8.3f ms/query, worst %8.3f ms, %5.1f results/query'
+          % (name, elapsed * 1000 / len(queries), worst * 1000, found / len(queries)))
+
+
+def main(count: int, queries: int):
+    print('---- %d accounts, %d queries' % (count, queries))
+    accounts = create_accounts(count=count)
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    index = SearchIndex()
+    start = time.time()
+    for identifier, name, number, nickname in accounts:
+        index.update(identifier=identifier, name=name, number=number, nickname=nickname)
+    elapsed = time.time() - start
+    memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+    print('    build %8.3f s, memory %8.1f MB, %s' % (elapsed, memory / 1024, index))
+    samples = random.sample(accounts, queries)
+    bench(name='number', index=index, queries=[[item[2]] for item in samples])
+    bench(name='part num', index=index, queries=[[item[2][2:7]] for item in samples])
+    bench(name='name', index=index, queries=[[item[1]] for item in samples])
+    bench(name='nickname', index=index, queries=[item[3].split(' ') for item in samples])
+    bench(name='syllable', index=index, queries=[[random.choice(SYLLABLES)] for _ in samples])
+    bench(name='char', index=index, queries=[[random.choice(string.ascii_lowercase)] for _ in samples])
+    bench(name='not found', index=index, queries=[['zzq%d' % i] for i in range(queries)])
+    bench(name='ID', index=index, queries=[[item[0]] for item in samples])
+
+
+if __name__ == '__main__':
+    main(count=int(sys.argv[1]) if len(sys.argv) > 1 else 1000000,
+         queries=int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
@@ -0,0 +1,138 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Benchmark for Session Server
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Lookups per second of the request handlers of activated sessions with
+    100,000 sessions, comparing walking the sessions of 'dimsdk.SessionServer'
+    with the online index; and picking 20 random online users
+
+    usage: bench_sessions.py [sessions] [lookups]
+"""
+
+import random
+import time
+from weakref import WeakValueDictionary
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from dimsdk import SessionServer as Server
+
+from libs.server import SessionServer
+
+
+class FakeHandler:
+
+    def __init__(self, client_address):
+        super().__init__()
+        self.client_address = client_address
+
+
+def user_id(index: int) -> str:
+    return 'user-%d@4DnqXWdTV8wuZgfqSCX9GjE2kNq7HJrUgQ' % index
+
+
+def walk_handlers(server: Server, handlers: dict, identifier: str) -> list:
+    """ the old way: walk all sessions of the user, then get handlers """
+    array = []
+    sessions = server.all(identifier)
+    if sessions is None:
+        return array
+    for sess in sessions:
+        if sess.valid is False or sess.active is False:
+            continue
+        request_handler = handlers.get(sess.client_address)
+        if request_handler is not None:
+            array.append(request_handler)
+    return array
+
+
+def fill(server: Server, handlers: list, count: int):
+    """ 2 sessions per user, 3/4 of the users activated """
+    for index in range(count):
+        handler = handlers[index]
+        session = server.new(identifier=user_id(index // 2), client_address=handler.client_address)
+        session.valid = index % 8 < 6
+        if isinstance(server, SessionServer):
+            server.update(session=session)
+
+
+def bench(name: str, func, users: list) -> int:
+    found = 0
+    start = time.time()
+    for identifier in users:
+        found += len(func(identifier))
+    elapsed = time.time() - start
+    print('    %-12s %8.3f s, %10d lookups/s' % (name, elapsed, len(users) / elapsed))
+    return found
+
+
+def main(count: int, lookups: int):
+    handlers = [FakeHandler(client_address=('10.0.%d.%d' % (index // 65536, index // 256 % 256), index % 256))
+                for index in range(count)]
+    users = [user_id(random.randrange(count // 2 + 100)) for _ in range(lookups)]
+    print('---- %d sessions, %d lookups' % (count, lookups))
+    # dimsdk
+    old = Server()
+    weak = WeakValueDictionary()
+    for handler in handlers:
+        weak[handler.client_address] = handler
+    fill(server=old, handlers=handlers, count=count)
+    found1 = bench(name='walk', func=lambda identifier: walk_handlers(old, weak, identifier), users=users)
+    start = time.time()
+    online1 = len(old.online_users())
+    print('    %-12s %8.3f s, %d users' % ('online(walk)', time.time() - start, online1))
+    # indexed
+    server = SessionServer()
+    for handler in handlers:
+        server.set_handler(client_address=handler.client_address, request_handler=handler)
+    fill(server=server, handlers=handlers, count=count)
+    found2 = bench(name='index', func=lambda identifier: server.active_handlers(identifier=identifier), users=users)
+    start = time.time()
+    online2 = len(server.online_users())
+    print('    %-12s %8.3f s, %d users' % ('online(index)', time.time() - start, online2))
+    start = time.time()
+    for _ in range(1000):
+        random.sample(old.online_users(), 20)
+    print('    %-12s %8.3f ms/request' % ('random(walk)', time.time() - start))
+    start = time.time()
+    for _ in range(1000):
+        server.random_users(max_count=20, exclude=users[0])
+    print('    %-12s %8.3f ms/request' % ('random(index)', time.time() - start))
+    assert found1 == found2, 'handlers not match: %d, %d' % (found1, found2)
+    assert online1 == online2, 'online users not match: %d, %d' % (online1, online2)
+
+
+if __name__ == '__main__':
+    main(count=int(sys.argv[1]) if len(sys.argv) > 1 else 100000,
+         lookups=int(sys.argv[2]) if len(sys.argv) > 2 else 1000000)
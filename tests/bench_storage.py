@@ -0,0 +1,102 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Benchmark for Storage Writer
+    ~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Writes per second of the hot files (contacts, device tokens, ...):
+
+        in place   - truncate and rewrite (the old way)
+        atomic     - temporary file + fsync + rename for each writing
+        behind     - write-behind queue, group commit every window
+
+    usage: bench_storage.py [writes] [files] [window]
+"""
+
+import random
+import shutil
+import tempfile
+import time
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.common.database.backend import atomic_write
+from libs.common.database.writer import StorageWriter
+
+
+def write_in_place(data: bytes, path: str):
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    with open(path, 'wb') as file:
+        file.write(data)
+
+
+def report(name: str, count: int, elapsed: float):
+    print('    %-10s %8.3f s, %10.0f writes/s' % (name, elapsed, count / elapsed))
+
+
+def main(count: int, files: int, window: float):
+    print('---- %d writes into %d files, window: %.3f s' % (count, files, window))
+    root = tempfile.mkdtemp()
+    try:
+        paths = [os.path.join(root, 'protected', 'address%d' % index, 'contacts.txt') for index in range(files)]
+        jobs = [(random.choice(paths), ('contact %d\n' % index).encode('utf-8') * 32) for index in range(count)]
+        # in place
+        start = time.time()
+        for path, data in jobs:
+            write_in_place(data=data, path=path)
+        report(name='in place', count=count, elapsed=time.time() - start)
+        # atomic
+        start = time.time()
+        for path, data in jobs:
+            atomic_write(data=data, path=path, sync=True)
+        report(name='atomic', count=count, elapsed=time.time() - start)
+        # write behind
+        writer = StorageWriter(window=window)
+        writer.start()
+        start = time.time()
+        for path, data in jobs:
+            writer.write(data=data, path=path)
+        queued = time.time() - start
+        writer.flush()
+        report(name='behind', count=count, elapsed=time.time() - start)
+        print('    (queued in %.3f s) %s' % (queued, writer))
+        writer.stop()
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main(count=int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+         files=int(sys.argv[2]) if len(sys.argv) > 2 else 1000,
+         window=float(sys.argv[3]) if len(sys.argv) > 3 else 0.5)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Local Station
+    ~~~~~~~~~~~~~
+
+    Stations on localhost with fake dispatcher/messenger, for relay tests
+"""
+
+import socket
+import threading
+import time
+from socketserver import ThreadingTCPServer, BaseRequestHandler
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from dimp import ID, ReliableMessage
+
+from libs.common import FrameDecoder
+from libs.server import Relay
+from libs.server.broadcast import Broadcaster
+
+
+SID1 = ID('gsp-s001@x5Zh9ixt8ECr59XLye1y5WWfaX4fcoaaSC')
+SID2 = ID('gsp-s002@wpjUWg1oYDnkHh74tHQFPxii6q9j3ymnyW')
+SID3 = ID('gsp-s001@x77uVYBT1G48CLzW9iwe2dr5jhUNEM772G')
+MOKY = ID('moky@4DnqXWdTV8wuZgfqSCX9GjE2kNq7HJrUgQ')
+HULK = 'hulk@4YeVEN3aUnvC1DNUufCq1bs9zoBSJTzVEj'
+EVERYONE = 'everyone@everywhere'
+
+
+def create_message(index: int, receiver: str=MOKY) -> ReliableMessage:
+    return ReliableMessage({
+        'sender': HULK,
+        'receiver': receiver,
+        'time': 1560000000 + index,
+        'data': 'message %d' % index,
+        'signature': 'sig%d' % index,
+    })
+
+
+class FakeHandler:
+
+    def __init__(self):
+        super().__init__()
+        self.client_address = ('127.0.0.1', 0)
+        self.received = []
+        self.ok = True
+
+    def push_data(self, body: bytes) -> bool:
+        if self.ok:
+            self.received.append(body)
+        return self.ok
+
+
+class FakeSessionServer:
+
+    def __init__(self, users: list):
+        super().__init__()
+        self.users = users
+
+    def online_users(self) -> list:
+        return list(self.users)
+
+
+class FakeDispatcher:
+    """ Users named '{prefix}{index}', the first 'online' ones have a connection """
+
+    def __init__(self, prefix: str='user', count: int=0, online: int=0):
+        super().__init__()
+        users = ['%s%d@4DnqXWdTV8wuZgfqSCX9GjE2kNq7HJrUgQ' % (prefix, index) for index in range(count)]
+        self.handlers = {identifier: FakeHandler() for identifier in users[:online]}
+        self.session_server = FakeSessionServer(users=users + [HULK])
+        self.relay: Relay = None
+        self.broadcaster = Broadcaster(dispatcher=self)
+        self.messages = []
+
+    def online_handlers(self, receiver: ID) -> list:
+        handler = self.handlers.get(receiver)
+        return [] if handler is None else [handler]
+
+    def deliver_local(self, msg: ReliableMessage, handlers: list=None) -> bool:
+        self.messages.append(msg)
+        return False
+
+    @property
+    def pushed(self) -> int:
+        return sum([len(handler.received) for handler in self.handlers.values()])
+
+
+class FakeMessenger:
+    """ Messages signed 'bad...' fail to verify """
+
+    def __init__(self):
+        super().__init__()
+        self.checked = 0
+
+    def check_relayed(self, msg: ReliableMessage) -> bool:
+        self.checked += 1
+        return not msg['signature'].startswith('bad')
+
+
+class RelayHandler(BaseRequestHandler):
+    """ Raw packages go to 'Relay.process_package()', as the station handler does """
+
+    def handle(self):
+        decoder = FrameDecoder()
+        while True:
+            data = self.request.recv(65536)
+            if len(data) == 0:
+                break
+            decoder.feed(data)
+            for protocol, pack in decoder:
+                if protocol == FrameDecoder.RAW and Relay.is_relay_package(pack):
+                    res = self.server.relay.process_package(pack=pack, address=self.client_address,
+                                                            messenger=self.server.messenger)
+                    self.request.sendall(res + b'\n')
+
+
+class LocalStation:
+
+    def __init__(self, identifier: ID, users: int=0):
+        super().__init__()
+        self.identifier = identifier
+        self.port = free_port()
+        self.dispatcher = FakeDispatcher(prefix='u%s-' % identifier.name, count=users, online=users // 2)
+        self.relay = Relay()
+        self.relay.station = identifier
+        self.relay.dispatcher = self.dispatcher
+        self.dispatcher.relay = self.relay
+        self.messenger = FakeMessenger()
+        self.server: ThreadingTCPServer = None
+
+    def start(self):
+        ThreadingTCPServer.allow_reuse_address = True
+        self.server = ThreadingTCPServer(server_address=('127.0.0.1', self.port), RequestHandlerClass=RelayHandler)
+        self.server.daemon_threads = True
+        self.server.relay = self.relay
+        self.server.messenger = self.messenger
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.relay.stop()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+
+def free_port() -> int:
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def wait(condition, timeout: float=5) -> bool:
+    expired = time.time() + timeout
+    while not condition():
+        if time.time() > expired:
+            return False
+        time.sleep(0.01)
+    return True
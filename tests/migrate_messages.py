@@ -0,0 +1,94 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Migrate Messages
+    ~~~~~~~~~~~~~~~~
+
+    Import offline messages from old version files
+    ('.dim/public/{ADDRESS}/messages/*.msg') into segment logs
+
+    usage: migrate_messages.py [base_dir]
+"""
+
+import json
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from dimp import ID
+
+from libs.common import Database
+
+from etc.cfg_db import base_dir
+
+
+def legacy_receiver(directory: str) -> ID:
+    """ get receiver ID from the first message in old version files """
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith('.msg'):
+            continue
+        with open(os.path.join(directory, filename), 'r') as file:
+            for line in file:
+                line = line.strip()
+                if len(line) == 0:
+                    continue
+                try:
+                    receiver = json.loads(line).get('receiver')
+                except ValueError:
+                    continue
+                if receiver is not None:
+                    return ID(receiver)
+
+
+def migrate(database: Database) -> int:
+    total = 0
+    public = os.path.join(database.base_dir, 'public')
+    if not os.path.exists(public):
+        print('directory not found: %s' % public)
+        return 0
+    for address in sorted(os.listdir(public)):
+        directory = os.path.join(public, address, 'messages')
+        if not os.path.isdir(directory):
+            continue
+        receiver = legacy_receiver(directory=directory)
+        if receiver is None:
+            continue
+        count = database.migrate_messages(receiver=receiver)
+        print('%s: %d message(s) imported' % (receiver, count))
+        total += count
+    return total
+
+
+if __name__ == '__main__':
+    g_database = Database()
+    g_database.base_dir = sys.argv[1] if len(sys.argv) > 1 else base_dir
+    print('migrating messages in %s' % g_database.base_dir)
+    print('total %d message(s) imported' % migrate(database=g_database))
@@ -0,0 +1,68 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+
+"""
+    Migrate Storage
+    ~~~~~~~~~~~~~~~
+
+    Copy records (meta, profiles, contacts, ...) between the storage backends:
+
+        to-sqlite - from files in 'base_dir' into 'base_dir/dim.db'
+        to-file   - from 'base_dir/dim.db' into files in 'base_dir'
+
+    Offline messages and logs are always kept in files.
+    Set 'db_backend' in 'etc/cfg_db.py' after migrated.
+
+    usage: migrate_storage.py to-sqlite|to-file [base_dir]
+"""
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.common.database.backend import FileBackend, SQLiteBackend, migrate
+
+from etc.cfg_db import base_dir
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2 or sys.argv[1] not in ['to-sqlite', 'to-file']:
+        print('usage: migrate_storage.py to-sqlite|to-file [base_dir]')
+        sys.exit(1)
+    root = sys.argv[2] if len(sys.argv) > 2 else base_dir
+    files = FileBackend()
+    database = SQLiteBackend(root=root)
+    if sys.argv[1] == 'to-sqlite':
+        source, target = files, database
+    else:
+        source, target = database, files
+    print('migrating records in %s: %s -> %s' % (root, source, target))
+    print('total %d record(s) copied' % migrate(source=source, target=target, root=root))
+    database.close()
@@ -0,0 +1,109 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Storage Backend Test
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Records in files and SQLite, and migration between them
+"""
+
+import shutil
+import tempfile
+import unittest
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.common.database.backend import FileBackend, SQLiteBackend, migrate
+
+
+class BackendTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.meta = os.path.join(self.root, 'public', 'address1', 'meta.js')
+        self.contacts = os.path.join(self.root, 'protected', 'address1', 'contacts.txt')
+        self.ans = os.path.join(self.root, 'ans.txt')
+        self.message = os.path.join(self.root, 'public', 'address1', 'messages', '0000000001.log')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def check_backend(self, backend):
+        self.assertIsNone(backend.read(path=self.meta))
+        self.assertFalse(backend.exists(path=self.meta))
+        self.assertTrue(backend.write(data=b'{"version": 1}', path=self.meta))
+        self.assertEqual(backend.read(path=self.meta), b'{"version": 1}')
+        self.assertTrue(backend.exists(path=self.meta))
+        self.assertIsNotNone(backend.mtime(path=self.meta))
+        self.assertEqual(list(backend.mtimes(directory=os.path.join(self.root, 'public'), filename='meta.js')),
+                         ['address1'])
+        backend.write_batch(batch={self.contacts: b'moky\n', self.ans: b'moky\tmoky@address1\n'})
+        self.assertTrue(backend.append(data=b'hulk\n', path=self.contacts))
+        self.assertEqual(backend.read(path=self.contacts), b'moky\nhulk\n')
+        self.assertTrue(backend.append(data=b'{}\n', path=self.message))
+        self.assertEqual(len(backend.paths(root=self.root)), 3)
+        self.assertTrue(backend.remove(path=self.meta))
+        self.assertFalse(backend.remove(path=self.meta))
+        self.assertIsNone(backend.read(path=self.meta))
+
+    def test_file(self):
+        print('\n---------------- %s' % self)
+        self.check_backend(backend=FileBackend())
+
+    def test_sqlite(self):
+        print('\n---------------- %s' % self)
+        backend = SQLiteBackend(root=self.root)
+        self.check_backend(backend=backend)
+        # messages are kept in files
+        self.assertTrue(os.path.exists(self.message))
+        self.assertFalse(os.path.exists(self.contacts))
+        backend.close()
+
+    def test_migrate(self):
+        print('\n---------------- %s' % self)
+        files = FileBackend()
+        files.write(data=b'{"version": 1}', path=self.meta)
+        files.write(data=b'moky\n', path=self.contacts)
+        files.append(data=b'{}\n', path=self.message)
+        database = SQLiteBackend(root=self.root)
+        self.assertEqual(migrate(source=files, target=database, root=self.root), 2)
+        self.assertEqual(database.read(path=self.contacts), b'moky\n')
+        # back to files
+        shutil.rmtree(os.path.join(self.root, 'public'))
+        shutil.rmtree(os.path.join(self.root, 'protected'))
+        self.assertEqual(migrate(source=database, target=files, root=self.root), 2)
+        self.assertEqual(files.read(path=self.meta), b'{"version": 1}')
+        database.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,128 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Broadcast Test
+    ~~~~~~~~~~~~~~
+
+    Messages to everyone@everywhere, in one station and along the ring
+"""
+
+import json
+import time
+import unittest
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from dimsdk import Station
+
+from local_station import SID1, SID2, SID3, EVERYONE
+from local_station import FakeDispatcher, LocalStation, create_message, free_port, wait
+
+
+class BroadcastTestCase(unittest.TestCase):
+
+    def test_local(self):
+        print('\n---------------- %s' % self)
+        dispatcher = FakeDispatcher(prefix='user', count=1000, online=600)
+        task = dispatcher.broadcaster.broadcast(msg=create_message(index=1, receiver=EVERYONE))
+        self.assertTrue(task.wait(timeout=5))
+        print(task)
+        # the sender is excluded, offline users are skipped
+        self.assertEqual(task.users, 1000)
+        self.assertEqual(task.chunks, 4)
+        self.assertEqual(task.pushed, 600)
+        self.assertEqual(dispatcher.pushed, 600)
+        self.assertEqual(json.loads(dispatcher.handlers['user0@4DnqXWdTV8wuZgfqSCX9GjE2kNq7HJrUgQ'].received[0]),
+                         create_message(index=1, receiver=EVERYONE))
+        # seen before
+        self.assertIsNone(dispatcher.broadcaster.broadcast(msg=create_message(index=1, receiver=EVERYONE)))
+        self.assertEqual(dispatcher.broadcaster.suppressed, 1)
+        print(dispatcher.broadcaster)
+
+    def test_ring(self):
+        print('\n---------------- %s' % self)
+        stations = [LocalStation(identifier=SID1, users=100),
+                    LocalStation(identifier=SID2, users=200),
+                    LocalStation(identifier=SID3, users=300)]
+        count = len(stations)
+        for pos in range(count):
+            left = stations[pos - 1]
+            right = stations[(pos + 1) % count]
+            stations[pos].relay.neighbors = [Station(identifier=left.identifier, host='127.0.0.1', port=left.port),
+                                             Station(identifier=right.identifier, host='127.0.0.1', port=right.port)]
+            stations[pos].start()
+        try:
+            for index in range(10):
+                stations[0].dispatcher.broadcaster.broadcast(msg=create_message(index=index, receiver=EVERYONE))
+            # every online session received each broadcast exactly once
+            for station in stations:
+                online = len(station.dispatcher.handlers)
+                self.assertTrue(wait(lambda: station.dispatcher.pushed == online * 10))
+            # the message came back along the ring was suppressed
+            self.assertTrue(wait(lambda: sum([station.dispatcher.broadcaster.suppressed for station in stations]) > 0))
+            time.sleep(0.2)
+            for station in stations:
+                self.assertEqual(station.dispatcher.pushed, len(station.dispatcher.handlers) * 10)
+                self.assertEqual(len(station.dispatcher.messages), 0)
+                print(station.dispatcher.broadcaster)
+        finally:
+            for station in stations:
+                station.stop()
+
+    def test_forged(self):
+        print('\n---------------- %s' % self)
+        station = LocalStation(identifier=SID2, users=100)
+        station.relay.neighbors = [Station(identifier=SID1, host='127.0.0.1', port=free_port())]
+        forged = create_message(index=1, receiver=EVERYONE)
+        forged['signature'] = 'bad signature'
+        frame = {'relay': '1.0', 'station': SID1, 'session': 'abc', 'seq': 1, 'seen': [],
+                 'messages': [], 'broadcasts': [forged]}
+        # not from the neighbor's host
+        res = station.relay.received(frame=frame, address=('10.0.0.1', 12345), messenger=station.messenger)
+        self.assertEqual(res, {'relay': 'denied', 'seq': 1})
+        # signature error
+        res = station.relay.received(frame=frame, address=('127.0.0.1', 12345), messenger=station.messenger)
+        self.assertEqual(res, {'relay': 'ack', 'seq': 1})
+        time.sleep(0.1)
+        self.assertEqual(station.dispatcher.broadcaster.running + station.dispatcher.broadcaster.finished, 0)
+        self.assertEqual(station.dispatcher.pushed, 0)
+        self.assertEqual(station.relay.denied, 2)
+        # verified
+        frame['seq'] = 2
+        frame['broadcasts'] = [create_message(index=2, receiver=EVERYONE)]
+        station.relay.received(frame=frame, address=('127.0.0.1', 12345), messenger=station.messenger)
+        self.assertTrue(wait(lambda: station.dispatcher.pushed == len(station.dispatcher.handlers)))
+        station.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Memory Cache Test
+    ~~~~~~~~~~~~~~~~~
+
+    LRU eviction, limits and empty entries of the database caches
+"""
+
+import time
+import unittest
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.common.database.cache import MemoryCache
+
+
+class CacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        MemoryCache.configure(limits={})
+        self.cache = MemoryCache(name='test')
+        self.cache.max_entries = 3
+
+    def test_lru(self):
+        print('\n---------------- %s' % self)
+        cache = self.cache
+        for key in ['a', 'b', 'c']:
+            cache.put(key, key.upper())
+        self.assertEqual(cache.get('a'), 'A')
+        cache.put('d', 'D')
+        # 'b' is the least recently used
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 'A')
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(cache.evictions, 1)
+        self.assertEqual(cache.hits, 2)
+        self.assertEqual(cache.misses, 1)
+        print(cache)
+
+    def test_bytes(self):
+        print('\n---------------- %s' % self)
+        cache = self.cache
+        cache.max_bytes = 1024
+        cache.put('small', 'x')
+        cache.put('big', 'x' * 1000)
+        self.assertIsNone(cache.get('small'))
+        self.assertLessEqual(cache.bytes, 1024 + 100)
+        cache.pop('big')
+        self.assertEqual(cache.bytes, 0)
+
+    def test_empty(self):
+        print('\n---------------- %s' % self)
+        cache = self.cache
+        cache.empty_ttl = 0.1
+        cache.put('none', {}, empty=True)
+        self.assertEqual(cache.get('none'), {})
+        time.sleep(0.2)
+        self.assertIsNone(cache.get('none'))
+        self.assertEqual(cache.expirations, 1)
+
+    def test_configure(self):
+        print('\n---------------- %s' % self)
+        for key in ['a', 'b', 'c']:
+            self.cache.put(key, key)
+        MemoryCache.configure(limits={'test': (1, 1024, 60), 'default': (8, 1024, 60)})
+        self.assertEqual(len(self.cache), 1)
+        self.assertEqual(MemoryCache(name='other').max_entries, 8)
+        MemoryCache.configure(limits={})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Frame Decoder Test
+    ~~~~~~~~~~~~~~~~~~
+
+    Mars/raw/noop packages split or merged in received data
+"""
+
+import unittest
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.common.network.decoder import FrameDecoder, MARS_HEAD, MARS_VERSION
+
+
+def mars(cmd: int, seq: int, body: bytes) -> bytes:
+    return MARS_HEAD.pack(MARS_HEAD.size, MARS_VERSION, cmd, seq, len(body)) + body
+
+
+MARS1 = mars(cmd=3, seq=1, body=b'{"data": "mars 1"}\n')
+MARS2 = mars(cmd=6, seq=2, body=b'')
+RAW1 = b'{"data": "raw 1"}\n'
+RAW2 = b'{"data": "raw 2"}\n'
+
+STREAM = MARS1 + RAW1 + b'\n\n' + MARS2 + RAW2 + b'\n'
+FRAMES = [(FrameDecoder.MARS, MARS1), (FrameDecoder.RAW, RAW1), (FrameDecoder.NOOP, b'\n'),
+          (FrameDecoder.MARS, MARS2), (FrameDecoder.RAW, RAW2), (FrameDecoder.NOOP, b'\n')]
+
+
+class FrameDecoderTestCase(unittest.TestCase):
+
+    def test_merged(self):
+        print('\n---------------- %s' % self)
+        decoder = FrameDecoder()
+        decoder.feed(STREAM * 3)
+        self.assertEqual(list(decoder), FRAMES * 3)
+        self.assertEqual(len(decoder), 0)
+
+    def test_split(self):
+        print('\n---------------- %s' % self)
+        decoder = FrameDecoder()
+        frames = []
+        # one byte each time
+        for pos in range(len(STREAM)):
+            decoder.feed(STREAM[pos:pos+1])
+            frames.extend(decoder)
+        # heartbeats arrived one by one are not merged
+        self.assertEqual([frame for frame in frames if frame[0] != FrameDecoder.NOOP],
+                         [frame for frame in FRAMES if frame[0] != FrameDecoder.NOOP])
+        self.assertEqual(frames.count((FrameDecoder.NOOP, b'\n')), 3)
+        self.assertEqual(len(decoder), 0)
+
+    def test_truncated_head(self):
+        print('\n---------------- %s' % self)
+        decoder = FrameDecoder()
+        # head length starts with zero, wait for the rest
+        decoder.feed(MARS1[:10])
+        self.assertIsNone(decoder.next())
+        self.assertEqual(len(decoder), 10)
+        # head completed, body not
+        decoder.feed(MARS1[10:MARS_HEAD.size + 3])
+        self.assertIsNone(decoder.next())
+        decoder.feed(MARS1[MARS_HEAD.size + 3:] + RAW1[:5])
+        self.assertEqual(decoder.next(), (FrameDecoder.MARS, MARS1))
+        self.assertIsNone(decoder.next())
+        decoder.feed(RAW1[5:])
+        self.assertEqual(decoder.next(), (FrameDecoder.RAW, RAW1))
+        self.assertEqual(len(decoder), 0)
+
+    def test_unknown(self):
+        print('\n---------------- %s' % self)
+        decoder = FrameDecoder()
+        # neither mars head (wrong version) nor JSON
+        decoder.feed(b'\x00\x00\x00\x14' + b'\xff' * 16 + b'garbage\n')
+        protocol, _ = decoder.next()
+        self.assertEqual(protocol, FrameDecoder.UNKNOWN)
+        decoder.feed(RAW1)
+        self.assertEqual(decoder.next(), (FrameDecoder.RAW, RAW1))
+
+    def test_lines(self):
+        print('\n---------------- %s' % self)
+        # client: split by '\n' only
+        decoder = FrameDecoder(mars=False)
+        decoder.feed(RAW1 + b'\n' + b'not json\n' + RAW2[:3])
+        self.assertEqual(list(decoder), [(FrameDecoder.RAW, RAW1), (FrameDecoder.NOOP, b'\n'),
+                                         (FrameDecoder.RAW, b'not json\n')])
+        decoder.feed(RAW2[3:])
+        self.assertEqual(list(decoder), [(FrameDecoder.RAW, RAW2)])
+
+
+if __name__ == '__main__':
+    unittest.main()
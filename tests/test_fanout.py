@@ -0,0 +1,188 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Fan-out Test
+    ~~~~~~~~~~~~
+
+    Group message delivered to online, offline and remote members
+"""
+
+import json
+import unittest
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from dimp import ID, ReliableMessage
+
+from libs.server.fanout import FanOut
+
+from local_station import FakeHandler
+
+
+GROUP = 'Group-1280719982@7oMeWadRw4qat2sL4mTdcQSDAqZSo7LH5G'
+
+
+def member_id(index: int) -> str:
+    return 'member-%d@4DnqXWdTV8wuZgfqSCX9GjE2kNq7HJrUgQ' % index
+
+
+def create_message(members: list) -> ReliableMessage:
+    return ReliableMessage({
+        'sender': 'moky@4DnqXWdTV8wuZgfqSCX9GjE2kNq7HJrUgQ',
+        'receiver': GROUP,
+        'time': 1560000000,
+        'data': 'group message',
+        'keys': {member: 'key-%s' % member for member in members},
+        'signature': 'sig',
+    })
+
+
+class FakeFacebook:
+
+    @staticmethod
+    def identifier(string) -> ID:
+        if string is not None:
+            return ID(string)
+
+
+class FakeDatabase:
+
+    def __init__(self):
+        super().__init__()
+        self.ok = True
+        self.stored = {}
+
+    def store_message_data(self, receiver: ID, data: bytes) -> bool:
+        if self.ok:
+            self.stored[receiver] = json.loads(data)
+        return self.ok
+
+
+class FakeReceptionist:
+
+    def __init__(self):
+        super().__init__()
+        self.guests = set()
+        self.backlog = set()
+
+    def add_guest(self, identifier: ID):
+        self.guests.add(identifier)
+
+    def has_backlog(self, identifier: ID) -> bool:
+        return identifier in self.backlog
+
+
+class FakeDispatcher:
+
+    def __init__(self):
+        super().__init__()
+        self.facebook = FakeFacebook()
+        self.database = FakeDatabase()
+        self.receptionist = FakeReceptionist()
+        self.handlers = {}
+        self.remote = set()
+        self.notified = []
+
+    def online_handlers(self, receiver: ID) -> list:
+        handler = self.handlers.get(receiver)
+        return [] if handler is None else [handler]
+
+    def has_backlog(self, receiver: ID) -> bool:
+        return self.receptionist.has_backlog(identifier=receiver)
+
+    def transmit(self, receiver: ID, data: bytes) -> bool:
+        return receiver in self.remote
+
+    def notify(self, msg: ReliableMessage, receiver: ID=None):
+        self.notified.append(receiver)
+
+
+class FanOutTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.members = [ID(member_id(index=index)) for index in range(10)]
+        self.dispatcher = FakeDispatcher()
+        self.fan_out = FanOut(dispatcher=self.dispatcher)
+
+    def online(self, indexes, ok: bool=True):
+        for index in indexes:
+            handler = FakeHandler()
+            handler.ok = ok
+            self.dispatcher.handlers[self.members[index]] = handler
+
+    def test_delivered(self):
+        print('\n---------------- %s' % self)
+        members = self.members
+        dispatcher = self.dispatcher
+        self.online(indexes=range(0, 4))
+        # pushing failed (outbox full)
+        self.online(indexes=range(4, 6), ok=False)
+        # messages stored before for it
+        self.online(indexes=[6])
+        dispatcher.receptionist.backlog.add(members[6])
+        # in another station
+        dispatcher.remote.add(members[7])
+        msg = create_message(members=members)
+        task = self.fan_out.deliver(msg=msg, members=members)
+        self.assertTrue(task.wait(timeout=5))
+        print(task)
+        self.assertEqual((task.pushed, task.relayed, task.stored, task.failed), (4, 1, 5, 0))
+        for index in range(4):
+            received = json.loads(dispatcher.handlers[members[index]].received[0])
+            self.assertEqual(received['receiver'], members[index])
+            self.assertEqual(received['key'], 'key-%s' % members[index])
+            self.assertEqual(received['group'], GROUP)
+            self.assertNotIn('keys', received)
+        # stored for offline members and the failed ones, the receptionist retries the online ones
+        stored = dispatcher.database.stored
+        self.assertEqual(sorted(stored.keys()), [members[index] for index in [4, 5, 6, 8, 9]])
+        self.assertEqual(stored[members[8]]['key'], 'key-%s' % members[8])
+        self.assertEqual(dispatcher.handlers[members[6]].received, [])
+        self.assertEqual(dispatcher.receptionist.guests, {members[4], members[5], members[6]})
+        self.assertEqual(sorted(dispatcher.notified), [members[index] for index in [4, 5, 6, 8, 9]])
+        print(self.fan_out)
+
+    def test_failed(self):
+        print('\n---------------- %s' % self)
+        members = self.members
+        self.online(indexes=range(0, 5))
+        # storage error
+        self.dispatcher.database.ok = False
+        task = self.fan_out.deliver(msg=create_message(members=members), members=members)
+        self.assertTrue(task.wait(timeout=5))
+        print(task)
+        self.assertEqual((task.pushed, task.relayed, task.stored, task.failed), (5, 0, 0, 5))
+        self.assertEqual((self.fan_out.finished, self.fan_out.failed), (1, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
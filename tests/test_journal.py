@@ -0,0 +1,105 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Change Journal Test
+    ~~~~~~~~~~~~~~~~~~~
+
+    Records changed by one process invalidate the caches of others
+"""
+
+import shutil
+import tempfile
+import time
+import unittest
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.common.database.cache import MemoryCache
+from libs.common.database.journal import ChangeJournal
+
+
+class JournalTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'changes.log')
+        self.received = []
+        self.cache = MemoryCache(name='journal_test')
+        self.watcher = ChangeJournal(path=self.path, callback=self.invalidate, interval=0.05)
+        self.watcher.start()
+        # another process
+        self.writer = ChangeJournal(path=self.path, callback=self.invalidate)
+        self.writer.pid = 'other'
+        time.sleep(0.1)
+
+    def tearDown(self):
+        self.watcher.stop()
+        shutil.rmtree(self.directory)
+
+    def invalidate(self, name: str, key: str):
+        self.received.append(key)
+        MemoryCache.invalidate(name=name, key=key)
+
+    def test_invalidate(self):
+        print('\n---------------- %s' % self)
+        self.cache.put('moky', 'old profile')
+        self.cache.put('hulk', 'profile')
+        self.writer.record(name='journal_test', key='moky')
+        time.sleep(0.2)
+        self.assertIsNone(self.cache.get('moky'))
+        self.assertEqual(self.cache.get('hulk'), 'profile')
+        print(self.watcher)
+
+    def test_own_changes(self):
+        print('\n---------------- %s' % self)
+        self.cache.put('moky', 'profile')
+        self.watcher.record(name='journal_test', key='moky')
+        time.sleep(0.2)
+        self.assertEqual(self.received, [])
+        self.assertEqual(self.cache.get('moky'), 'profile')
+
+    def test_rotate(self):
+        print('\n---------------- %s' % self)
+        self.writer.MAX_SIZE = 100
+        keys = ['user%d' % index for index in range(6)]
+        self.writer.record(name='journal_test', key=keys[0])
+        time.sleep(0.2)
+        # rotated when file larger than 100 bytes
+        for key in keys[1:]:
+            self.writer.record(name='journal_test', key=key)
+        time.sleep(0.2)
+        self.assertTrue(os.path.exists(self.path + '.1'))
+        self.assertEqual(self.received, keys)
+
+
+if __name__ == '__main__':
+    unittest.main()
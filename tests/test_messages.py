@@ -0,0 +1,264 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Message Table Test
+    ~~~~~~~~~~~~~~~~~~
+
+    Segment logs of offline messages for each receiver
+"""
+
+import json
+import shutil
+import tempfile
+import threading
+import unittest
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from dimp import ID, ReliableMessage
+
+from libs.common.database.storage import Storage
+from libs.common.database.message_table import MessageTable
+from libs.common.database.signature_index import SignatureIndex
+
+
+MOKY = ID('moky@4DnqXWdTV8wuZgfqSCX9GjE2kNq7HJrUgQ')
+RECEIVERS = [MOKY,
+             ID('hulk@4YeVEN3aUnvC1DNUufCq1bs9zoBSJTzVEj'),
+             ID('gsp-s001@x5Zh9ixt8ECr59XLye1y5WWfaX4fcoaaSC'),
+             ID('gsp-s002@wpjUWg1oYDnkHh74tHQFPxii6q9j3ymnyW'),
+             ID('gsp-s001@x77uVYBT1G48CLzW9iwe2dr5jhUNEM772G')]
+
+
+def create_message(index: int, receiver: ID=MOKY) -> ReliableMessage:
+    return ReliableMessage({
+        'sender': 'hulk@4YeVEN3aUnvC1DNUufCq1bs9zoBSJTzVEj',
+        'receiver': receiver,
+        'time': 1560000000 + index,
+        'data': 'message %d' % index,
+        'signature': 'sig%d' % index,
+    })
+
+
+def run(target, timeout: float=5):
+    """ Call target in another thread, fail if it doesn't finish in time """
+    result = []
+    thread = threading.Thread(target=lambda: result.append(target()), daemon=True)
+    thread.start()
+    thread.join(timeout=timeout)
+    assert not thread.is_alive(), 'not finished in %.1f seconds (deadlock?)' % timeout
+    return result[0]
+
+
+class MessageTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = Storage.root
+        Storage.root = tempfile.mkdtemp()
+        self.directory = os.path.join(Storage.root, 'public', MOKY.address, 'messages')
+        self.table = MessageTable()
+
+    def tearDown(self):
+        shutil.rmtree(Storage.root)
+        Storage.root = self.root
+
+    def write_legacy(self, filename: str, messages: list):
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, filename), 'w') as file:
+            for msg in messages:
+                file.write(json.dumps(msg) + '\n')
+
+    def test_legacy(self):
+        print('\n---------------- %s' % self)
+        self.write_legacy(filename='20191201_120000.msg', messages=[create_message(index=i) for i in range(3)])
+        # duplicated one in the next file
+        self.write_legacy(filename='20191201_120001.msg', messages=[create_message(index=i) for i in range(2, 5)])
+        batch = run(lambda: self.table.load_message_batch(receiver=MOKY))
+        self.assertEqual([msg['data'] for msg in batch['messages']], ['message %d' % i for i in range(5)])
+        self.assertEqual([name for name in os.listdir(self.directory) if name.endswith('.msg')], [])
+
+    def test_migrate(self):
+        print('\n---------------- %s' % self)
+        self.write_legacy(filename='20191201_120000.msg', messages=[create_message(index=i) for i in range(3)])
+        self.assertEqual(run(lambda: self.table.migrate_messages(receiver=MOKY)), 3)
+        # imported already
+        self.assertEqual(run(lambda: self.table.migrate_messages(receiver=MOKY)), 0)
+        self.assertEqual(len(run(lambda: self.table.load_message_batch(receiver=MOKY))['messages']), 3)
+
+    def segment_files(self) -> list:
+        return sorted([name for name in os.listdir(self.directory) if name.endswith('.log')])
+
+    def test_duplicated(self):
+        print('\n---------------- %s' % self)
+        msg = create_message(index=1)
+        self.assertFalse(self.table.message_exists(msg=msg))
+        self.assertTrue(self.table.store_message(msg=msg))
+        self.assertTrue(self.table.message_exists(msg=msg))
+        self.assertFalse(self.table.store_message(msg=msg))
+        # index rebuilt from segment files after restart
+        table = MessageTable()
+        self.assertTrue(table.message_exists(msg=msg))
+        self.assertFalse(table.store_message(msg=msg))
+        self.assertEqual(len(table.load_message_batch(receiver=MOKY)['messages']), 1)
+
+    def test_rotation(self):
+        print('\n---------------- %s' % self)
+        self.table.SEGMENT_SIZE = 10
+        for i in range(25):
+            self.assertTrue(self.table.store_message(msg=create_message(index=i)))
+        self.assertEqual(self.segment_files(), ['0000000001.log', '0000000002.log', '0000000003.log'])
+        # the last segment is filled after restart
+        table = MessageTable()
+        table.SEGMENT_SIZE = 10
+        for i in range(25, 31):
+            self.assertTrue(table.store_message(msg=create_message(index=i)))
+        self.assertEqual(self.segment_files(), ['0000000001.log', '0000000002.log', '0000000003.log',
+                                                '0000000004.log'])
+        batch = table.load_message_batch(receiver=MOKY, limit=100)
+        self.assertEqual([msg['data'] for msg in batch['messages']], ['message %d' % i for i in range(31)])
+
+    def test_cursor(self):
+        print('\n---------------- %s' % self)
+        self.table.SEGMENT_SIZE = 10
+        for i in range(25):
+            self.table.store_message(msg=create_message(index=i))
+        # page through the segments lazily
+        pages = []
+        cursor = None
+        while True:
+            page = list(self.table.iter_messages(receiver=MOKY, after=cursor, limit=7))
+            if len(page) == 0:
+                break
+            pages.append([msg['data'] for _, msg in page])
+            cursor = page[-1][0]
+        self.assertEqual([len(page) for page in pages], [7, 7, 7, 4])
+        self.assertEqual(sum(pages, []), ['message %d' % i for i in range(25)])
+        # nothing acknowledged yet
+        self.assertEqual(len(list(self.table.iter_messages(receiver=MOKY))), 25)
+
+    def test_ack_restart(self):
+        print('\n---------------- %s' % self)
+        self.table.SEGMENT_SIZE = 10
+        for i in range(25):
+            self.table.store_message(msg=create_message(index=i))
+        cursors = [cursor for cursor, _ in self.table.iter_messages(receiver=MOKY)]
+        self.assertTrue(self.table.ack(receiver=MOKY, cursor=cursors[12]))
+        # the first segment removed after all messages in it read
+        self.assertEqual(self.segment_files(), ['0000000002.log', '0000000003.log'])
+        # read position kept after restart
+        table = MessageTable()
+        table.SEGMENT_SIZE = 10
+        self.assertEqual([msg['data'] for _, msg in table.iter_messages(receiver=MOKY)],
+                         ['message %d' % i for i in range(13, 25)])
+        self.assertTrue(table.ack(receiver=MOKY, cursor=cursors[-1]))
+        self.assertEqual(self.segment_files(), [])
+        self.assertIsNone(table.load_message_batch(receiver=MOKY))
+        # read messages can be stored again
+        self.assertTrue(table.store_message(msg=create_message(index=0)))
+
+    def test_stale_cursor(self):
+        print('\n---------------- %s' % self)
+        self.table.SEGMENT_SIZE = 10
+        for i in range(25):
+            self.table.store_message(msg=create_message(index=i))
+        batch1 = self.table.load_message_batch(receiver=MOKY, limit=5)
+        batch2 = self.table.load_message_batch(receiver=MOKY, limit=15)
+        self.assertTrue(self.table.remove_message_batch(batch=batch2, removed_count=15))
+        # acknowledged by the other batch already
+        self.assertFalse(self.table.ack(receiver=MOKY, cursor=batch1['cursors'][-1]))
+        self.assertFalse(self.table.remove_message_batch(batch=batch1, removed_count=5))
+        self.assertFalse(self.table.ack(receiver=MOKY, cursor=batch2['cursors'][-1]))
+        self.assertEqual([msg['data'] for _, msg in self.table.iter_messages(receiver=MOKY)],
+                         ['message %d' % i for i in range(15, 25)])
+
+    def test_closed(self):
+        print('\n---------------- %s' % self)
+        self.table.MAX_INBOXES = 2
+        for receiver in RECEIVERS:
+            for i in range(3):
+                self.assertTrue(self.table.store_message(msg=create_message(index=i, receiver=receiver)))
+            self.assertLessEqual(self.table.inbox_count(), 2)
+        # the least recently used inboxes closed, loaded again from segment files
+        for receiver in RECEIVERS:
+            self.assertFalse(self.table.store_message(msg=create_message(index=2, receiver=receiver)))
+            batch = self.table.load_message_batch(receiver=receiver)
+            self.assertEqual([msg['data'] for msg in batch['messages']], ['message %d' % i for i in range(3)])
+            self.assertTrue(self.table.remove_message_batch(batch=batch, removed_count=2))
+        self.assertEqual(self.table.inbox_count(), 2)
+        for receiver in RECEIVERS:
+            batch = self.table.load_message_batch(receiver=receiver)
+            self.assertEqual([msg['data'] for msg in batch['messages']], ['message 2'])
+
+    def test_closed_concurrently(self):
+        print('\n---------------- %s' % self)
+        self.table.MAX_INBOXES = 2
+        self.table.SEGMENT_SIZE = 10
+
+        def store(receiver: ID):
+            for i in range(100):
+                self.table.store_message(msg=create_message(index=i, receiver=receiver))
+
+        def store_all():
+            # same messages from 3 threads for each receiver, stored only once
+            threads = [threading.Thread(target=store, args=(receiver,)) for receiver in RECEIVERS * 3]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            return True
+        run(store_all, timeout=30)
+        for receiver in RECEIVERS:
+            batch = self.table.load_message_batch(receiver=receiver, limit=1000)
+            self.assertEqual([msg['data'] for msg in batch['messages']], ['message %d' % i for i in range(100)])
+
+    def test_duplicated_in_segments(self):
+        print('\n---------------- %s' % self)
+        self.table.SEGMENT_SIZE = 10
+        entries = SignatureIndex.MAX_ENTRIES
+        SignatureIndex.MAX_ENTRIES = 4
+        try:
+            for i in range(50):
+                self.assertTrue(self.table.store_message(msg=create_message(index=i)))
+            # evicted from the LRU set, confirmed from the segment files
+            for i in range(50):
+                self.assertFalse(self.table.store_message(msg=create_message(index=i)))
+            # filter of the first segment dropped after read
+            cursors = self.table.load_message_batch(receiver=MOKY, limit=10)['cursors']
+            self.assertTrue(self.table.ack(receiver=MOKY, cursor=cursors[-1]))
+            self.assertTrue(self.table.store_message(msg=create_message(index=0)))
+            self.assertFalse(self.table.store_message(msg=create_message(index=10)))
+        finally:
+            SignatureIndex.MAX_ENTRIES = entries
+
+
+if __name__ == '__main__':
+    unittest.main()
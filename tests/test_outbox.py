@@ -0,0 +1,125 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Outbox Test
+    ~~~~~~~~~~~
+
+    Data failed to send are given back for storing
+"""
+
+import unittest
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.common.network.outbox import Outbox
+
+
+class FakeConnection:
+
+    def __init__(self):
+        super().__init__()
+        self.ok = True
+        self.sent = []
+        self.stored = []
+        self.drained = 0
+
+    def send(self, data: bytes) -> bool:
+        if self.ok:
+            self.sent.append(data)
+        return self.ok
+
+    def store(self, items: list):
+        self.stored.extend(items)
+
+    def drain(self):
+        self.drained += 1
+
+
+class OutboxTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.conn = FakeConnection()
+        self.outbox = Outbox(sender=self.conn.send, failed=self.conn.store)
+
+    def test_sent(self):
+        print('\n---------------- %s' % self)
+        self.outbox.put(data=b'msg1\n', item=b'msg1')
+        self.outbox.put(data=b'msg2\n', item=b'msg2')
+        self.assertTrue(self.outbox.flush())
+        print(self.outbox)
+        self.assertEqual(self.conn.sent, [b'msg1\nmsg2\n'])
+        self.assertEqual(self.conn.stored, [])
+
+    def test_failed(self):
+        print('\n---------------- %s' % self)
+        self.conn.ok = False
+        self.outbox.put(data=b'msg1\n', item=b'msg1')
+        # responses are not stored
+        self.outbox.put(data=b'response\n', force=True)
+        self.outbox.put(data=b'msg2\n', item=b'msg2')
+        self.assertFalse(self.outbox.flush())
+        print(self.outbox)
+        self.assertEqual(self.conn.stored, [b'msg1', b'msg2'])
+        self.assertEqual((self.outbox.sent, self.outbox.lost), (0, 3))
+
+    def test_closed(self):
+        print('\n---------------- %s' % self)
+        self.outbox.pause()
+        self.outbox.put(data=b'msg1\n', item=b'msg1')
+        self.assertTrue(self.outbox.flush())
+        self.assertEqual(self.conn.sent, [])
+        self.assertEqual(self.outbox.close(), 1)
+        self.assertEqual(self.conn.stored, [b'msg1'])
+        self.assertEqual(self.outbox.depth, 0)
+
+    def test_drained(self):
+        print('\n---------------- %s' % self)
+        outbox = Outbox(sender=self.conn.send, high_water_mark=10, low_water_mark=5,
+                        failed=self.conn.store, drained=self.conn.drain)
+        outbox.pause()
+        self.assertTrue(outbox.put(data=b'msg1\n', item=b'msg1'))
+        self.assertTrue(outbox.put(data=b'msg2\n', item=b'msg2'))
+        # above the high-water mark, the caller stores it
+        self.assertFalse(outbox.put(data=b'msg3\n', item=b'msg3'))
+        self.assertEqual(self.conn.drained, 0)
+        outbox.resume()
+        print(outbox)
+        self.assertEqual(self.conn.sent, [b'msg1\nmsg2\n'])
+        self.assertEqual(self.conn.drained, 1)
+        # nothing rejected, not drained again
+        outbox.put(data=b'msg4\n', item=b'msg4')
+        outbox.flush()
+        self.assertEqual(self.conn.drained, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
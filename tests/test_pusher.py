@@ -0,0 +1,184 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Notification Pusher Test
+    ~~~~~~~~~~~~~~~~~~~~~~~~
+
+    Unit test for NotificationPusher with a fake APNs
+"""
+
+import threading
+import time
+import unittest
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.server import NotificationPusher
+from libs.server.pusher import LazyText
+
+
+class FakeAPNs:
+    """ Same interface as ApplePushNotificationService, records pushes """
+
+    def __init__(self, delay: float=0):
+        super().__init__()
+        self.delay = delay
+        self.pushes = []
+        self.badge_table = {}
+        self.lock = threading.Lock()
+
+    def badge(self, identifier: str) -> int:
+        num = self.badge_table.get(identifier, 0) + 1
+        self.badge_table[identifier] = num
+        return num
+
+    def clear_badge(self, identifier: str) -> bool:
+        self.badge_table.pop(identifier, None)
+        return True
+
+    def push(self, identifier: str, message: str) -> bool:
+        time.sleep(self.delay)
+        with self.lock:
+            self.badge(identifier)
+            self.pushes.append((identifier, message))
+        return True
+
+
+class CountingName:
+    """ Display name counting resolutions """
+
+    def __init__(self, name: str):
+        super().__init__()
+        self.name = name
+        self.resolved = 0
+
+    def __str__(self) -> str:
+        self.resolved += 1
+        return self.name
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CountingName) and self.name == other.name
+
+    def __hash__(self) -> int:
+        return hash(self.name)
+
+
+class PusherTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.apns = FakeAPNs()
+        self.pusher = NotificationPusher(service=self.apns)
+        self.pusher.DELAY = 0.1
+        self.pusher.start()
+
+    def tearDown(self):
+        self.pusher.stop()
+        self.pusher.join()
+
+    def wait(self, count: int, timeout: float=5):
+        expired = time.time() + timeout
+        while len(self.apns.pushes) < count and time.time() < expired:
+            time.sleep(0.01)
+
+    def test_coalesce(self):
+        print('\n---------------- %s' % self)
+        for _ in range(3):
+            self.assertTrue(self.pusher.push(identifier='moky', message='hello', sender='Albert'))
+        self.pusher.push(identifier='hulk', message='Dear Hulk: Albert sent you a message', sender='Albert')
+        self.wait(count=2)
+        time.sleep(0.2)
+        print(self.pusher)
+        self.assertEqual(sorted(self.apns.pushes), [('hulk', 'Dear Hulk: Albert sent you a message'),
+                                                    ('moky', '3 new messages from Albert')])
+        self.assertEqual(self.apns.badge_table.get('moky'), 3)
+
+    def test_mixed_senders(self):
+        print('\n---------------- %s' % self)
+        self.pusher.push(identifier='moky', message='hello', sender='Albert')
+        self.pusher.push(identifier='moky', message='hi', sender='Hulk')
+        self.wait(count=1)
+        self.assertEqual(self.apns.pushes, [('moky', '2 new messages')])
+
+    def test_lazy_text(self):
+        print('\n---------------- %s' % self)
+        albert = CountingName('Albert')
+        hulk = CountingName('Hulk')
+        for _ in range(3):
+            self.pusher.push(identifier='moky', message=LazyText('Dear %s: %s sent you a message', hulk, albert),
+                             sender=albert)
+        self.assertEqual(albert.resolved + hulk.resolved, 0)
+        self.wait(count=1)
+        self.assertEqual(self.apns.pushes, [('moky', '3 new messages from Albert')])
+        # coalesced text resolves the sender only once
+        self.assertEqual(albert.resolved, 1)
+        self.assertEqual(hulk.resolved, 0)
+        self.pusher.push(identifier='hulk', message=LazyText('Dear %s: %s sent you a message', hulk, albert),
+                         sender=albert)
+        self.wait(count=2)
+        self.assertEqual(self.apns.pushes[1], ('hulk', 'Dear Hulk: Albert sent you a message'))
+
+    def test_clear_badge(self):
+        print('\n---------------- %s' % self)
+        self.pusher.push(identifier='moky', message='hello')
+        self.pusher.clear_badge(identifier='moky')
+        time.sleep(0.3)
+        self.assertEqual(self.apns.pushes, [])
+
+    def test_not_blocking(self):
+        print('\n---------------- %s' % self)
+        self.apns.delay = 0.5
+        start = time.time()
+        for index in range(100):
+            self.pusher.push(identifier='user%d' % index, message='hello')
+        self.assertLess(time.time() - start, 0.1)
+
+    def test_queue_full(self):
+        print('\n---------------- %s' % self)
+        self.pusher.MAX_PENDING = 2
+        self.assertTrue(self.pusher.push(identifier='moky', message='hello'))
+        self.assertTrue(self.pusher.push(identifier='hulk', message='hello'))
+        self.assertFalse(self.pusher.push(identifier='albert', message='hello'))
+        self.assertTrue(self.pusher.push(identifier='moky', message='hello again'))
+
+    def test_rate_limit(self):
+        print('\n---------------- %s' % self)
+        self.pusher.RATE = 10
+        for index in range(15):
+            self.pusher.push(identifier='user%d' % index, message='hello')
+        time.sleep(0.3)
+        # 10 at once, then 10 per second
+        self.assertLess(len(self.apns.pushes), 15)
+        self.wait(count=15)
+        self.assertEqual(len(self.apns.pushes), 15)
+
+if __name__ == '__main__':
+    unittest.main()
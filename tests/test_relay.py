@@ -0,0 +1,194 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Station Relay Test
+    ~~~~~~~~~~~~~~~~~~
+
+    Two stations on localhost forwarding messages to each other
+"""
+
+import json
+import time
+import unittest
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from dimsdk import Station
+
+from local_station import SID1, SID2, MOKY
+from local_station import LocalStation, create_message, wait
+
+
+class RelayTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.s1 = LocalStation(identifier=SID1)
+        self.s2 = LocalStation(identifier=SID2)
+        self.s1.relay.neighbors = [Station(identifier=SID2, host='127.0.0.1', port=self.s2.port)]
+        self.s2.relay.neighbors = [Station(identifier=SID1, host='127.0.0.1', port=self.s1.port)]
+        self.s1.start()
+        self.s2.start()
+
+    def tearDown(self):
+        self.s1.stop()
+        self.s2.stop()
+
+    def test_relay(self):
+        print('\n---------------- %s' % self)
+        # not seen yet
+        data = json.dumps(create_message(index=0)).encode('utf-8')
+        self.assertFalse(self.s1.relay.transmit(receiver=MOKY, data=data))
+        # moky logged in station 2
+        self.s2.relay.user_seen(user=MOKY)
+        self.assertTrue(wait(lambda: self.s1.relay.routing.lookup(user=MOKY) == SID2))
+        # station 1 forwards messages for moky to station 2
+        for index in range(250):
+            data = json.dumps(create_message(index=index)).encode('utf-8')
+            self.assertTrue(self.s1.relay.transmit(receiver=MOKY, data=data))
+        self.assertTrue(wait(lambda: len(self.s2.dispatcher.messages) == 250))
+        self.assertEqual([msg['data'] for msg in self.s2.dispatcher.messages],
+                         ['message %d' % index for index in range(250)])
+        print(self.s1.relay)
+        link = self.s1.relay.link(station=self.s1.relay.neighbors[0])
+        self.assertLess(link.batches, 250)
+
+    def test_retry(self):
+        print('\n---------------- %s' % self)
+        self.s1.relay.routing.update(user=MOKY, station=SID2)
+        link = self.s1.relay.link(station=self.s1.relay.neighbors[0])
+        link.RETRY_INTERVAL = 0.2
+        # station 2 is down, then come back before retries exhausted
+        self.s2.stop()
+        self.s1.relay.transmit(receiver=MOKY, data=json.dumps(create_message(index=1)).encode('utf-8'))
+        time.sleep(0.1)
+        self.s2.start()
+        self.assertTrue(wait(lambda: len(self.s2.dispatcher.messages) == 1))
+        self.assertGreater(link.retries, 0)
+
+    def test_failed(self):
+        print('\n---------------- %s' % self)
+        self.s1.relay.routing.update(user=MOKY, station=SID2)
+        link = self.s1.relay.link(station=self.s1.relay.neighbors[0])
+        link.RETRY_INTERVAL = 0.01
+        self.s2.stop()
+        self.s1.relay.transmit(receiver=MOKY, data=json.dumps(create_message(index=2)).encode('utf-8'))
+        # stored locally after all retries failed
+        self.assertTrue(wait(lambda: len(self.s1.dispatcher.messages) == 1))
+        self.assertEqual(link.failed, 1)
+
+    def test_batch_window(self):
+        print('\n---------------- %s' % self)
+        self.s1.relay.routing.update(user=MOKY, station=SID2)
+        link = self.s1.relay.link(station=self.s1.relay.neighbors[0])
+        link.BATCH_DELAY = 2.0
+        # messages arriving one by one in the window go in one batch
+        items = [json.dumps(create_message(index=index)).encode('utf-8') for index in range(20)]
+        for data in items:
+            self.s1.relay.transmit(receiver=MOKY, data=data)
+            time.sleep(0.005)
+        self.assertTrue(wait(lambda: len(self.s2.dispatcher.messages) == 20))
+        # counted after the ack received
+        self.assertTrue(wait(lambda: link.sent == 20))
+        self.assertEqual(link.batches, 1)
+
+    def test_duplicated(self):
+        print('\n---------------- %s' % self)
+        address = ('127.0.0.1', 12345)
+        messenger = self.s2.messenger
+        frame = {'relay': '1.0', 'station': SID1, 'session': 'abc', 'seq': 1, 'seen': [],
+                 'messages': [create_message(index=3)]}
+        res = self.s2.relay.received(frame=frame, address=address, messenger=messenger)
+        self.assertEqual(res, {'relay': 'ack', 'seq': 1})
+        res = self.s2.relay.received(frame=frame, address=address, messenger=messenger)
+        self.assertEqual(res, {'relay': 'ack', 'seq': 1})
+        self.assertEqual(len(self.s2.dispatcher.messages), 1)
+
+    def test_sessions(self):
+        print('\n---------------- %s' % self)
+        relay = self.s2.relay
+        address = ('127.0.0.1', 12345)
+        # neighbor restarted many times, only the latest sessions kept
+        for index in range(relay.MAX_SESSIONS + 2):
+            frame = {'relay': '1.0', 'station': SID1, 'session': 's%d' % index, 'seq': 1, 'seen': [],
+                     'messages': [create_message(index=index)]}
+            relay.received(frame=frame, address=address, messenger=self.s2.messenger)
+        self.assertEqual(len(self.s2.dispatcher.messages), relay.MAX_SESSIONS + 2)
+        # the latest session is still checked
+        frame = {'relay': '1.0', 'station': SID1, 'session': 's%d' % (relay.MAX_SESSIONS + 1), 'seq': 1,
+                 'seen': [], 'messages': [create_message(index=0)]}
+        relay.received(frame=frame, address=address, messenger=self.s2.messenger)
+        self.assertEqual(len(self.s2.dispatcher.messages), relay.MAX_SESSIONS + 2)
+        # the oldest session was dropped
+        frame['session'] = 's0'
+        relay.received(frame=frame, address=address, messenger=self.s2.messenger)
+        self.assertEqual(len(self.s2.dispatcher.messages), relay.MAX_SESSIONS + 3)
+
+    def test_denied(self):
+        print('\n---------------- %s' % self)
+        relay = self.s2.relay
+        messenger = self.s2.messenger
+        frame = {'relay': '1.0', 'station': SID1, 'session': 'abc', 'seq': 1, 'seen': [MOKY],
+                 'messages': [create_message(index=4)]}
+        # not from the neighbor's host
+        res = relay.received(frame=frame, address=('10.0.0.1', 12345), messenger=messenger)
+        self.assertEqual(res, {'relay': 'denied', 'seq': 1})
+        # not a neighbor
+        frame['station'] = 'gsp-s003@x77uVYBT1G48CLzW9iwe2dr5jhUNEM772G'
+        res = relay.received(frame=frame, address=('127.0.0.1', 12345), messenger=messenger)
+        self.assertEqual(res, {'relay': 'denied', 'seq': 1})
+        # invalid station ID (address check code error)
+        frame['station'] = 'gsp-s003@2PfTBeBMT2cfPNRwqwrRLzg7mQ1MGGwjbe3'
+        res = relay.received(frame=frame, address=('127.0.0.1', 12345), messenger=messenger)
+        self.assertEqual(res, {'relay': 'denied', 'seq': 1})
+        frame['station'] = 12345
+        res = relay.received(frame=frame, address=('127.0.0.1', 12345), messenger=messenger)
+        self.assertEqual(res, {'relay': 'denied', 'seq': 1})
+        self.assertEqual(relay.denied, 4)
+        self.assertEqual(len(self.s2.dispatcher.messages), 0)
+        self.assertIsNone(relay.routing.lookup(user=MOKY))
+
+    def test_verify(self):
+        print('\n---------------- %s' % self)
+        self.s1.relay.routing.update(user=MOKY, station=SID2)
+        good = create_message(index=5)
+        bad = create_message(index=6)
+        bad['signature'] = 'bad signature'
+        for msg in [bad, good]:
+            self.s1.relay.transmit(receiver=MOKY, data=json.dumps(msg).encode('utf-8'))
+        self.assertTrue(wait(lambda: self.s2.messenger.checked == 2))
+        self.assertTrue(wait(lambda: len(self.s2.dispatcher.messages) == 1))
+        self.assertEqual(self.s2.dispatcher.messages[0]['data'], 'message 5')
+        self.assertEqual(self.s2.relay.denied, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,164 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Session Server Test
+    ~~~~~~~~~~~~~~~~~~~
+
+    Online index of the session registry
+"""
+
+import unittest
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from dimp import ID
+
+from libs.server import SessionServer
+
+
+MOKY = ID('moky@4DnqXWdTV8wuZgfqSCX9GjE2kNq7HJrUgQ')
+HULK = ID('hulk@4YeVEN3aUnvC1DNUufCq1bs9zoBSJTzVEj')
+
+
+class FakeHandler:
+
+    def __init__(self, client_address):
+        super().__init__()
+        self.client_address = client_address
+
+
+class SessionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = SessionServer()
+        self.handlers = [FakeHandler(client_address=('127.0.0.1', 9000 + index)) for index in range(3)]
+        for handler in self.handlers:
+            self.server.set_handler(client_address=handler.client_address, request_handler=handler)
+
+    def login(self, identifier: ID, handler: FakeHandler):
+        session = self.server.new(identifier=identifier, client_address=handler.client_address)
+        session.valid = True
+        session.active = True
+        self.server.update(session=session)
+        return session
+
+    def test_handshake(self):
+        print('\n---------------- %s' % self)
+        # connected, not handshake yet
+        session = self.server.new(identifier=MOKY, client_address=self.handlers[0].client_address)
+        self.assertEqual(self.server.active_handlers(identifier=MOKY), [])
+        self.assertEqual(self.server.online_users(), [])
+        # handshake accepted
+        session.valid = True
+        self.server.update(session=session)
+        self.assertEqual(self.server.active_handlers(identifier=MOKY), [self.handlers[0]])
+        self.assertEqual(self.server.online_users(), [MOKY])
+        self.assertTrue(self.server.is_online(identifier=MOKY))
+        # second device
+        self.login(identifier=MOKY, handler=self.handlers[1])
+        self.assertEqual(len(self.server.active_handlers(identifier=MOKY)), 2)
+        self.assertEqual(self.server.online_users(), [MOKY])
+
+    def test_report(self):
+        print('\n---------------- %s' % self)
+        session = self.login(identifier=MOKY, handler=self.handlers[0])
+        # report offline
+        session.active = False
+        self.server.update(session=session)
+        self.assertEqual(self.server.active_handlers(identifier=MOKY), [])
+        self.assertFalse(self.server.is_online(identifier=MOKY))
+        self.assertEqual(self.server.all_users(), [MOKY])
+        # report online
+        session.active = True
+        self.server.update(session=session)
+        self.assertEqual(self.server.active_handlers(identifier=MOKY), [self.handlers[0]])
+
+    def test_finish(self):
+        print('\n---------------- %s' % self)
+        session = self.login(identifier=MOKY, handler=self.handlers[0])
+        self.login(identifier=HULK, handler=self.handlers[1])
+        # connection finished
+        self.assertTrue(self.server.remove(session=session))
+        self.server.clear_handler(client_address=self.handlers[0].client_address)
+        self.assertIsNone(self.server.all(identifier=MOKY))
+        self.assertEqual(self.server.online_users(), [HULK])
+        # handler cleared before session removed
+        self.server.clear_handler(client_address=self.handlers[1].client_address)
+        self.assertEqual(self.server.online_users(), [])
+        self.assertEqual(len(self.server.all(identifier=HULK)), 1)
+
+    def test_switch(self):
+        print('\n---------------- %s' % self)
+        self.login(identifier=MOKY, handler=self.handlers[0])
+        # another user login on the same connection
+        self.login(identifier=HULK, handler=self.handlers[0])
+        self.assertEqual(self.server.online_users(), [HULK])
+        self.assertEqual(self.server.active_handlers(identifier=MOKY), [])
+
+    def test_random_users(self):
+        print('\n---------------- %s' % self)
+        server = SessionServer()
+        sessions = []
+        for index in range(100):
+            handler = FakeHandler(client_address=('127.0.0.1', 10000 + index))
+            self.handlers.append(handler)
+            server.set_handler(client_address=handler.client_address, request_handler=handler)
+            session = server.new(identifier=ID('user%d@4DnqXWdTV8wuZgfqSCX9GjE2kNq7HJrUgQ' % index),
+                                 client_address=handler.client_address)
+            session.valid = True
+            server.update(session=session)
+            sessions.append(session)
+        # background and logged out users are not chosen
+        for session in sessions[:30]:
+            session.active = False
+            server.update(session=session)
+        for session in sessions[30:60]:
+            server.remove(session=session)
+        online = set([session.identifier for session in sessions[60:]])
+        self.assertEqual(set(server.online_users()), online)
+        requester = sessions[60].identifier
+        chosen = set()
+        for _ in range(100):
+            users = server.random_users(max_count=20, exclude=requester)
+            self.assertEqual(len(users), 20)
+            self.assertEqual(len(set(users)), 20)
+            self.assertNotIn(requester, users)
+            chosen.update(users)
+        self.assertEqual(chosen, online - {requester})
+        # less than max count
+        users = server.random_users(max_count=50, exclude=requester)
+        self.assertEqual(set(users), online - {requester})
+        self.assertEqual(len(server.random_users(max_count=50)), 40)
+
+
+if __name__ == '__main__':
+    unittest.main()
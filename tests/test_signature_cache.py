@@ -0,0 +1,124 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Signature Cache Test
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Verified signatures of reliable messages
+"""
+
+import time
+import unittest
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.common.signature_cache import SignatureCache
+
+
+class Verifier:
+    """ Fake verifier counting calls """
+
+    def __init__(self, result: bool=True):
+        super().__init__()
+        self.result = result
+        self.calls = 0
+
+    def __call__(self) -> bool:
+        self.calls += 1
+        time.sleep(0.001)
+        return self.result
+
+
+class SignatureCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = SignatureCache(max_entries=3, ttl=60)
+
+    def test_hit(self):
+        print('\n---------------- %s' % self)
+        cache = self.cache
+        verifier = Verifier()
+        for _ in range(3):
+            self.assertTrue(cache.verify(sender='moky@abc', data=b'data', signature=b'sig', verifier=verifier))
+        print(cache)
+        self.assertEqual(verifier.calls, 1)
+        self.assertEqual((cache.hits, cache.misses), (2, 1))
+        self.assertGreater(cache.saved_time, 0)
+
+    def test_keys(self):
+        print('\n---------------- %s' % self)
+        cache = self.cache
+        verifier = Verifier()
+        cache.verify(sender='moky@abc', data=b'data', signature=b'sig', verifier=verifier)
+        # same signature from other sender, or for other data
+        cache.verify(sender='hulk@abc', data=b'data', signature=b'sig', verifier=verifier)
+        cache.verify(sender='moky@abc', data=b'other', signature=b'sig', verifier=verifier)
+        self.assertEqual(verifier.calls, 3)
+
+    def test_failure(self):
+        print('\n---------------- %s' % self)
+        cache = self.cache
+        verifier = Verifier(result=False)
+        self.assertFalse(cache.verify(sender='moky@abc', data=b'data', signature=b'bad', verifier=verifier))
+        self.assertFalse(cache.verify(sender='moky@abc', data=b'data', signature=b'bad', verifier=verifier))
+        self.assertEqual(verifier.calls, 2)
+        self.assertEqual(cache.failures, 2)
+        self.assertEqual(len(cache), 0)
+
+    def test_expired(self):
+        print('\n---------------- %s' % self)
+        cache = self.cache
+        cache.ttl = 0.1
+        verifier = Verifier()
+        cache.verify(sender='moky@abc', data=b'data', signature=b'sig', verifier=verifier)
+        cache.verify(sender='moky@abc', data=b'data', signature=b'sig', verifier=verifier)
+        self.assertEqual(verifier.calls, 1)
+        time.sleep(0.2)
+        cache.verify(sender='moky@abc', data=b'data', signature=b'sig', verifier=verifier)
+        self.assertEqual(verifier.calls, 2)
+
+    def test_limit(self):
+        print('\n---------------- %s' % self)
+        cache = self.cache
+        verifier = Verifier()
+        for index in range(5):
+            cache.verify(sender='moky@abc', data=b'%d' % index, signature=b'sig', verifier=verifier)
+        self.assertEqual(len(cache), 3)
+        # the oldest dropped
+        cache.verify(sender='moky@abc', data=b'0', signature=b'sig', verifier=verifier)
+        self.assertEqual(verifier.calls, 6)
+        cache.verify(sender='moky@abc', data=b'4', signature=b'sig', verifier=verifier)
+        self.assertEqual(verifier.calls, 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Signature Index Test
+    ~~~~~~~~~~~~~~~~~~~~
+
+    Bloom filters (one for each segment) for signatures of unread messages
+"""
+
+import unittest
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.common.database.signature_index import SignatureIndex
+
+
+def signature(index: int) -> bytes:
+    return ('sig-%08d' % index).encode('utf-8')
+
+
+class SignatureIndexTestCase(unittest.TestCase):
+
+    def test_add_forget(self):
+        print('\n---------------- %s' % self)
+        index = SignatureIndex(capacity=100)
+        for i in range(1000):
+            index.add(signature(i), segment=i // 100)
+        print(index)
+        self.assertEqual(len(index), 1000)
+        for i in range(1000):
+            self.assertTrue(index.contains(signature(i)))
+        for i in range(0, 1000, 2):
+            index.forget(signature(i))
+        for i in range(1, 1000, 2):
+            self.assertTrue(index.contains(signature(i)))
+        # nothing evicted from the exact LRU set, no false positives
+        for i in range(0, 1000, 2):
+            self.assertFalse(index.contains(signature(i)))
+
+    def test_segments(self):
+        print('\n---------------- %s' % self)
+        index = SignatureIndex(capacity=100)
+        index.MAX_ENTRIES = 0
+        for i in range(1000):
+            index.add(signature(i), segment=i // 100)
+        for i in range(1000):
+            self.assertIsNone(index.contains(signature(i)))
+            self.assertIn(i // 100, index.segments(signature(i)))
+        # filter dropped with the segment
+        index.drop(0)
+        self.assertEqual(len(index), 1000)
+        for i in range(100):
+            self.assertNotIn(0, index.segments(signature(i)))
+        for i in range(1, 10):
+            index.drop(i)
+        self.assertEqual(len(index), 0)
+        for i in range(1000):
+            self.assertFalse(index.contains(signature(i)))
+
+    def test_false_positives(self):
+        print('\n---------------- %s' % self)
+        index = SignatureIndex(capacity=1024)
+        index.MAX_ENTRIES = 0
+        for i in range(100 * 1024):
+            index.add(signature(i), segment=i // 1024)
+        # filters never saturate, however many segments
+        unknown = sum([len(index.segments(signature(i))) for i in range(1000000, 1010000)])
+        print('segments to search: %d / 10000' % unknown)
+        self.assertLess(unknown, 10)
+
+    def test_memory(self):
+        print('\n---------------- %s' % self)
+        index = SignatureIndex(capacity=1024)
+        for i in range(100 * 1024):
+            index.add(signature(i), segment=i // 1024)
+        print(index)
+        bits = 100 * 1024 * SignatureIndex.BITS_PER_ITEM // 8
+        entries = SignatureIndex.MAX_ENTRIES * 256
+        self.assertLess(index.memory, bits + entries + 65536)
+
+
+if __name__ == '__main__':
+    unittest.main()
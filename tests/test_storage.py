@@ -0,0 +1,185 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    Storage Writer Test
+    ~~~~~~~~~~~~~~~~~~~
+
+    Coalescing of the write-behind queue, and crash consistency
+"""
+
+import json
+import random
+import shutil
+import signal
+import subprocess
+import tempfile
+import time
+import unittest
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from libs.common.database.backend import atomic_write, FileBackend
+from libs.common.database.writer import StorageWriter
+
+
+# rewrite a JSON file forever, with the write-behind queue or not
+WRITING_LOOP = '''
+import sys
+sys.path.append(%r)
+from libs.common.database.backend import atomic_write
+from libs.common.database.writer import StorageWriter
+path, window = sys.argv[1], float(sys.argv[2])
+writer = None
+if window > 0:
+    writer = StorageWriter(window=window)
+    writer.start()
+index = 0
+while True:
+    index += 1
+    data = ('{"index": %%d, "padding": "%%s"}' %% (index, 'x' * (index %% 4096))).encode('utf-8')
+    if writer is None:
+        atomic_write(data=data, path=path, sync=False)
+    else:
+        writer.write(data=data, path=path)
+''' % rootPath
+
+
+class FailingBackend(FileBackend):
+    """ Disk full until fixed """
+
+    def __init__(self):
+        super().__init__()
+        self.full = True
+
+    def write_batch(self, batch: dict):
+        if self.full:
+            raise OSError(28, 'No space left on device')
+        super().write_batch(batch=batch)
+
+
+class StorageTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_coalesce(self):
+        print('\n---------------- %s' % self)
+        writer = StorageWriter(window=60)
+        path = os.path.join(self.directory, 'moky', 'contacts.txt')
+        for index in range(100):
+            writer.write(data=b'contact %d\n' % index, path=path)
+        writer.append(data=b'hulk\n', path=path)
+        # pending data can be read before written
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(writer.read(path=path), b'contact 99\nhulk\n')
+        writer.flush()
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), b'contact 99\nhulk\n')
+        self.assertIsNone(writer.read(path=path))
+        self.assertEqual(writer.coalesced, 99)
+        self.assertEqual(writer.files, 1)
+        # appending after written
+        writer.append(data=b'moki\n', path=path)
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), b'contact 99\nhulk\nmoki\n')
+        print(writer)
+
+    def test_defer(self):
+        print('\n---------------- %s' % self)
+        writer = StorageWriter(window=60)
+        path = os.path.join(self.directory, 'profile.js')
+        called = []
+        writer.defer(called.append, 'nothing pending')
+        writer.write(data=b'{}', path=path)
+        writer.defer(called.append, 'written')
+        self.assertEqual(called, ['nothing pending'])
+        writer.flush()
+        self.assertEqual(called, ['nothing pending', 'written'])
+
+    def test_commit_failed(self):
+        print('\n---------------- %s' % self)
+        backend = FailingBackend()
+        writer = StorageWriter(window=60, backend=backend)
+        path = os.path.join(self.directory, 'profile.js')
+        called = []
+        writer.write(data=b'{"v": 1}', path=path)
+        writer.defer(called.append, 'written')
+        self.assertFalse(writer.flush())
+        # kept in queue, readable
+        self.assertEqual(writer.read(path=path), b'{"v": 1}')
+        self.assertEqual(called, [])
+        self.assertEqual(writer.failures, 1)
+        # newer data wins
+        writer.write(data=b'{"v": 2}', path=path)
+        self.assertFalse(writer.flush())
+        self.assertEqual(writer.failures, 2)
+        backend.full = False
+        self.assertTrue(writer.flush())
+        print(writer)
+        with open(path, 'rb') as file:
+            self.assertEqual(file.read(), b'{"v": 2}')
+        self.assertEqual(called, ['written'])
+        self.assertEqual((writer.errors, writer.failures, writer.pending), (2, 0, 0))
+
+    def check_crash(self, window: float):
+        path = os.path.join(self.directory, 'meta.js')
+        atomic_write(data=b'{"index": 0}', path=path)
+        last = 0
+        for _ in range(10):
+            process = subprocess.Popen([sys.executable, '-c', WRITING_LOOP, path, str(window)])
+            time.sleep(random.uniform(0.2, 0.5))
+            process.send_signal(signal.SIGKILL)
+            process.wait()
+            # the file must be the old one or a new one, never partially written
+            with open(path, 'r') as file:
+                info = json.load(file)
+            self.assertGreaterEqual(info['index'], 0)
+            last = info['index']
+        print('last index: %d' % last)
+        # temporary files left by the killed processes are ignored by readers
+        names = [name for name in os.listdir(self.directory) if not name.endswith('.tmp')]
+        self.assertEqual(names, ['meta.js'])
+
+    def test_crash_atomic(self):
+        print('\n---------------- %s' % self)
+        self.check_crash(window=0)
+
+    def test_crash_write_behind(self):
+        print('\n---------------- %s' % self)
+        self.check_crash(window=0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
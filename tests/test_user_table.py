@@ -0,0 +1,92 @@
+#! /usr/bin/env python3
+# -*- coding: utf-8 -*-
+# ==============================================================================
+# MIT License
+#
+# Copyright (c) 2019 Albert Moky
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+# ==============================================================================
+
+"""
+    User Table Test
+    ~~~~~~~~~~~~~~~
+
+    Block-list and mute-list checks
+"""
+
+import shutil
+import tempfile
+import unittest
+
+import sys
+import os
+
+curPath = os.path.abspath(os.path.dirname(__file__))
+rootPath = os.path.split(curPath)[0]
+sys.path.append(rootPath)
+
+from dimp import ID, Command
+
+from libs.common.database.storage import Storage
+from libs.common.database.user_table import UserTable
+
+
+MOKY = ID('moky@4DnqXWdTV8wuZgfqSCX9GjE2kNq7HJrUgQ')
+HULK = 'hulk@4YeVEN3aUnvC1DNUufCq1bs9zoBSJTzVEj'
+GROUP = 'Group-1280719982@7oMeWadRw4qat2sL4mTdcQSDAqZSo7LH5G'
+STATION = 'gsp-s001@x5Zh9ixt8ECr59XLye1y5WWfaX4fcoaaSC'
+
+
+class UserTableTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.root = Storage.root
+        Storage.root = tempfile.mkdtemp()
+        self.table = UserTable()
+
+    def tearDown(self):
+        shutil.rmtree(Storage.root)
+        Storage.root = self.root
+
+    def test_blocked(self):
+        print('\n---------------- %s' % self)
+        # saved with terminal, and an invalid ID
+        cmd = Command({'command': 'block', 'list': [HULK + '/iPhone', GROUP, 'bad@2PfTBeBMT2cfPNRwqwrRLzg7mQ1MGGwjbe3/x']})
+        self.assertTrue(self.table.save_block_command(cmd=cmd, sender=MOKY))
+        for table in [self.table, UserTable()]:
+            self.assertTrue(table.is_blocked(receiver=MOKY, sender=ID(HULK)))
+            # sender with terminal
+            self.assertTrue(table.is_blocked(receiver=MOKY, sender=ID(HULK + '/Android')))
+            self.assertTrue(table.is_blocked(receiver=MOKY, sender=ID(STATION), group=ID(GROUP)))
+            self.assertFalse(table.is_blocked(receiver=MOKY, sender=ID(STATION + '/home')))
+            self.assertFalse(table.is_blocked(receiver=ID(STATION), sender=ID(HULK)))
+
+    def test_muted(self):
+        print('\n---------------- %s' % self)
+        cmd = Command({'command': 'mute', 'list': [HULK, GROUP + '/x']})
+        self.assertTrue(self.table.save_mute_command(cmd=cmd, sender=MOKY))
+        for table in [self.table, UserTable()]:
+            self.assertTrue(table.is_muted(receiver=MOKY, sender=ID(HULK + '/iPad')))
+            self.assertTrue(table.is_muted(receiver=MOKY, sender=ID(STATION), group=ID(GROUP)))
+            self.assertFalse(table.is_muted(receiver=MOKY, sender=ID(HULK), group=ID(STATION)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -46,6 +46,7 @@ from libs.server import ServerMessenger
 #  Configurations
 #
 from etc.cfg_db import base_dir, ans_reserved_records
+from etc.cfg_db import db_backend, db_write_window, db_cache_limits, db_changes_interval
 
 """
     Key Store
@@ -63,6 +64,10 @@ g_keystore = KeyStore()
 """
 g_database = Database()
 g_database.base_dir = base_dir
+g_database.backend = db_backend
+g_database.write_window = db_write_window
+g_database.cache_limits = db_cache_limits
+g_database.watch_changes(interval=db_changes_interval)
 Log.info("database directory: %s" % g_database.base_dir)
 
 """